@@ -0,0 +1,244 @@
+"""Benchmark the fetch, render, format, extraction and query paths against synthetic workspaces.
+
+Runs entirely on the mock backends (see notion_mock), so no network access or API keys are needed.
+
+    python benchmarks/bench_pipeline.py --sizes small medium
+    python benchmarks/bench_pipeline.py --sizes medium --compare benchmarks/results/bench_<commit>.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Select the mock backends before any module asks for a client
+os.environ['NOTION_BACKEND'] = 'mock'
+os.environ['GEMINI_BACKEND'] = 'mock'
+# Measure our own overhead, not the production quota the scheduler enforces
+os.environ.setdefault('GEMINI_REQUESTS_PER_MINUTE', '1000000')
+
+import notion_pages
+import notion_databases
+import notion_gemini_chat
+from notion_config import get_gemini_model, get_notion_client, collect_paginated
+from notion_dedup import combine_documents, dedupe_context
+from notion_mock import install_mock_backends
+from notion_tokens import estimate_tokens
+
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+QUERIES = [
+    "What are the open tasks for the redis project?",
+    "Which sprint items mention latency?",
+    "List the decisions about the release budget",
+    "What did the team note about vector search?",
+]
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values using linear interpolation"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def run_stage(name, items, func, units=None, memory_sample=20):
+    """Time func over items and measure peak memory on a sample of them"""
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        item_start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - item_start)
+    total = time.perf_counter() - start
+
+    # Memory is measured in a separate pass because tracemalloc slows everything down
+    tracemalloc.start()
+    for item in items[:memory_sample]:
+        func(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    unit_count = units if units is not None else len(items)
+    result = {
+        'operations': len(items),
+        'units': unit_count,
+        'total_s': round(total, 4),
+        'throughput_per_s': round(unit_count / total, 2) if total else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3) if latencies else 0.0,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+    print(f"  {name:22s} {result['operations']:6d} ops  {result['throughput_per_s'] or 0:10.1f} units/s  "
+          f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+          f"peak {result['peak_memory_kb']:9.1f} KB")
+    return result
+
+def bench_size(size, max_pages, max_databases, notion_latency, gemini_latency, template_ratio=0.0):
+    """Run every stage against one synthetic workspace size"""
+    install_mock_backends(size, notion_latency=notion_latency, gemini_latency=gemini_latency, template_ratio=template_ratio)
+    client = get_notion_client()
+    model = get_gemini_model()
+    print(f"\n Workspace: {size}")
+    print("=" * 60)
+
+    stages = {}
+    stages['enumerate'] = run_stage(
+        'enumerate', list(range(3)),
+        lambda _: (notion_pages.get_accessible_pages(), notion_databases.get_accessible_databases()),
+        memory_sample=1
+    )
+
+    pages = notion_pages.get_accessible_pages()[:max_pages]
+    databases = notion_databases.get_accessible_databases()[:max_databases]
+
+    page_contents = []
+    stages['fetch_pages'] = run_stage(
+        'fetch_pages', pages,
+        lambda page: page_contents.append(notion_pages.get_page_content(page['id'])),
+        memory_sample=5
+    )
+    page_documents = [
+        {'id': page['id'], 'title': data['title'], 'content': data['content'], 'kind': 'page'}
+        for page, data in zip(pages, page_contents[:len(pages)]) if data
+    ]
+    page_contents = [document['content'] for document in page_documents]
+
+    block_lists = [collect_paginated(client.blocks.children.list, block_id=page['id']) for page in pages]
+    stages['render_blocks'] = run_stage(
+        'render_blocks', block_lists,
+        lambda blocks: [notion_pages.extract_text_from_block(block) for block in blocks],
+        units=sum(len(blocks) for blocks in block_lists)
+    )
+
+    database_contents = []
+    stages['fetch_databases'] = run_stage(
+        'fetch_databases', databases,
+        lambda db: database_contents.append(notion_databases.get_database_content(db['id'])),
+        memory_sample=2
+    )
+    database_contents = [content for content in database_contents[:len(databases)] if content]
+    row_count = sum(len(content['entries']) for content in database_contents)
+
+    stages['format_databases'] = run_stage(
+        'format_databases', database_contents, notion_databases.format_database_content, units=row_count
+    )
+    stages['format_compact'] = run_stage(
+        'format_compact', database_contents, notion_databases.format_database_compact, units=row_count
+    )
+    stages['extract_todos'] = run_stage('extract_todos', page_contents, notion_gemini_chat.extract_todos)
+    stages['extract_definitions'] = run_stage(
+        'extract_definitions', page_contents, notion_gemini_chat.extract_definitions
+    )
+
+    all_content = ''.join(f"\n{'='*80}\nPAGE\n{'='*80}\n{content}\n\n" for content in page_contents)
+    all_content += ''.join(
+        f"\n{'='*80}\n{notion_databases.format_database_content(content)}\n\n" for content in database_contents
+    )
+    # Repeated template blocks are sent once per prompt
+    combined, _ = combine_documents(page_documents)
+    stages['dedupe'] = run_stage('dedupe', [combined] * 5, dedupe_context, memory_sample=1)
+    deduped, chunk_index = dedupe_context(combined)
+    stages['dedupe']['tokens_before'] = estimate_tokens(combined)
+    stages['dedupe']['tokens_after'] = estimate_tokens(deduped)
+    print(f"  {'':22s} {stages['dedupe']['tokens_before']:,} → {stages['dedupe']['tokens_after']:,} tokens "
+          f"({chunk_index.stats()['duplicate_chunks']:,} repeated chunks)")
+
+    stages['query'] = run_stage(
+        'query', QUERIES * 3,
+        lambda query: notion_gemini_chat.query_gemini(model, all_content, query),
+        memory_sample=2
+    )
+
+    return {
+        'workspace': {
+            'size': size,
+            'pages_benchmarked': len(pages),
+            'databases_benchmarked': len(databases),
+            'database_rows': row_count,
+            'template_ratio': template_ratio,
+            'notion_requests': client.transport.request_count
+        },
+        'stages': stages
+    }
+
+def git_commit():
+    """Return the current commit hash, or 'unknown' outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=REPO_DIR, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results, baseline_file):
+    """Print the change of each stage against a previous results file"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    print(f"\n Comparison with {baseline.get('commit', 'baseline')}")
+    print("=" * 60)
+    for size, size_results in results['sizes'].items():
+        old_size = baseline.get('sizes', {}).get(size)
+        if not old_size:
+            continue
+        print(f" {size}")
+        for stage, stats in size_results['stages'].items():
+            old = old_size['stages'].get(stage)
+            if not old or not old.get('p50_ms') or not old.get('throughput_per_s'):
+                continue
+            p50_change = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+            throughput_change = ((stats['throughput_per_s'] or 0) - old['throughput_per_s']) / old['throughput_per_s'] * 100
+            print(f"  {stage:22s} p50 {p50_change:+7.1f}%   throughput {throughput_change:+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark for the Notion AI agent")
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=['small', 'medium', 'huge'])
+    parser.add_argument('--max-pages', type=int, default=200, help="Pages fetched per workspace")
+    parser.add_argument('--max-databases', type=int, default=10, help="Databases fetched per workspace")
+    parser.add_argument('--notion-latency-ms', type=float, default=0.0, help="Simulated Notion API latency")
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0, help="Simulated Gemini latency")
+    parser.add_argument('--template-ratio', type=float, default=0.3,
+                        help="Share of pages created from a shared template (repeated content for dedupe)")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/bench_<commit>.json)")
+    parser.add_argument('--compare', help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': vars(args),
+        'sizes': {}
+    }
+    for size in args.sizes:
+        results['sizes'][size] = bench_size(
+            size, args.max_pages, args.max_databases,
+            args.notion_latency_ms / 1000, args.gemini_latency_ms / 1000, args.template_ratio
+        )
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n Results saved to: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
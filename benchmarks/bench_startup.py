@@ -0,0 +1,126 @@
+"""Measure cold import time of each module and the per-rerun overhead of the Streamlit script.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py [--reruns 20]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'notion_config',
+    'notion_tokens',
+    'notion_pages',
+    'notion_databases',
+    'notion_gemini_chat',
+    'notion_gemini_database',
+]
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in ('google.generativeai', 'notion_client', 'streamlit') if name in sys.modules]
+print(elapsed, ','.join(heavy))
+"""
+
+RERUN_SNIPPET = """
+import os, sys, time, statistics
+# The app itself is named streamlit.py: import the real package before the repo is on the path,
+# otherwise "import streamlit" inside the script would import the script
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or '.') != {repo!r}]
+import streamlit
+sys.path.insert(0, {repo!r})
+source = open({script!r}, encoding='utf-8').read()
+code = compile(source, {script!r}, 'exec')
+timings = []
+for _ in range({reruns}):
+    start = time.perf_counter()
+    # Streamlit executes the script body on every interaction; skip main() as it needs a browser session
+    exec(code, {{'__name__': '__rerun__'}})
+    timings.append(time.perf_counter() - start)
+print(timings[0], statistics.median(timings[1:] or timings))
+"""
+
+def run_snippet(snippet):
+    """Run a snippet in a fresh interpreter and return its stdout, or None on failure"""
+    result = subprocess.run(
+        [sys.executable, '-c', snippet],
+        capture_output=True, text=True, cwd=REPO_DIR
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1] if result.stderr else 'failed'
+    return result.stdout.strip(), None
+
+def measure_imports():
+    """Measure cold import time of every module in a fresh interpreter"""
+    results = {}
+    for module in MODULES:
+        output, error = run_snippet(IMPORT_SNIPPET.format(repo=REPO_DIR, module=module))
+        if error:
+            results[module] = {'error': error}
+            continue
+        elapsed, heavy = output.split(' ') if ' ' in output else (output, '')
+        results[module] = {
+            'import_ms': round(float(elapsed) * 1000, 2),
+            'heavy_sdks_loaded': [name for name in heavy.split(',') if name]
+        }
+    return results
+
+def measure_reruns(reruns):
+    """Measure first-run and steady-state cost of executing the Streamlit script body"""
+    script = os.path.join(REPO_DIR, 'streamlit.py')
+    output, error = run_snippet(RERUN_SNIPPET.format(repo=REPO_DIR, script=script, reruns=reruns))
+    if error:
+        return {'error': error}
+    first, median = output.split(' ')
+    return {
+        'first_run_ms': round(float(first) * 1000, 2),
+        'rerun_median_ms': round(float(median) * 1000, 2),
+        'reruns': reruns
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark for the Notion AI agent")
+    parser.add_argument('--reruns', type=int, default=20, help="Number of simulated Streamlit reruns")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {
+        'imports': measure_imports(),
+        'streamlit_rerun': measure_reruns(args.reruns)
+    }
+
+    print(" Cold import times")
+    print("=" * 60)
+    for module, stats in results['imports'].items():
+        if 'error' in stats:
+            print(f"{module:28s} error: {stats['error']}")
+        else:
+            heavy = ', '.join(stats['heavy_sdks_loaded']) or 'none'
+            print(f"{module:28s} {stats['import_ms']:8.1f} ms   heavy SDKs loaded: {heavy}")
+
+    print("\n Streamlit script overhead")
+    print("=" * 60)
+    rerun = results['streamlit_rerun']
+    if 'error' in rerun:
+        print(f"error: {rerun['error']}")
+    else:
+        print(f"First run: {rerun['first_run_ms']:.1f} ms")
+        print(f"Rerun (median of {rerun['reruns']}): {rerun['rerun_median_ms']:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n Results saved to: {args.output}")
+
+if __name__ == '__main__':
+    main()
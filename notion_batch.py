@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import json
+import time
+import fnmatch
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import notion_pages
+import notion_databases
+from notion_config import get_gemini_model, load_config
+from notion_compress import pop_last_compression
+from notion_dedup import combine_documents, dedupe_context, describe_dedup
+from notion_gemini_chat import query_gemini
+from notion_metrics import query_trace, start_metrics_server, summarize_trace
+from notion_profiling import run_with_profile
+from notion_snapshot import describe_offline_mode
+from notion_summarize import answer_with_map_reduce, is_workspace_query
+from notion_tokens import describe_context_size, track_usage, usage_totals
+from notion_workspaces import list_shard_items, load_shard_documents, workspace_names
+
+load_config()
+
+# Fetches and queries are issued concurrently; the Gemini scheduler still enforces its own limits
+DEFAULT_WORKERS = int(os.getenv('NOTION_BATCH_WORKERS', '8'))
+
+ID_PATTERN = re.compile(r'^[0-9a-fA-F]{32}$')
+
+def log(message):
+    """Print progress to stderr so stdout can carry extracted content or results"""
+    print(message, file=sys.stderr)
+
+def normalize_id(value):
+    """Strip dashes from a Notion id so both id forms compare equal"""
+    return value.replace('-', '').lower()
+
+def list_items(kinds, workspaces=None):
+    """Fetch the accessible pages and/or databases as one list of items tagged with their kind
+
+    With workspaces, items come from those workspaces' snapshots (see notion_workspaces) instead.
+    """
+    if workspaces:
+        return list_shard_items(workspace_names(workspaces), kinds)
+    items = []
+    if 'page' in kinds:
+        items.extend(dict(page, kind='page') for page in notion_pages.get_accessible_pages())
+    if 'database' in kinds:
+        items.extend(dict(db, kind='database') for db in notion_databases.get_accessible_databases())
+    return items
+
+def matches(item, selector):
+    """Check whether an item is picked by an id, a title glob pattern or a title substring"""
+    if ID_PATTERN.match(normalize_id(selector)):
+        return normalize_id(item['id']) == normalize_id(selector)
+    title = item['title'].lower()
+    if any(char in selector for char in '*?['):
+        return fnmatch.fnmatch(title, selector.lower())
+    return selector.lower() in title
+
+def select_items(items, selectors):
+    """Return the items picked by any of the selectors, keeping listing order; 'all' picks everything"""
+    if not selectors or 'all' in selectors:
+        return list(items)
+    return [item for item in items if any(matches(item, selector) for selector in selectors)]
+
+def database_document(item):
+    """Fetch and render one database as a document"""
+    content = notion_databases.get_database_content(item['id'])
+    if not content:
+        return None
+    return {
+        'id': item['id'],
+        'title': item['title'],
+        'content': notion_databases.format_database_content(content),
+        # Keys the summary cache, so row edits must change it
+        'last_edited': notion_databases.database_version(item['id'], item.get('last_edited_time', '')),
+        'kind': 'database'
+    }
+
+def load_documents(items, workers=DEFAULT_WORKERS, render_processes=notion_pages.RENDER_PROCESSES):
+    """Fetch the selected items concurrently, in listing order, skipping ones that fail"""
+    if any(item.get('workspace') for item in items):
+        documents = load_shard_documents(items, workers)
+        log(f" Loaded {len(documents)}/{len(items)} items")
+        return documents
+    pages = [item for item in items if item['kind'] == 'page']
+    databases = [item for item in items if item['kind'] == 'database']
+
+    # Page rendering can move to worker processes; databases are fetched on threads alongside
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        database_documents = executor.map(database_document, databases)
+        page_contents = notion_pages.get_pages_content(
+            [page['id'] for page in pages], fetch_workers=workers, render_processes=render_processes
+        )
+        database_documents = list(database_documents)
+
+    documents = []
+    for page, content_data in zip(pages, page_contents):
+        if content_data:
+            documents.append({
+                'id': page['id'],
+                'title': content_data['title'],
+                'content': content_data['content'],
+                'last_edited': page.get('last_edited_time', ''),
+                'kind': 'page'
+            })
+    documents.extend(document for document in database_documents if document)
+    log(f" Loaded {len(documents)}/{len(items)} items")
+    return documents
+
+def combine_context(documents, dedupe=True):
+    """Join documents into one context string, in the same layout as the interactive 'all' option"""
+    if len(documents) == 1:
+        return documents[0]['content']
+    all_content, chunk_index = combine_documents(documents)
+    if dedupe:
+        log(f" Deduplication: {describe_dedup(chunk_index, all_content)}")
+    return all_content
+
+def read_queries(path):
+    """Read queries from a JSONL file; each line needs a 'query' (or 'body') and may carry an 'id'"""
+    queries = []
+    with (sys.stdin if path == '-' else open(path, encoding='utf-8')) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            query = record.get('query') or record.get('body') or record.get('title')
+            if not query:
+                raise ValueError(f"Line {line_number} of {path} has no 'query' field")
+            query_id = record.get('id') or record.get('request_id') or str(line_number)
+            queries.append({'id': query_id, 'query': query})
+    return queries
+
+def answer_query(model, documents, all_content, query, map_reduce=True):
+    """Answer one query and return the result record with latency, token and stage metrics"""
+    started = time.perf_counter()
+    error = None
+    with query_trace() as trace, track_usage() as usage:
+        try:
+            if map_reduce and len(documents) > 1 and is_workspace_query(query['query']):
+                answer = answer_with_map_reduce(model, documents, query['query'])
+            else:
+                answer = query_gemini(model, all_content, query['query'])
+            if answer.startswith('Error querying Gemini API'):
+                error = answer
+        except Exception as e:
+            answer, error = None, str(e)
+    compression = pop_last_compression()
+    return {
+        'id': query['id'],
+        'query': query['query'],
+        'answer': answer,
+        'error': error,
+        'latency_seconds': round(time.perf_counter() - started, 3),
+        'gemini_requests': usage['requests'],
+        'input_tokens': usage['input_tokens'],
+        'output_tokens': usage['output_tokens'],
+        'context_tokens': compression['original_tokens'] if compression else None,
+        'compressed_context_tokens': compression['compressed_tokens'] if compression else None,
+        'stages_ms': {name: round(seconds * 1000, 1) for name, (seconds, _) in summarize_trace(trace)}
+    }
+
+def open_output(path):
+    """Open the output file, or stdout for '-'"""
+    if path == '-':
+        return sys.stdout
+    return open(path, 'w', encoding='utf-8')
+
+def command_list(args):
+    """Print the id, kind and title of every accessible item, tab separated"""
+    for item in list_items(args.kinds, args.workspaces):
+        workspace = f"{item['workspace']}\t" if args.workspaces else ""
+        print(f"{item['id']}\t{workspace}{item['kind']}\t{item['title']}")
+    return 0
+
+def command_extract(args):
+    """Extract the selected items to a file or stdout"""
+    items = select_items(list_items(args.kinds, args.workspaces), args.select)
+    if not items:
+        log(" No pages or databases matched the selection")
+        return 1
+    documents = load_documents(items, args.workers, args.render_processes)
+    out = open_output(args.output)
+    try:
+        if args.format == 'jsonl':
+            for document in documents:
+                out.write(json.dumps(document, ensure_ascii=False) + "\n")
+        else:
+            content = combine_context(documents, not args.no_dedupe)
+            out.write(dedupe_context(content)[0] if not args.no_dedupe else content)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    log(f" Extracted {len(documents)} items to {'stdout' if args.output == '-' else args.output}")
+    return 0 if documents else 1
+
+def command_query(args):
+    """Answer every query in a JSONL file against the selected items, writing JSONL results"""
+    queries = read_queries(args.queries)
+    if args.no_dedupe:
+        # Read by prepare_context for every prompt
+        os.environ['NOTION_DEDUPE'] = '0'
+    items = select_items(list_items(args.kinds, args.workspaces), args.select)
+    if not items:
+        log(" No pages or databases matched the selection")
+        return 1
+    documents = load_documents(items, args.workers, args.render_processes)
+    all_content = combine_context(documents, not args.no_dedupe)
+    log(f" Context size: {describe_context_size(all_content)}")
+
+    model = get_gemini_model()
+    started = time.perf_counter()
+    failed = 0
+    out = open_output(args.output)
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = executor.map(
+                lambda query: answer_query(model, documents, all_content, query, not args.no_map_reduce),
+                queries
+            )
+            # Results are written in input order as soon as each one (and those before it) is done
+            for i, result in enumerate(results, 1):
+                failed += result['error'] is not None
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                log(f" [{i}/{len(queries)}] {result['id']}: {result['latency_seconds']:.2f}s")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    log(f" Answered {len(queries) - failed}/{len(queries)} queries in {elapsed:.1f}s "
+        f"({len(queries) / elapsed if elapsed else 0:.1f} queries/s)")
+    log(f" Tokens used: {usage_totals['input_tokens']:,} in / {usage_totals['output_tokens']:,} out")
+    return 1 if failed else 0
+
+def parse_args(argv=None):
+    """Parse the batch CLI arguments"""
+    parser = argparse.ArgumentParser(description="Non-interactive Notion extraction and Gemini queries")
+    parser.add_argument('--profile', action='store_true', help="Capture CPU and memory profiles for this run")
+    parser.add_argument('--offline', action='store_true',
+                        help="Serve everything from the local snapshot (same as NOTION_BACKEND=snapshot)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_selection(subparser):
+        subparser.add_argument('--select', action='append', default=[],
+                               help="Item id, title glob or title substring; repeatable; 'all' for everything (default)")
+        subparser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Concurrent fetches and queries")
+        subparser.add_argument('--no-dedupe', action='store_true', help="Keep repeated passages in every document")
+        subparser.add_argument('--render-processes', type=int, default=notion_pages.RENDER_PROCESSES,
+                               help="Render pages in this many worker processes (0 renders in-process)")
+
+    list_parser = subparsers.add_parser('list', help="List accessible pages and databases")
+    list_parser.set_defaults(func=command_list)
+
+    extract_parser = subparsers.add_parser('extract', help="Extract content to a file or stdout")
+    add_selection(extract_parser)
+    extract_parser.add_argument('--output', '-o', default='-', help="Output file, '-' for stdout (default)")
+    extract_parser.add_argument('--format', choices=['text', 'jsonl'], default='text',
+                                help="Combined text, or one JSON document per line")
+    extract_parser.set_defaults(func=command_extract)
+
+    query_parser = subparsers.add_parser('query', help="Answer a JSONL file of queries")
+    add_selection(query_parser)
+    query_parser.add_argument('--queries', '-q', required=True, help="JSONL file with one query per line, '-' for stdin")
+    query_parser.add_argument('--output', '-o', default='-', help="JSONL results file, '-' for stdout (default)")
+    query_parser.add_argument('--no-map-reduce', action='store_true',
+                              help="Answer workspace-wide questions from the combined context too")
+    query_parser.set_defaults(func=command_query)
+
+    for subparser in (list_parser, extract_parser, query_parser):
+        subparser.add_argument('--type', dest='kinds', choices=['page', 'database'], action='append',
+                               help="Only consider pages or databases (default: both)")
+        subparser.add_argument('--workspace', dest='workspaces', action='append', default=[],
+                               help="Read from this workspace's synced snapshot (NOTION_TOKENS name); "
+                                    "repeatable, 'all' merges every workspace")
+    args = parser.parse_args(argv)
+    args.kinds = args.kinds or ['page', 'database']
+    if args.workspaces:
+        try:
+            workspace_names(args.workspaces)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.offline:
+        os.environ['NOTION_BACKEND'] = 'snapshot'
+    start_metrics_server()
+    offline_status = describe_offline_mode()
+    if offline_status:
+        log(f" {offline_status}")
+    if args.profile:
+        return run_with_profile(lambda: args.func(args), f"notion_batch_{args.command}")
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+from notion_config import load_config
+from notion_metrics import increment
+
+load_config()
+
+CONTENT_CACHE_MB = int(os.getenv('NOTION_CONTENT_CACHE_MB', '256'))
+
+def estimate_size(value):
+    """Roughly estimate the memory held by a cached value in bytes"""
+    if isinstance(value, str):
+        return len(value) * 2 + 50
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items()) + 100
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value) + 50
+    return 50
+
+class ContentCache:
+    """Thread-safe LRU cache of fetched content, bounded by an approximate memory size"""
+
+    def __init__(self, max_bytes=CONTENT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                increment('content_cache_misses_total')
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            increment('content_cache_hits_total')
+            return self.entries[key][0]
+
+    def put(self, key, value):
+        """Store value under key, evicting least recently used entries over the memory cap"""
+        size = estimate_size(value)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                increment('content_cache_evictions_total')
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader on a miss; None results are not cached"""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def invalidate(self, item_id):
+        """Drop every cached version of the page or database with this id"""
+        with self.lock:
+            for key in [key for key in self.entries if item_id in key]:
+                self.size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        """Drop everything"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return hit/miss counts and memory use"""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size_mb': round(self.size / (1024 * 1024), 1),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'hits': self.hits,
+                'misses': self.misses
+            }
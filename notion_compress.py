@@ -0,0 +1,228 @@
+import os
+import re
+import math
+import logging
+import threading
+from notion_config import load_config
+from notion_dedup import dedupe_context, dedupe_enabled
+from notion_metrics import TOKEN_BUCKETS, increment, observe
+from notion_tokens import (
+    QUERY_STOPWORDS, SECTION_SEPARATOR, estimate_tokens, fit_content_to_budget, join_sections, split_sections
+)
+
+logger = logging.getLogger(__name__)
+
+load_config()
+
+# Context above this many tokens is reduced to the spans most relevant to the query; 0 only strips boilerplate
+TARGET_CONTEXT_TOKENS = int(os.getenv('GEMINI_CONTEXT_TARGET_TOKENS', '16000'))
+# Lines longer than this are scored sentence by sentence
+MAX_UNIT_TOKENS = 60
+
+DIVIDER_PATTERN = re.compile(r'^\s*([-=*_])\1{2,}\s*$')
+EMPTY_FIELD_PATTERN = re.compile(r'^[^:\n]{1,60}:\s*(N/A|None|)\s*$')
+EMPTY_TODO_PATTERN = re.compile(r'^\s*[☐☑]\s*$')
+HEADING_PATTERN = re.compile(r'^\s*(#{1,3} |PAGE: |Database: )')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+WORD_PATTERN = re.compile(r'\w{3,}')
+GAP_MARKER = "…"
+
+compression_state = threading.local()
+
+def stem(word):
+    """Crude suffix stripping so 'tasks'/'task' and 'meeting'/'meetings' match"""
+    for suffix in ('ing', 'es', 'ed', 's'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def terms(text):
+    """Return the set of stemmed content words in text"""
+    return {stem(word) for word in WORD_PATTERN.findall(text.lower()) if word not in QUERY_STOPWORDS}
+
+def strip_boilerplate(section, is_database=False):
+    """Drop divider lines, empty database cells and empty to-dos; returns the text and how many lines went
+
+    Empty cells are only looked for among the entries of a database, so label lines in pages
+    such as "Risks:" stay.
+    """
+    kept = []
+    removed = 0
+    in_entries = False
+    for line in section.split('\n'):
+        if is_database and line.strip() == 'Entries:':
+            in_entries = True
+        elif in_entries and EMPTY_FIELD_PATTERN.match(line):
+            removed += 1
+            continue
+        if DIVIDER_PATTERN.match(line) or EMPTY_TODO_PATTERN.match(line):
+            removed += 1
+            continue
+        if not line.strip() and kept and not kept[-1].strip():
+            continue
+        kept.append(line)
+    return '\n'.join(kept).strip('\n'), removed
+
+def split_units(section, is_database=False):
+    """Split a section into scoreable units: (text, position of the heading above it or None)
+
+    Database entries stay whole so a row is never cut in half; page content is split per line,
+    and long lines per sentence.
+    """
+    units = []
+    heading = None
+    blocks = section.split('\n\n') if is_database else section.split('\n')
+    for block in blocks:
+        if not block.strip():
+            continue
+        if HEADING_PATTERN.match(block) and '\n' not in block.strip():
+            heading = len(units)
+            units.append((block, None))
+        elif not is_database and estimate_tokens(block) > MAX_UNIT_TOKENS:
+            units.extend((sentence, heading) for sentence in SENTENCE_PATTERN.split(block) if sentence)
+        else:
+            units.append((block, heading))
+    return units
+
+def compress_context(content, query, max_tokens=TARGET_CONTEXT_TOKENS):
+    """Keep the spans of content most relevant to query under max_tokens; returns the text and statistics
+
+    Units are scored by query-term overlap weighted by rarity, a bonus when their heading or section
+    title matches the query, and a small bonus for appearing early in their section. The best units are
+    kept with their section titles and headings, in original order, with … marking skipped spans.
+    """
+    original_tokens = estimate_tokens(content)
+    sections = []
+    database_sections = set()
+    removed_lines = 0
+    for header, body in split_sections(content):
+        is_database = (header or body.lstrip()).startswith('Database: ')
+        stripped, removed = strip_boilerplate(body, is_database)
+        removed_lines += removed
+        if not stripped.strip():
+            continue
+        if is_database:
+            database_sections.add(len(sections))
+        sections.append((header, stripped))
+    stripped_content = join_sections(sections)
+    stats = {
+        'original_tokens': original_tokens,
+        'boilerplate_lines': removed_lines,
+        'units_total': 0,
+        'units_kept': 0
+    }
+
+    if not max_tokens or estimate_tokens(stripped_content) <= max_tokens:
+        return finish(stripped_content, stats)
+
+    units = []
+    for section_index, (header, section) in enumerate(sections):
+        title = header or section.split('\n', 1)[0]
+        section_units = split_units(section, section_index in database_sections)
+        for position, (text, heading) in enumerate(section_units):
+            units.append({
+                'section': section_index,
+                'position': position,
+                'text': text,
+                # One more for the line break or a gap marker before it
+                'tokens': estimate_tokens(text) + 2,
+                'heading': heading,
+                'count': len(section_units),
+                'terms': terms(text),
+                'context_terms': terms(title) | (terms(section_units[heading][0]) if heading is not None else set())
+            })
+    stats['units_total'] = len(units)
+
+    query_terms = terms(query)
+    document_frequency = {term: sum(term in unit['terms'] for unit in units) for term in query_terms}
+    weights = {term: math.log(1 + len(units) / (1 + frequency)) for term, frequency in document_frequency.items()}
+    total_weight = sum(weights.values()) or 1.0
+
+    def score(unit):
+        overlap = sum(weights[term] for term in query_terms & unit['terms']) / total_weight
+        context = sum(weights[term] for term in query_terms & unit['context_terms']) / total_weight
+        position = 1 - unit['position'] / max(unit['count'], 1)
+        return overlap + 0.5 * context + 0.1 * position
+
+    by_key = {(unit['section'], unit['position']): unit for unit in units}
+    kept = set()
+    kept_sections = set()
+    section_overhead = estimate_tokens(SECTION_SEPARATOR) + 1
+    used = 0
+    for unit in sorted(units, key=lambda unit: (-score(unit), unit['section'], unit['position'])):
+        # A kept line brings its section title and heading along so it still reads in context
+        header = sections[unit['section']][0]
+        title_position = None if header else 0
+        needed = [(unit['section'], title_position), (unit['section'], unit['heading']), (unit['section'], unit['position'])]
+        needed = [key for key in dict.fromkeys(needed) if key[1] is not None and key not in kept]
+        cost = sum(by_key[key]['tokens'] for key in needed)
+        if unit['section'] not in kept_sections:
+            # Separators, the page header and the trailing gap marker
+            cost += section_overhead + (estimate_tokens(header) + section_overhead if header else 0)
+        if used + cost > max_tokens:
+            continue
+        kept.update(needed)
+        kept_sections.add(unit['section'])
+        used += cost
+
+    kept_by_section = {}
+    for key in sorted(kept):
+        kept_by_section.setdefault(key[0], []).append(by_key[key])
+    parts = []
+    for section_index, (header, section) in enumerate(sections):
+        section_units = kept_by_section.get(section_index)
+        if not section_units:
+            continue
+        lines = []
+        previous = -1
+        for unit in section_units:
+            if unit['position'] != previous + 1:
+                lines.append(GAP_MARKER)
+            lines.append(unit['text'])
+            previous = unit['position']
+        if previous != section_units[0]['count'] - 1:
+            lines.append(GAP_MARKER)
+        parts.append((header, ('\n\n' if section_index in database_sections else '\n').join(lines)))
+    stats['units_kept'] = len(kept)
+
+    compressed = join_sections(parts)
+    omitted = len(sections) - len(parts)
+    if omitted:
+        compressed += f"\n\n[{omitted} section(s) with nothing relevant to the query omitted]"
+    return finish(compressed, stats)
+
+def finish(compressed, stats):
+    """Fill in the size statistics, record metrics and remember them for pop_last_compression"""
+    stats['compressed_tokens'] = estimate_tokens(compressed)
+    stats['ratio'] = stats['original_tokens'] / stats['compressed_tokens'] if stats['compressed_tokens'] else 1.0
+    increment('context_tokens_before_compression_total', stats['original_tokens'])
+    increment('context_tokens_after_compression_total', stats['compressed_tokens'])
+    observe('context_compressed_tokens', stats['compressed_tokens'], buckets=TOKEN_BUCKETS)
+    logger.info("Context compressed from %d to %d tokens (%.1fx)",
+                stats['original_tokens'], stats['compressed_tokens'], stats['ratio'])
+    compression_state.last = stats
+    return compressed, stats
+
+def prepare_context(content, query, max_tokens):
+    """Compress content for a query, make sure it fits the prompt budget, then send repeated passages once"""
+    # With no target only boilerplate is stripped; fitting to the prompt budget still applies below
+    compressed, stats = compress_context(content, query, TARGET_CONTEXT_TOKENS and min(TARGET_CONTEXT_TOKENS, max_tokens))
+    fitted = fit_content_to_budget(compressed, query, max_tokens)
+    if not dedupe_enabled():
+        return fitted
+    # Last, so every reference points at a copy that survived trimming
+    deduped, index = dedupe_context(fitted)
+    stats['deduplicated_tokens'] = index.saved_tokens
+    return deduped
+
+def pop_last_compression():
+    """Return and clear the statistics of the last compression on this thread, or None"""
+    stats = getattr(compression_state, 'last', None)
+    compression_state.last = None
+    return stats
+
+def describe_compression(stats):
+    """Return a short summary of a compression run"""
+    deduplicated = f", {stats['deduplicated_tokens']:,} repeated tokens sent once" if stats.get('deduplicated_tokens') else ""
+    return (f"{stats['original_tokens']:,} → {stats['compressed_tokens']:,} tokens "
+            f"({stats['ratio']:.1f}x, {stats['boilerplate_lines']:,} boilerplate lines stripped{deduplicated})")
@@ -0,0 +1,124 @@
+import os
+import threading
+
+GEMINI_MODEL = 'gemini-2.0-flash'
+
+# Notion API pages are capped at 100 results
+MAX_PAGE_SIZE = 100
+
+config_loaded = False
+clients_lock = threading.Lock()
+notion_clients = {}
+gemini_models = {}
+
+def load_config():
+    """Load environment variables from .env, once per process"""
+    global config_loaded
+    if config_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+    config_loaded = True
+
+def use_mock_backend(name):
+    """Check whether NOTION_BACKEND or GEMINI_BACKEND selects the offline mock"""
+    load_config()
+    return os.getenv(f'{name}_BACKEND', 'live').lower() == 'mock'
+
+def notion_backend():
+    """Return where Notion reads come from: 'live' (the API), 'mock' or 'snapshot' (the local snapshot)"""
+    load_config()
+    return os.getenv('NOTION_BACKEND', 'live').lower()
+
+def use_snapshot_backend():
+    """Check whether NOTION_BACKEND=snapshot serves Notion reads offline from the last synced snapshot"""
+    return notion_backend() == 'snapshot'
+
+def get_workspace_tokens():
+    """Return {workspace name: integration token} from NOTION_TOKENS, falling back to NOTION_TOKEN
+
+    NOTION_TOKENS is a comma-separated list of name=token pairs, one per workspace; a bare token
+    is named after its position (workspace-1, workspace-2, ...).
+    """
+    load_config()
+    tokens = {}
+    for i, entry in enumerate(filter(None, (part.strip() for part in os.getenv('NOTION_TOKENS', '').split(','))), 1):
+        name, _, token = entry.rpartition('=')
+        tokens[name.strip() or f"workspace-{i}"] = token.strip()
+    if not tokens and os.getenv('NOTION_TOKEN'):
+        tokens['default'] = os.getenv('NOTION_TOKEN')
+    return tokens
+
+def wrap_notion_client(client):
+    """Instrument a Notion client and retry its rate limited (429) calls with backoff"""
+    from notion_crawler import RateLimitedClient
+    from notion_metrics import InstrumentedClient
+    return RateLimitedClient(InstrumentedClient(client), throttle=False)
+
+def get_notion_client(token=None, backend=None):
+    """Return a shared Notion client, importing the SDK on first use; backend overrides NOTION_BACKEND
+
+    Each token gets its own client, and so its own connection pool.
+    """
+    load_config()
+    backend = backend or notion_backend()
+    if backend == 'mock':
+        # A token selects a separate synthetic workspace, so several workspaces can be simulated
+        key = ('mock', token) if token else 'mock'
+        with clients_lock:
+            if key not in notion_clients:
+                from notion_mock import create_mock_notion_client
+                notion_clients[key] = wrap_notion_client(create_mock_notion_client(token))
+            return notion_clients[key]
+
+    if backend == 'snapshot':
+        with clients_lock:
+            if 'snapshot' not in notion_clients:
+                from notion_metrics import InstrumentedClient
+                from notion_snapshot import create_snapshot_client
+                notion_clients['snapshot'] = InstrumentedClient(create_snapshot_client(), 'snapshot')
+            return notion_clients['snapshot']
+
+    token = token or os.getenv('NOTION_TOKEN')
+    if not token:
+        raise ValueError("NOTION_TOKEN environment variable is not set")
+
+    with clients_lock:
+        if token not in notion_clients:
+            from notion_client import Client
+            notion_clients[token] = wrap_notion_client(Client(auth=token))
+        return notion_clients[token]
+
+def get_gemini_model(api_key=None, model_name=GEMINI_MODEL):
+    """Return a shared Gemini model, importing and configuring the SDK on first use"""
+    load_config()
+    if use_mock_backend('GEMINI'):
+        with clients_lock:
+            if ('mock', model_name) not in gemini_models:
+                from notion_mock import create_mock_gemini_model
+                gemini_models[('mock', model_name)] = create_mock_gemini_model(model_name)
+            return gemini_models[('mock', model_name)]
+
+    api_key = api_key or os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is not set")
+
+    with clients_lock:
+        if (api_key, model_name) not in gemini_models:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            gemini_models[(api_key, model_name)] = genai.GenerativeModel(model_name)
+        return gemini_models[(api_key, model_name)]
+
+def collect_paginated(method, **kwargs):
+    """Call a paginated Notion endpoint until has_more is false and return all results"""
+    results = []
+    cursor = None
+    while True:
+        if cursor:
+            kwargs['start_cursor'] = cursor
+        response = method(page_size=MAX_PAGE_SIZE, **kwargs)
+        results.extend(response.get('results', []))
+        cursor = response.get('next_cursor')
+        if not response.get('has_more') or not cursor:
+            return results
@@ -0,0 +1,135 @@
+import hashlib
+from notion_compress import prepare_context
+from notion_scheduler import BACKGROUND, generate_content
+from notion_tokens import (
+    MAX_PROMPT_TOKENS, PROMPT_OVERHEAD_TOKENS, count_tokens, estimate_tokens,
+    log_usage, section_priority, truncate_to_tokens, SECTION_SEPARATOR
+)
+
+# Turns kept word for word; older turns are folded into the rolling summary
+RECENT_TURNS = 4
+# Compact once this many turns are pending, so summarization runs every few turns instead of every turn
+COMPACT_AFTER_TURNS = 6
+# Token budget for the summary plus recent turns, independent of how long the session is
+HISTORY_BUDGET_TOKENS = 2000
+
+PROMPT = """You are a helpful assistant with access to the following Notion content:
+{content}
+{history}
+Answer the following query based on the content{history_hint}:
+{query}
+
+If the query asks for specific information (e.g., to-do lists, definitions, or database entries), extract and format it clearly. If the information isn't in the content, say so. Be concise and clear."""
+
+SUMMARY_PROMPT = """Update the running summary of a conversation about the user's Notion content.
+Keep the questions asked, the key facts from the answers and any open follow-ups. Use at most 8 short bullet points.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}"""
+
+def format_turns(turns):
+    """Render conversation turns as plain text"""
+    return '\n'.join(f"User: {turn['query']}\nAssistant: {turn['response']}" for turn in turns)
+
+class ConversationMemory:
+    """Keeps recent turns verbatim and older turns as a rolling summary under a fixed token budget"""
+
+    def __init__(self, model=None, recent_turns=RECENT_TURNS, history_budget=HISTORY_BUDGET_TOKENS):
+        self.model = model
+        self.recent_turns = recent_turns
+        self.history_budget = history_budget
+        self.summary = ""
+        self.turns = []
+        self.last_context = None
+        self.last_content_key = None
+
+    def reset(self):
+        """Forget the whole conversation"""
+        self.summary = ""
+        self.turns = []
+        self.last_context = None
+        self.last_content_key = None
+
+    def load_turns(self, turns):
+        """Continue from earlier turns, e.g. a saved chat history after a reload; only the most recent are kept"""
+        self.turns = list(turns)[-self.recent_turns:]
+
+    def add_turn(self, query, response):
+        """Record a finished turn and compact older turns when needed"""
+        self.turns.append({'query': query, 'response': response})
+        if len(self.turns) >= COMPACT_AFTER_TURNS:
+            self.compact()
+
+    def compact(self):
+        """Fold all but the most recent turns into the rolling summary"""
+        older = self.turns[:-self.recent_turns]
+        if not older:
+            return
+        self.turns = self.turns[-self.recent_turns:]
+
+        if self.model is None:
+            # Without a model keep a truncated transcript as the summary
+            self.summary = truncate_to_tokens(
+                (self.summary + '\n' + format_turns(older)).strip(),
+                self.history_budget // 2
+            )
+            return
+
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "(empty)", turns=format_turns(older))
+        try:
+            prompt_tokens = count_tokens(prompt)
+            response = generate_content(self.model, prompt, priority=BACKGROUND)
+            log_usage(prompt_tokens, response)
+            self.summary = response.text.strip()
+        except Exception:
+            self.summary = truncate_to_tokens(
+                (self.summary + '\n' + format_turns(older)).strip(),
+                self.history_budget // 2
+            )
+
+    def history_text(self):
+        """Return the summary and recent turns trimmed to the history budget"""
+        summary = truncate_to_tokens(self.summary, self.history_budget // 2) if self.summary else ""
+        budget = self.history_budget - estimate_tokens(summary)
+
+        # Drop the oldest recent turns first if they don't fit
+        turns = list(self.turns)
+        while turns and estimate_tokens(format_turns(turns)) > budget:
+            turns.pop(0)
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+        if turns:
+            parts.append(f"Recent conversation:\n{format_turns(turns)}")
+        return '\n\n'.join(parts)
+
+    def select_context(self, content, query):
+        """Fit content to the budget, reusing the previous selection for follow-up questions"""
+        content_key = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        budget = MAX_PROMPT_TOKENS - self.history_budget - estimate_tokens(query) - PROMPT_OVERHEAD_TOKENS
+
+        # A follow-up like "and the second one?" shares no words with any section,
+        # so the context retrieved for the previous question is the best guess
+        is_follow_up = (
+            self.last_context is not None
+            and content_key == self.last_content_key
+            and not any(section_priority(section, query) for section in content.split(SECTION_SEPARATOR))
+        )
+        if not is_follow_up:
+            self.last_context = prepare_context(content, query, budget)
+            self.last_content_key = content_key
+        return self.last_context
+
+    def build_prompt(self, content, query):
+        """Build a prompt with the Notion context, conversation history and the new query"""
+        history = self.history_text()
+        return PROMPT.format(
+            content=self.select_context(content, query),
+            history=f"\n{history}\n" if history else "",
+            history_hint=" and the conversation so far" if history else "",
+            query=query
+        )
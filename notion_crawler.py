@@ -0,0 +1,160 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime
+from notion_config import load_config
+from notion_metrics import increment, span
+from notion_scheduler import RateLimiter, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+load_config()
+
+# Notion allows an average of three requests per second per integration; 0 turns the limit off
+NOTION_REQUESTS_PER_SECOND = float(os.getenv('NOTION_REQUESTS_PER_SECOND', '3'))
+NOTION_MAX_RETRIES = 5
+CRAWL_WORKERS = int(os.getenv('NOTION_FETCH_WORKERS', '8'))
+# How many levels of child pages/databases below the search results are followed
+CRAWL_MAX_DEPTH = int(os.getenv('NOTION_CRAWL_MAX_DEPTH', '10'))
+# Stop scheduling new items after this many; 0 means no limit
+CRAWL_MAX_ITEMS = int(os.getenv('NOTION_CRAWL_MAX_ITEMS', '0'))
+
+notion_limiter = RateLimiter(NOTION_REQUESTS_PER_SECOND * 60) if NOTION_REQUESTS_PER_SECOND else None
+
+class RateLimitedClient:
+    """Wraps a Notion client so every call goes through the shared rate limit and retries 429s
+
+    With throttle=False calls are not limited up front, only retried with backoff when rate limited;
+    get_notion_client wraps every client this way so ordinary fetches don't lose pages to a 429.
+    """
+
+    def __init__(self, target, limiter=None, key='notion', throttle=True):
+        self.target = target
+        self.limiter = (limiter or notion_limiter) if throttle else None
+        self.key = key
+
+    def __getattr__(self, name):
+        attribute = getattr(self.target, name)
+        if attribute is None or isinstance(attribute, (str, int, float, bool, list, dict, tuple)):
+            return attribute
+        if not callable(attribute):
+            # Endpoint groups such as client.blocks.children
+            return RateLimitedClient(attribute, self.limiter, self.key, throttle=self.limiter is not None)
+
+        def call(*args, **kwargs):
+            for attempt in range(NOTION_MAX_RETRIES + 1):
+                if self.limiter is not None:
+                    with span('notion.rate_limit_wait'):
+                        self.limiter.acquire(self.key)
+                try:
+                    return attribute(*args, **kwargs)
+                except Exception as e:
+                    if attempt == NOTION_MAX_RETRIES or not is_retryable_error(e):
+                        raise
+                    increment('notion_retries_total')
+                    delay = min(30.0, 2 ** attempt)
+                    if self.limiter is None:
+                        time.sleep(delay)
+                    else:
+                        # Back off every request on this integration, not just this one
+                        self.limiter.pause(self.key, delay)
+        return call
+
+def recency_priority(last_edited):
+    """Turn a last_edited_time into a heap priority; the most recently edited item comes out first"""
+    try:
+        return -datetime.fromisoformat(last_edited.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        # Unknown edit times (e.g. child blocks without one) go after everything dated
+        return 0.0
+
+def find_child_items(blocks):
+    """Return (kind, id, last_edited_time) for the child pages and databases in a list of blocks"""
+    children = []
+    for block in blocks:
+        if block.get('type') == 'child_page':
+            children.append(('page', block['id'], block.get('last_edited_time')))
+        elif block.get('type') == 'child_database':
+            children.append(('database', block['id'], block.get('last_edited_time')))
+    return children
+
+class Crawler:
+    """Visits pages and databases from a priority frontier, most recently edited first, following nested items
+
+    fetch(kind, item_id, last_edited) does the work for one item and returns the (kind, id, last_edited)
+    children it found. Every id is scheduled at most once, which also breaks cycles between pages.
+    """
+
+    def __init__(self, fetch, max_depth=CRAWL_MAX_DEPTH, max_items=CRAWL_MAX_ITEMS, workers=CRAWL_WORKERS):
+        self.fetch = fetch
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.workers = workers
+        self.frontier = []
+        self.seen = set()
+        self.active = 0
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.stats = {'scheduled': 0, 'visited': 0, 'errors': 0, 'duplicates': 0, 'depth_limited': 0, 'size_limited': 0}
+
+    def add(self, kind, item_id, last_edited=None, depth=0):
+        """Schedule an item unless it was seen before or is over the depth or size limit"""
+        key = item_id.replace('-', '')
+        with self.condition:
+            if key in self.seen:
+                self.stats['duplicates'] += 1
+                return False
+            if depth > self.max_depth:
+                self.stats['depth_limited'] += 1
+                return False
+            if self.max_items and self.stats['scheduled'] >= self.max_items:
+                self.stats['size_limited'] += 1
+                return False
+            self.seen.add(key)
+            self.sequence += 1
+            heapq.heappush(self.frontier, (recency_priority(last_edited), depth, self.sequence, kind, item_id, last_edited))
+            self.stats['scheduled'] += 1
+            self.condition.notify()
+            return True
+
+    def next_item(self):
+        """Wait for the next item; None once the frontier is empty and no worker can add more"""
+        with self.condition:
+            while not self.frontier:
+                if self.active == 0:
+                    self.condition.notify_all()
+                    return None
+                self.condition.wait()
+            self.active += 1
+            return heapq.heappop(self.frontier)
+
+    def worker(self):
+        while True:
+            item = self.next_item()
+            if item is None:
+                return
+            _, depth, _, kind, item_id, last_edited = item
+            try:
+                for child_kind, child_id, child_edited in self.fetch(kind, item_id, last_edited) or []:
+                    self.add(child_kind, child_id, child_edited, depth + 1)
+                increment('crawler_items_total', kind=kind)
+            except Exception as e:
+                logger.warning("Error crawling %s %s: %s", kind, item_id, e)
+                with self.condition:
+                    self.stats['errors'] += 1
+            with self.condition:
+                self.stats['visited'] += 1
+                self.active -= 1
+                self.condition.notify_all()
+
+    def run(self):
+        """Crawl until the frontier is exhausted and return the crawl statistics"""
+        threads = [threading.Thread(target=self.worker, name=f"crawler-{i}", daemon=True) for i in range(self.workers)]
+        with span('crawl', workers=self.workers):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return dict(self.stats)
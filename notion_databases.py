@@ -1,23 +1,34 @@
-import os
-from notion_client import Client
-from dotenv import load_dotenv
+import csv
+import io
+import re
+from notion_config import collect_paginated, get_notion_client
+from notion_metrics import traced
+from notion_pages import extract_parent_id
+from notion_tokens import estimate_tokens
 
-# Load environment variables
-load_dotenv(override=True)
-
-def get_notion_client():
-    """Initialize and return Notion client"""
-    notion_token = os.getenv('NOTION_TOKEN')
-    if not notion_token:
-        raise ValueError("NOTION_TOKEN environment variable is not set")
-    return Client(auth=notion_token)
+def list_databases_from_results(results):
+    """Turn raw search results into the database list used by the rest of the app"""
+    databases = []
+    for db in results:
+        title = db.get('title', [{'plain_text': 'Untitled'}])[0]['plain_text']
+        databases.append({
+            'id': db['id'],
+            'title': title,
+            'url': db.get('url', ''),
+            'created_time': db.get('created_time', ''),
+            'last_edited_time': db.get('last_edited_time', ''),
+            'parent_id': extract_parent_id(db)
+        })
+    
+    return databases
 
+@traced('fetch.list_databases')
 def get_accessible_databases():
     """Get all accessible databases from Notion"""
-    client = get_notion_client()
-    
     try:
-        response = client.search(
+        client = get_notion_client()
+        results = collect_paginated(
+            client.search,
             query="",
             filter={
                 'property': 'object',
@@ -25,78 +36,91 @@ def get_accessible_databases():
             }
         )
         
-        databases = []
-        for db in response.get('results', []):
-            title = db.get('title', [{'plain_text': 'Untitled'}])[0]['plain_text']
-            databases.append({
-                'id': db['id'],
-                'title': title,
-                'url': db.get('url', ''),
-                'created_time': db.get('created_time', ''),
-                'last_edited_time': db.get('last_edited_time', '')
-            })
-        
-        return databases
+        return list_databases_from_results(results)
     
     except Exception as e:
         print(f"Error fetching databases: {str(e)}")
         return []
 
+# Sorts a database query newest row first
+NEWEST_ROW_SORT = [{'timestamp': 'last_edited_time', 'direction': 'descending'}]
+
+def newest_edit(database_edited, rows):
+    """Return the latest of a database's own last edit and its rows' last edits"""
+    return max([database_edited or ''] + [row.get('last_edited_time') or '' for row in rows])
+
+def database_version(database_id, database_edited='', client=None):
+    """Return when a database or any of its rows was last edited, for keying caches and syncs
+
+    Notion doesn't bump a database's own last_edited_time when rows are added or edited, so the
+    newest row edit is looked up with a one-row query.
+    """
+    try:
+        client = client or get_notion_client()
+        response = client.databases.query(database_id=database_id, sorts=NEWEST_ROW_SORT, page_size=1)
+        return newest_edit(database_edited, response.get('results', []))
+    except Exception as e:
+        print(f"Error checking database rows: {str(e)}")
+        return database_edited
+
+@traced('fetch.database')
 def get_database_content(database_id):
     """Extract content from a Notion database"""
-    client = get_notion_client()
-    
     try:
+        client = get_notion_client()
+        
         # Get database structure
         database = client.databases.retrieve(database_id)
         
-        # Get database contents
-        response = client.databases.query(
-            database_id=database_id,
-            page_size=100  # Adjust as needed
-        )
-        
-        # Format database content
-        content = {
-            'title': database.get('title', [{'plain_text': 'Untitled'}])[0]['plain_text'],
-            'properties': {},
-            'entries': []
-        }
-        
-        # Add properties/columns
-        for prop_name, prop in database.get('properties', {}).items():
-            content['properties'][prop_name] = prop['type']
-        
-        # Add rows
-        for page in response.get('results', []):
-            entry = {}
-            for prop_name, prop in page.get('properties', {}).items():
-                value = "N/A"
-                if prop['type'] == 'title' and prop['title']:
-                    value = prop['title'][0]['plain_text']
-                elif prop['type'] == 'rich_text' and prop['rich_text']:
-                    value = prop['rich_text'][0]['plain_text']
-                elif prop['type'] == 'number':
-                    value = str(prop['number'])
-                elif prop['type'] == 'select' and prop['select']:
-                    value = prop['select']['name']
-                elif prop['type'] == 'multi_select':
-                    value = [item['name'] for item in prop['multi_select']]
-                elif prop['type'] == 'date' and prop['date']:
-                    value = prop['date']['start']
-                elif prop['type'] == 'checkbox':
-                    value = prop['checkbox']
-                
-                entry[prop_name] = value
-            
-            content['entries'].append(entry)
+        # Get database contents, following pagination past the first 100 rows
+        rows = collect_paginated(client.databases.query, database_id=database_id)
         
-        return content
+        return build_database_content(database, rows)
     
     except Exception as e:
         print(f"Error extracting database content: {str(e)}")
         return None
 
+def build_database_content(database, rows):
+    """Build the database content dict from the raw database object and its row pages"""
+    # Format database content
+    content = {
+        'title': database.get('title', [{'plain_text': 'Untitled'}])[0]['plain_text'],
+        'properties': {},
+        'entries': []
+    }
+    
+    # Add properties/columns
+    for prop_name, prop in database.get('properties', {}).items():
+        content['properties'][prop_name] = prop['type']
+    
+    # Add rows
+    for page in rows:
+        entry = {}
+        for prop_name, prop in page.get('properties', {}).items():
+            value = "N/A"
+            if prop['type'] == 'title' and prop['title']:
+                value = prop['title'][0]['plain_text']
+            elif prop['type'] == 'rich_text' and prop['rich_text']:
+                value = prop['rich_text'][0]['plain_text']
+            elif prop['type'] == 'number':
+                value = str(prop['number'])
+            elif prop['type'] == 'select' and prop['select']:
+                value = prop['select']['name']
+            elif prop['type'] == 'multi_select':
+                value = [item['name'] for item in prop['multi_select']]
+            elif prop['type'] == 'date' and prop['date']:
+                value = prop['date']['start']
+            elif prop['type'] == 'checkbox':
+                value = prop['checkbox']
+            
+            entry[prop_name] = value
+        
+        content['entries'].append(entry)
+    
+    return content
+
+@traced('render.database')
 def format_database_content(content):
     """Format database content for display or processing"""
     if not content:
@@ -123,6 +147,90 @@ def format_database_content(content):
     
     return formatted
 
+OMITTED_NOTE_TOKENS = 10
+
+def is_empty_value(value):
+    """Check whether a database cell carries no information"""
+    return value is None or value == "" or value == [] or value in ("N/A", "None")
+
+def format_cell(value):
+    """Format a single database cell for the compact layout"""
+    if is_empty_value(value):
+        return ""
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, list):
+        return "; ".join(value)
+    return str(value)
+
+def select_columns(content, query=None, columns=None):
+    """Pick the columns to keep, projecting on the query when no explicit columns are given"""
+    all_columns = list(content['properties'].keys())
+    for entry in content['entries']:
+        for prop_name in entry:
+            if prop_name not in all_columns:
+                all_columns.append(prop_name)
+
+    # Drop columns that are empty in every row
+    all_columns = [
+        name for name in all_columns
+        if any(not is_empty_value(entry.get(name)) for entry in content['entries'])
+    ]
+
+    if columns:
+        return [name for name in all_columns if name in columns]
+
+    if query:
+        query_words = set(re.findall(r'\w+', query.lower()))
+        title_columns = [name for name in all_columns if content['properties'].get(name) == 'title']
+        matched = [
+            name for name in all_columns
+            if name in title_columns or set(re.findall(r'\w+', name.lower())) & query_words
+        ]
+        # Only project when the query names at least one non-title column
+        if len(matched) > len(title_columns):
+            return matched
+
+    return all_columns
+
+def csv_line(values):
+    """Render a list of values as a single CSV line"""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue()
+
+@traced('render.database_compact')
+def format_database_compact(content, query=None, max_tokens=None, columns=None):
+    """Format database content as a header-once CSV table that fits into a token budget"""
+    if not content:
+        return "No database content available."
+
+    selected = select_columns(content, query=query, columns=columns)
+    header = f"Database: {content['title']} ({len(content['entries'])} rows)\n"
+    header += csv_line(selected)
+
+    formatted = header
+    used_tokens = estimate_tokens(header)
+    omitted = 0
+
+    for i, entry in enumerate(content['entries']):
+        cells = [format_cell(entry.get(name)) for name in selected]
+        if not any(cells):
+            continue
+        row = csv_line(cells)
+        row_tokens = estimate_tokens(row)
+        # Keep room for the trailing "rows omitted" note
+        if max_tokens is not None and used_tokens + row_tokens + OMITTED_NOTE_TOKENS > max_tokens:
+            omitted = len(content['entries']) - i
+            break
+        formatted += row
+        used_tokens += row_tokens
+
+    if omitted:
+        formatted += f"... {omitted} more rows omitted\n"
+
+    return formatted
+
 def get_all_databases_content():
     """Get content from all accessible databases"""
     databases = get_accessible_databases()
@@ -0,0 +1,162 @@
+import os
+import hashlib
+from notion_config import load_config
+from notion_metrics import increment
+from notion_tokens import SECTION_HEADER_PATTERN, estimate_tokens, join_sections, split_sections
+
+load_config()
+
+# Chunks shorter than this are left alone: headings and dividers repeat legitimately
+# and the reference note would cost about as much as it saves
+MIN_DEDUP_TOKENS = 20
+SEPARATOR = "=" * 80
+# Titles listed in the note on a first copy before the rest are only counted
+MAX_NOTE_TITLES = 3
+
+def normalize_chunk(text):
+    """Normalize a chunk so copies differing only in case or whitespace hash the same"""
+    return ' '.join(text.split()).lower()
+
+def chunk_hash(text):
+    """Return the content address of a chunk"""
+    return hashlib.sha1(normalize_chunk(text).encode('utf-8')).hexdigest()[:16]
+
+def split_chunks(body, is_database=False):
+    """Split a section body into chunks: database entries on blank lines, page content per line (one block each)"""
+    return body.split('\n\n') if is_database else body.split('\n')
+
+def also_in_note(locations, section):
+    """Return the note listing the other sections a passage appears in, or None if it only repeats in its own"""
+    titles = []
+    for location in locations:
+        if location['section'] != section and location['title'] not in titles:
+            titles.append(location['title'])
+    if not titles:
+        return None
+    listed = ', '.join(f'"{title}"' for title in titles[:MAX_NOTE_TITLES])
+    more = f" and {len(titles) - MAX_NOTE_TITLES} more" if len(titles) > MAX_NOTE_TITLES else ""
+    return f"[Also in: {listed}{more}]"
+
+def section_title(header, body):
+    """Return the title a reference to a section points at"""
+    line = header or body.strip().split('\n', 1)[0]
+    return SECTION_HEADER_PATTERN.sub('', line).strip()
+
+class ChunkIndex:
+    """Content-addressed index of chunks: each unique chunk is kept once with every location it appears at"""
+
+    def __init__(self):
+        self.chunks = {}
+        self.saved_tokens = 0
+
+    def add(self, text, section, title, position):
+        """Record a chunk occurrence and return its hash"""
+        digest = chunk_hash(text)
+        entry = self.chunks.get(digest)
+        if entry is None:
+            entry = {'text': text, 'tokens': None, 'locations': []}
+            self.chunks[digest] = entry
+        entry['locations'].append({'section': section, 'title': title, 'position': position})
+        return digest
+
+    def locations(self, digest):
+        """Return every (section, position) a chunk appears at"""
+        return self.chunks[digest]['locations']
+
+    def tokens(self, digest):
+        """Return the size of a chunk, estimated on first use since most chunks appear only once"""
+        entry = self.chunks[digest]
+        if entry['tokens'] is None:
+            entry['tokens'] = estimate_tokens(entry['text'])
+        return entry['tokens']
+
+    def is_duplicated(self, digest):
+        """Check whether a chunk is long enough and appears more than once"""
+        return len(self.chunks[digest]['locations']) > 1 and self.tokens(digest) >= MIN_DEDUP_TOKENS
+
+    def stats(self):
+        """Return chunk counts and how many tokens the repeated copies would have cost"""
+        total = sum(len(entry['locations']) for entry in self.chunks.values())
+        repeated = [digest for digest in self.chunks if self.is_duplicated(digest)]
+        return {
+            'chunks': total,
+            'unique_chunks': len(self.chunks),
+            'duplicate_chunks': sum(len(self.locations(digest)) - 1 for digest in repeated),
+            'duplicate_tokens': sum(self.tokens(digest) * (len(self.locations(digest)) - 1) for digest in repeated),
+            'saved_tokens': self.saved_tokens
+        }
+
+def index_chunks(sections):
+    """Index the chunks of (header, body) sections; returns the index and each section's (hash, chunk) list"""
+    index = ChunkIndex()
+    chunked = []
+    for section, (header, body) in enumerate(sections):
+        title = section_title(header, body)
+        is_database = (header or body.lstrip()).startswith('Database: ')
+        chunked.append([
+            (index.add(chunk, section, title, position) if chunk.strip() else None, chunk)
+            for position, chunk in enumerate(split_chunks(body, is_database))
+        ])
+    return index, chunked
+
+def dedupe_context(content):
+    """Send each repeated chunk of combined content once; returns the content and the chunk index
+
+    The first copy keeps its text, with a note of the other pages it appears in, and later copies
+    become a short reference back to it. This runs on the final context, after compression and
+    trimming, so every location named is one the prompt still contains.
+    """
+    sections = split_sections(content)
+    index, chunked = index_chunks(sections)
+    if not any(index.is_duplicated(digest) for digest in index.chunks):
+        return content, index
+
+    deduped = []
+    for section, ((header, body), chunks) in enumerate(zip(sections, chunked)):
+        parts = []
+        is_database = (header or body.lstrip()).startswith('Database: ')
+        for position, (digest, chunk) in enumerate(chunks):
+            if digest is None or not index.is_duplicated(digest):
+                parts.append(chunk)
+                continue
+            locations = index.locations(digest)
+            first = locations[0]
+            if (first['section'], first['position']) == (section, position):
+                note = also_in_note(locations, section)
+                parts.append(f"{chunk}\n{note}" if note else chunk)
+                if note:
+                    index.saved_tokens -= estimate_tokens(note) + 1
+                continue
+            where = "above" if first['section'] == section else f"see \"{first['title']}\""
+            reference = f"[Repeated passage, {where}]"
+            parts.append(reference)
+            index.saved_tokens += index.tokens(digest) - estimate_tokens(reference)
+        deduped.append((header, ('\n\n' if is_database else '\n').join(parts)))
+    increment('context_tokens_deduplicated_total', index.saved_tokens)
+    return join_sections(deduped), index
+
+def dedupe_enabled():
+    """Check whether prompts are deduplicated (NOTION_DEDUPE, on unless set to 0)"""
+    return os.getenv('NOTION_DEDUPE', '1').lower() not in ('0', 'false', 'no')
+
+def combine_documents(documents):
+    """Join documents into one context string in the 'all' layout; returns it with an index of repeated chunks
+
+    Repeated chunks are left in place here: they are replaced per prompt by dedupe_context, once the
+    context has been compressed and trimmed for the query.
+    """
+    all_content = ""
+    for document in documents:
+        header = f"PAGE: {document['title']}\n{SEPARATOR}\n" if document['kind'] == 'page' else ""
+        all_content += f"\n{SEPARATOR}\n{header}{document['content']}\n\n"
+    index, _ = index_chunks(split_sections(all_content))
+    return all_content, index
+
+def describe_dedup(index, content):
+    """Return a short summary of the repeated content that prompts send only once"""
+    stats = index.stats()
+    if stats['duplicate_tokens'] <= 0:
+        return f"{stats['chunks']:,} chunks, no repeated content"
+    share = stats['duplicate_tokens'] / max(estimate_tokens(content), 1)
+    return (f"{stats['duplicate_chunks']:,} repeated chunks sent once, up to ~{stats['duplicate_tokens']:,} tokens "
+            f"({share:.0%} of the combined context)")
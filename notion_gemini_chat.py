@@ -1,29 +1,29 @@
 import os
-import importlib.util
-import sys
 import re
-import google.generativeai as genai
 from datetime import datetime
-
-# Dynamically import notion_pages.py and notion_databases.py
-spec = importlib.util.spec_from_file_location("notion_pages", "notion_pages.py")
-notion_pages = importlib.util.module_from_spec(spec)
-sys.modules["notion_pages"] = notion_pages
-spec.loader.exec_module(notion_pages)
-
-spec = importlib.util.spec_from_file_location("notion_databases", "notion_databases.py")
-notion_databases = importlib.util.module_from_spec(spec)
-sys.modules["notion_databases"] = notion_databases
-spec.loader.exec_module(notion_databases)
+import notion_pages
+import notion_databases
+from notion_config import get_gemini_model, use_mock_backend
+from notion_conversation import ConversationMemory
+from notion_compress import describe_compression, pop_last_compression, prepare_context
+from notion_dedup import combine_documents, describe_dedup
+from notion_metrics import format_breakdown, query_trace, span, start_metrics_server
+from notion_profiling import run_entry_point
+from notion_scheduler import generate_content
+from notion_snapshot import describe_offline_mode
+from notion_summarize import answer_with_map_reduce, is_workspace_query
+from notion_tokens import (
+    EXACT_TOKEN_COUNT, content_budget, count_tokens, describe_context_size,
+    log_usage, usage_totals
+)
 
 def configure_gemini():
     """Configure the Gemini API client"""
     api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
+    if not api_key and not use_mock_backend('GEMINI'):
         api_key = input("Please enter your Google API key: ").strip()
         os.environ["GOOGLE_API_KEY"] = api_key
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-2.0-flash')
+    return get_gemini_model(api_key)
 
 def extract_todos(content, date=None):
     """Extract to-do items from content, optionally for a specific date"""
@@ -68,7 +68,7 @@ def extract_definitions(content):
     
     return definitions
 
-def query_gemini(model, content, query):
+def query_gemini(model, content, query, memory=None):
     """Query the Gemini API with Notion content as context"""
     try:
         # Check for specific query types
@@ -92,8 +92,14 @@ def query_gemini(model, content, query):
                 response += f"**{defn['term']}**: {defn['definition']}\n"
             return response
         
-        # General query: send to Gemini
-        prompt = f"""You are a helpful assistant with access to the following Notion content:
+        # General query: send to Gemini, dropping the least relevant sections if over the token budget
+        with span('prompt.build'):
+            if memory is not None:
+                # Include earlier turns, under a fixed history budget
+                prompt = memory.build_prompt(content, query)
+            else:
+                content = prepare_context(content, query, content_budget(query))
+                prompt = f"""You are a helpful assistant with access to the following Notion content:
 {content}
 
 Answer the following query based on the content:
@@ -101,8 +107,13 @@ Answer the following query based on the content:
 
 If the query asks for specific information (e.g., to-do lists, definitions, or database entries), extract and format it clearly. If the information isn't in the content, say so. Be concise and clear."""
         
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        prompt_tokens = count_tokens(prompt, model if EXACT_TOKEN_COUNT else None)
+        response = generate_content(model, prompt)
+        log_usage(prompt_tokens, response)
+        answer = response.text.strip()
+        if memory is not None:
+            memory.add_turn(query, answer)
+        return answer
     
     except Exception as e:
         return f"Error querying Gemini API: {str(e)}"
@@ -110,6 +121,10 @@ If the query asks for specific information (e.g., to-do lists, definitions, or d
 def main():
     print(" Notion + Gemini AI Chat")
     print("=" * 60)
+    start_metrics_server()
+    offline_status = describe_offline_mode()
+    if offline_status:
+        print(f" {offline_status}")
     
     # Fetch Notion pages
     print(" Fetching accessible Notion pages...")
@@ -147,17 +162,20 @@ def main():
             
             if choice.lower() == 'all':
                 print("\n Extracting content from all pages and databases...")
-                all_content = ""
+                documents = []
                 
                 # Process pages
                 for i, page in enumerate(pages, 1):
                     print(f"Processing page {i}/{len(pages)}: {page['title']}")
                     content_data = notion_pages.get_page_content(page['id'])
                     if content_data:
-                        all_content += f"\n{'='*80}\n"
-                        all_content += f"PAGE: {content_data['title']}\n"
-                        all_content += f"{'='*80}\n"
-                        all_content += content_data['content'] + "\n\n"
+                        documents.append({
+                            'id': page['id'],
+                            'title': content_data['title'],
+                            'content': content_data['content'],
+                            'last_edited': page['last_edited_time'],
+                            'kind': 'page'
+                        })
                 
                 # Process databases
                 for i, db in enumerate(databases, 1):
@@ -165,12 +183,23 @@ def main():
                     content = notion_databases.get_database_content(db['id'])
                     if content:
                         formatted_content = notion_databases.format_database_content(content)
-                        all_content += f"\n{'='*80}\n"
-                        all_content += formatted_content + "\n\n"
+                        documents.append({
+                            'id': db['id'],
+                            'title': db['title'],
+                            'content': formatted_content,
+                            # Row edits don't change the database's own edit time; this keys the summary cache
+                            'last_edited': notion_databases.database_version(db['id'], db['last_edited_time']),
+                            'kind': 'database'
+                        })
+                
+                # Repeated passages (templates, synced blocks, pages that are also rows) are sent once per prompt
+                all_content, chunk_index = combine_documents(documents)
+                print(f" Deduplication: {describe_dedup(chunk_index, all_content)}")
                 break
             
             item_num = int(choice)
             if 1 <= item_num <= total_items:
+                documents = []
                 if item_num <= len(pages):
                     # Selected a page
                     selected_item = pages[item_num - 1]
@@ -194,6 +223,9 @@ def main():
     model = configure_gemini()
     
     # Conversational loop
+    print(f"\n Context size: {describe_context_size(all_content)}")
+    memory = ConversationMemory(model)
+    
     print("\n Ready to chat! Ask about your Notion content (e.g., 'What are my today's to-do items?' or 'Show me definitions').")
     print("Type 'q' to quit.")
     
@@ -207,10 +239,22 @@ def main():
             print(" Please enter a valid query.")
             continue
         
-        response = query_gemini(model, all_content, query)
+        with query_trace() as trace:
+            if len(documents) > 1 and is_workspace_query(query):
+                # Workspace-wide questions are answered from per-page summaries
+                print(" Summarizing across all pages and databases...")
+                response = answer_with_map_reduce(model, documents, query)
+                memory.add_turn(query, response)
+            else:
+                response = query_gemini(model, all_content, query, memory=memory)
         print("\n Response:")
         print(response)
+        print(f" Timing: {format_breakdown(trace)}")
+        compression = pop_last_compression()
+        if compression:
+            print(f" Context: {describe_compression(compression)}")
+        print(f" Tokens used this session: {usage_totals['input_tokens']:,} in / {usage_totals['output_tokens']:,} out")
         print("=" * 60)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    run_entry_point(main, 'notion_gemini_chat')
\ No newline at end of file
@@ -1,31 +1,41 @@
 import os
-import importlib.util
-import sys
 import re
-import google.generativeai as genai
 from datetime import datetime
-from notion_client import Client
-from dotenv import load_dotenv
+from notion_config import (
+    collect_paginated, get_gemini_model, load_config, notion_backend, use_mock_backend,
+    get_notion_client as get_shared_notion_client
+)
+from notion_tokens import (
+    EXACT_TOKEN_COUNT, content_budget, count_tokens, describe_context_size,
+    log_usage, usage_totals
+)
+from notion_compress import describe_compression, pop_last_compression, prepare_context
+from notion_conversation import ConversationMemory
+from notion_databases import database_version
+from notion_metrics import format_breakdown, query_trace, span, start_metrics_server, traced
+from notion_profiling import run_entry_point
+from notion_scheduler import generate_content
+from notion_snapshot import describe_offline_mode
+from notion_summarize import answer_with_map_reduce, is_workspace_query
 
 # Load environment variables
-load_dotenv(override=True)
+load_config()
 
 def configure_gemini():
     """Configure the Gemini API client"""
     api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
+    if not api_key and not use_mock_backend('GEMINI'):
         api_key = input("Please enter your Google API key: ").strip()
         os.environ["GOOGLE_API_KEY"] = api_key
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-2.0-flash')
+    return get_gemini_model(api_key)
 
 def get_notion_client():
     """Initialize and return Notion client"""
     notion_token = os.getenv('NOTION_TOKEN')
-    if not notion_token:
+    if not notion_token and notion_backend() == 'live':
         notion_token = input("Please enter your Notion token: ").strip()
         os.environ["NOTION_TOKEN"] = notion_token
-    return Client(auth=notion_token)
+    return get_shared_notion_client(notion_token)
 
 def extract_todos(content, date=None):
     """Extract to-do items from content, optionally for a specific date"""
@@ -70,17 +80,15 @@ def extract_definitions(content):
     
     return definitions
 
+@traced('fetch.database')
 def extract_database_content(client, database_id):
     """Extract content from a Notion database"""
     try:
         # Get database structure
         database = client.databases.retrieve(database_id)
         
-        # Get database contents
-        response = client.databases.query(
-            database_id=database_id,
-            page_size=100  # Adjust as needed
-        )
+        # Get database contents, following pagination past the first 100 rows
+        rows = collect_paginated(client.databases.query, database_id=database_id)
         
         # Format database content
         content = f"Database: {database.get('title', [{'plain_text': 'Untitled'}])[0]['plain_text']}\n"
@@ -94,7 +102,7 @@ def extract_database_content(client, database_id):
         
         # Add rows
         content += "Entries:\n"
-        for page in response.get('results', []):
+        for page in rows:
             content += "-" * 40 + "\n"
             for prop_name, prop in page.get('properties', {}).items():
                 value = "N/A"
@@ -121,15 +129,21 @@ def extract_database_content(client, database_id):
     except Exception as e:
         return f"Error extracting database content: {str(e)}"
 
+@traced('fetch.page')
 def get_page_content(client, page_id):
     """Extract content from a Notion page"""
+    # Traced once per page; the recursion over child blocks happens below
+    return get_block_content(client, page_id)
+
+def get_block_content(client, block_id):
+    """Extract content from the children of a block, recursing into nested blocks"""
     try:
         # Get page blocks
-        blocks = client.blocks.children.list(block_id=page_id)
+        blocks = collect_paginated(client.blocks.children.list, block_id=block_id)
         
         # Format page content
         content = ""
-        for block in blocks.get('results', []):
+        for block in blocks:
             block_type = block.get('type')
             
             if block_type == 'paragraph':
@@ -177,15 +191,14 @@ def get_page_content(client, page_id):
             
             # Recursively get content from child blocks
             if block.get('has_children'):
-                child_blocks = client.blocks.children.list(block_id=block['id'])
-                content += get_page_content(client, block['id'])
+                content += get_block_content(client, block['id'])
         
         return content
     
     except Exception as e:
         return f"Error extracting page content: {str(e)}"
 
-def query_gemini(model, content, query):
+def query_gemini(model, content, query, memory=None):
     """Query the Gemini API with Notion content as context"""
     try:
         # Check for specific query types
@@ -209,8 +222,14 @@ def query_gemini(model, content, query):
                 response += f"**{defn['term']}**: {defn['definition']}\n"
             return response
         
-        # General query: send to Gemini
-        prompt = f"""You are a helpful assistant with access to the following Notion content:
+        # General query: send to Gemini, dropping the least relevant sections if over the token budget
+        with span('prompt.build'):
+            if memory is not None:
+                # Include earlier turns, under a fixed history budget
+                prompt = memory.build_prompt(content, query)
+            else:
+                content = prepare_context(content, query, content_budget(query))
+                prompt = f"""You are a helpful assistant with access to the following Notion content:
 {content}
 
 Answer the following query based on the content:
@@ -218,8 +237,13 @@ Answer the following query based on the content:
 
 If the query asks for specific information (e.g., to-do lists, definitions, or database entries), extract and format it clearly. If the information isn't in the content, say so. Be concise and clear."""
         
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        prompt_tokens = count_tokens(prompt, model if EXACT_TOKEN_COUNT else None)
+        response = generate_content(model, prompt)
+        log_usage(prompt_tokens, response)
+        answer = response.text.strip()
+        if memory is not None:
+            memory.add_turn(query, answer)
+        return answer
     
     except Exception as e:
         return f"Error querying Gemini API: {str(e)}"
@@ -227,6 +251,10 @@ If the query asks for specific information (e.g., to-do lists, definitions, or d
 def main():
     print(" Notion + Gemini AI Chat (Pages & Databases)")
     print("=" * 60)
+    start_metrics_server()
+    offline_status = describe_offline_mode()
+    if offline_status:
+        print(f" {offline_status}")
     
     # Initialize clients
     notion_client = get_notion_client()
@@ -234,7 +262,8 @@ def main():
     
     # First, get pages
     print(" Fetching accessible Notion pages...")
-    pages_response = notion_client.search(
+    pages = collect_paginated(
+        notion_client.search,
         query="",
         filter={
             'property': 'object',
@@ -242,11 +271,10 @@ def main():
         }
     )
     
-    pages = pages_response.get('results', [])
-    
     # Then, get databases
     print(" Fetching accessible Notion databases...")
-    databases_response = notion_client.search(
+    databases = collect_paginated(
+        notion_client.search,
         query="",
         filter={
             'property': 'object',
@@ -254,8 +282,6 @@ def main():
         }
     )
     
-    databases = databases_response.get('results', [])
-    
     if not pages and not databases:
         print(" No accessible pages or databases found.")
         return
@@ -287,6 +313,7 @@ def main():
             if choice.lower() == 'all':
                 print("\n Extracting content from all pages and databases...")
                 all_content = ""
+                documents = []
                 
                 # Process pages
                 for i, page in enumerate(pages, 1):
@@ -294,6 +321,13 @@ def main():
                     content = get_page_content(notion_client, page['id'])
                     all_content += f"\n{'='*80}\n"
                     all_content += content + "\n\n"
+                    documents.append({
+                        'id': page['id'],
+                        'title': page.get('properties', {}).get('title', {}).get('title', [{'plain_text': 'Untitled'}])[0]['plain_text'],
+                        'content': content,
+                        'last_edited': page.get('last_edited_time', ''),
+                        'kind': 'page'
+                    })
                 
                 # Process databases
                 for i, db in enumerate(databases, 1):
@@ -301,10 +335,19 @@ def main():
                     content = extract_database_content(notion_client, db['id'])
                     all_content += f"\n{'='*80}\n"
                     all_content += content + "\n\n"
+                    documents.append({
+                        'id': db['id'],
+                        'title': db.get('title', [{'plain_text': 'Untitled'}])[0]['plain_text'],
+                        'content': content,
+                        # Row edits don't change the database's own edit time; this keys the summary cache
+                        'last_edited': database_version(db['id'], db.get('last_edited_time', ''), notion_client),
+                        'kind': 'database'
+                    })
                 break
             
             item_num = int(choice)
             if 1 <= item_num <= total_items:
+                documents = []
                 if item_num <= len(pages):
                     # Selected a page
                     selected_item = pages[item_num - 1]
@@ -321,6 +364,9 @@ def main():
             print(" Please enter a valid number, 'all', or 'q' to quit")
     
     # Conversational loop
+    print(f"\n Context size: {describe_context_size(all_content)}")
+    memory = ConversationMemory(gemini_model)
+    
     print("\n Ready to chat! Ask about your Notion content.")
     print("Type 'q' to quit.")
     
@@ -334,10 +380,22 @@ def main():
             print(" Please enter a valid query.")
             continue
         
-        response = query_gemini(gemini_model, all_content, query)
+        with query_trace() as trace:
+            if len(documents) > 1 and is_workspace_query(query):
+                # Workspace-wide questions are answered from per-page summaries
+                print(" Summarizing across all pages and databases...")
+                response = answer_with_map_reduce(gemini_model, documents, query)
+                memory.add_turn(query, response)
+            else:
+                response = query_gemini(gemini_model, all_content, query, memory=memory)
         print("\n Response:")
         print(response)
+        print(f" Timing: {format_breakdown(trace)}")
+        compression = pop_last_compression()
+        if compression:
+            print(f" Context: {describe_compression(compression)}")
+        print(f" Tokens used this session: {usage_totals['input_tokens']:,} in / {usage_totals['output_tokens']:,} out")
         print("=" * 60)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    run_entry_point(main, 'notion_gemini_database') 
\ No newline at end of file
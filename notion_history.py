@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from notion_config import load_config
+from notion_metrics import increment
+
+load_config()
+
+CACHE_DIR = os.getenv('NOTION_CACHE_DIR', '.notion_cache')
+HISTORY_DB = os.getenv('NOTION_HISTORY_DB', os.path.join(CACHE_DIR, 'chat_history.sqlite3'))
+# Messages shown at first and added by each "Load more"
+HISTORY_PAGE_SIZE = int(os.getenv('NOTION_HISTORY_PAGE_SIZE', '10'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    created REAL NOT NULL,
+    query TEXT NOT NULL,
+    response_id TEXT NOT NULL REFERENCES responses(id),
+    timing TEXT,
+    compression TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+"""
+
+def response_id(body):
+    """Return the content address a response body is stored under"""
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+class ChatHistory:
+    """Chat messages in SQLite, per session, read newest first a page at a time
+
+    Response bodies live in their own table keyed by content hash, so an answer given more than
+    once (or shared between sessions) is stored once and messages only reference it.
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # One connection shared by the server's script threads, serialized by the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def create_session(self):
+        """Start a new session and return its id"""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO sessions (id, created, updated) VALUES (?, ?, ?)", (session_id, now, now))
+        return session_id
+
+    def has_session(self, session_id):
+        """Check whether a session id exists"""
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def add_message(self, session_id, query, response, timing=None, compression=None):
+        """Append a query and its response to a session and return the message id"""
+        body_id = response_id(response)
+        now = time.time()
+        with self.lock, self.connection:
+            stored = self.connection.execute(
+                "INSERT OR IGNORE INTO responses (id, body) VALUES (?, ?)", (body_id, response)
+            ).rowcount
+            cursor = self.connection.execute(
+                "INSERT INTO messages (session_id, created, query, response_id, timing, compression) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, now, query, body_id, timing, compression)
+            )
+            self.connection.execute(
+                "UPDATE sessions SET updated = ?, messages = messages + 1 WHERE id = ?", (now, session_id)
+            )
+        if not stored:
+            increment('chat_history_shared_responses_total')
+        return cursor.lastrowid
+
+    def latest(self, session_id, limit=HISTORY_PAGE_SIZE, before_id=None):
+        """Return up to limit messages of a session, newest first, optionally only those older than before_id
+
+        Reads walk the (session_id, id) index backwards, so the cost depends on limit, not on session length.
+        """
+        query = (
+            "SELECT messages.id, messages.created, query, body AS response, timing, compression "
+            "FROM messages JOIN responses ON responses.id = messages.response_id "
+            "WHERE session_id = ?" + (" AND messages.id < ?" if before_id is not None else "") +
+            " ORDER BY messages.id DESC LIMIT ?"
+        )
+        params = (session_id, before_id, limit) if before_id is not None else (session_id, limit)
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(query, params)]
+
+    def count(self, session_id):
+        """Return how many messages a session has, from the counter kept on the session row"""
+        with self.lock:
+            row = self.connection.execute("SELECT messages FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        """Return session, message and stored response counts"""
+        with self.lock:
+            sessions, messages, responses = (
+                self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('sessions', 'messages', 'responses')
+            )
+        return {'sessions': sessions, 'messages': messages, 'responses': responses}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
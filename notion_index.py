@@ -0,0 +1,198 @@
+import bisect
+import threading
+
+# Fuzzy search compares titles by shared character trigrams; this is the minimum overlap to count as a match
+MIN_FUZZY_SCORE = 0.3
+DEFAULT_LIMIT = 50
+
+def trigrams(text):
+    """Return the set of character trigrams of a lowercased, padded title"""
+    text = f"  {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def index_entry(listing, kind):
+    """Return the index entry for a listing (as returned by get_accessible_pages/databases)"""
+    return {
+        'id': listing['id'],
+        'title': listing['title'],
+        'kind': kind,
+        'parent_id': listing.get('parent_id'),
+        'last_edited_time': listing.get('last_edited_time', ''),
+        'url': listing.get('url', ''),
+        'workspace': listing.get('workspace')
+    }
+
+def remove_sorted(values, value):
+    """Remove value from a sorted list"""
+    position = bisect.bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+
+class WorkspaceIndex:
+    """In-memory metadata index of pages and databases: id lookup, prefix/fuzzy title search and recency order
+
+    Readers and writers share one lock, so a webhook thread can update the index while script threads
+    search it. Entries are replaced rather than modified, so items returned by a search stay valid.
+    """
+
+    def __init__(self, pages=(), databases=()):
+        self.items = {}
+        # (last_edited_time, id) and (lowercased title, id), both ascending
+        self.by_recency = []
+        self.titles = []
+        self.trigram_index = {}
+        self.children_index = {}
+        self.lock = threading.RLock()
+        self.add(pages, databases)
+
+    def add(self, pages=(), databases=()):
+        """Add or replace listing entries (as returned by get_accessible_pages/databases)"""
+        entries = [index_entry(listing, 'page') for listing in pages]
+        entries += [index_entry(listing, 'database') for listing in databases]
+        with self.lock:
+            if len(entries) > max(64, len(self.items) // 4):
+                # Large batches such as the initial listing are cheaper to index from scratch
+                self.items.update((entry['id'], entry) for entry in entries)
+                self.rebuild()
+                return
+            for entry in entries:
+                if entry['id'] in self.items:
+                    self.unindex(self.items[entry['id']])
+                self.items[entry['id']] = entry
+                self.index(entry)
+
+    def remove(self, item_id):
+        """Drop an item, e.g. after it was deleted or unshared"""
+        with self.lock:
+            item = self.items.pop(item_id, None)
+            if item is not None:
+                self.unindex(item)
+
+    def index(self, item):
+        """Add one item to the views; callers hold the lock"""
+        bisect.insort(self.by_recency, (item['last_edited_time'], item['id']))
+        bisect.insort(self.titles, (item['title'].lower(), item['id']))
+        for gram in trigrams(item['title']):
+            self.trigram_index.setdefault(gram, set()).add(item['id'])
+        if item['parent_id']:
+            self.children_index.setdefault(item['parent_id'], set()).add(item['id'])
+
+    def unindex(self, item):
+        """Remove one item from the views; callers hold the lock"""
+        remove_sorted(self.by_recency, (item['last_edited_time'], item['id']))
+        remove_sorted(self.titles, (item['title'].lower(), item['id']))
+        for gram in trigrams(item['title']):
+            ids = self.trigram_index.get(gram)
+            if ids is not None:
+                ids.discard(item['id'])
+                if not ids:
+                    del self.trigram_index[gram]
+        if item['parent_id']:
+            ids = self.children_index.get(item['parent_id'])
+            if ids is not None:
+                ids.discard(item['id'])
+                if not ids:
+                    del self.children_index[item['parent_id']]
+
+    def rebuild(self):
+        """Recompute all views from the items; callers hold the lock"""
+        trigram_index = {}
+        children_index = {}
+        for item_id, item in self.items.items():
+            for gram in trigrams(item['title']):
+                trigram_index.setdefault(gram, set()).add(item_id)
+            if item['parent_id']:
+                children_index.setdefault(item['parent_id'], set()).add(item_id)
+        self.by_recency = sorted((item['last_edited_time'], item_id) for item_id, item in self.items.items())
+        self.titles = sorted((item['title'].lower(), item_id) for item_id, item in self.items.items())
+        self.trigram_index = trigram_index
+        self.children_index = children_index
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def get(self, item_id):
+        """Return the metadata for an id, or None"""
+        return self.items.get(item_id)
+
+    def select(self, item_ids):
+        """Return the items for these ids in the given order, skipping unknown ids"""
+        with self.lock:
+            return [self.items[item_id] for item_id in item_ids if item_id in self.items]
+
+    def recent(self, kind=None, limit=None):
+        """Return items newest first, optionally only pages or databases"""
+        with self.lock:
+            items = (self.items[item_id] for _, item_id in reversed(self.by_recency))
+            if kind:
+                items = (item for item in items if item['kind'] == kind)
+            items = list(items)
+            return items[:limit] if limit else items
+
+    def children(self, parent_id):
+        """Return the pages and databases whose parent is parent_id, newest first"""
+        with self.lock:
+            child_ids = self.children_index.get(parent_id, [])
+            return sorted(self.select(child_ids), key=lambda item: item['last_edited_time'], reverse=True)
+
+    def prefix_search(self, prefix, kind=None, limit=DEFAULT_LIMIT):
+        """Return items whose title starts with prefix (case-insensitive), in title order"""
+        with self.lock:
+            prefix = prefix.lower()
+            results = []
+            start = bisect.bisect_left(self.titles, (prefix, ''))
+            for title, item_id in self.titles[start:]:
+                if not title.startswith(prefix):
+                    break
+                item = self.items[item_id]
+                if kind is None or item['kind'] == kind:
+                    results.append(item)
+                    if len(results) == limit:
+                        break
+            return results
+
+    def search(self, query, kind=None, limit=DEFAULT_LIMIT):
+        """Return title prefix matches, then substring matches (newest first), then fuzzy matches, best first"""
+        with self.lock:
+            query = query.strip()
+            if not query:
+                return self.recent(kind, limit)
+            lowered = query.lower()
+            results = self.prefix_search(lowered, kind, limit)
+            seen = {item['id'] for item in results}
+
+            if len(results) < limit:
+                substring_ids = [item_id for title, item_id in self.titles if lowered in title and item_id not in seen]
+                for item in sorted(self.select(substring_ids), key=lambda item: item['last_edited_time'], reverse=True):
+                    if kind is None or item['kind'] == kind:
+                        results.append(item)
+                        seen.add(item['id'])
+                        if len(results) == limit:
+                            break
+
+            # Typo-tolerant matching only runs when exact matches didn't fill the results
+            if len(results) < limit:
+                query_grams = trigrams(query)
+                overlap = {}
+                for gram in query_grams:
+                    for item_id in self.trigram_index.get(gram, ()):
+                        overlap[item_id] = overlap.get(item_id, 0) + 1
+                minimum = MIN_FUZZY_SCORE * len(query_grams)
+                scored = sorted(
+                    ((shared, self.items[item_id]['last_edited_time'], item_id) for item_id, shared in overlap.items()
+                     if shared >= minimum and item_id not in seen and (kind is None or self.items[item_id]['kind'] == kind)),
+                    reverse=True
+                )
+                results.extend(self.items[item_id] for _, _, item_id in scored[:limit - len(results)])
+            return results
+
+    def label(self, item_id):
+        """Return a select box label for an id"""
+        with self.lock:
+            item = self.items.get(item_id)
+            if item is None:
+                return item_id
+            return f"{item['title']} (Last edited: {item['last_edited_time'][:10]})"
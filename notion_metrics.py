@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from notion_config import load_config
+
+load_config()
+
+# Latency buckets in seconds and token buckets, Prometheus style (cumulative "le" buckets)
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+TOKEN_BUCKETS = [100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000]
+
+# Finished spans kept for the JSON trace file
+MAX_TRACE_EVENTS = int(os.getenv('NOTION_TRACE_MAX_EVENTS', '100000'))
+TRACE_FILE = os.getenv('NOTION_TRACE_FILE')
+METRICS_PORT = os.getenv('NOTION_METRICS_PORT')
+
+metrics_lock = threading.Lock()
+counters = {}
+histograms = {}
+trace_events = deque(maxlen=MAX_TRACE_EVENTS)
+thread_state = threading.local()
+start_time = time.perf_counter()
+metrics_server = None
+
+def label_key(name, labels):
+    """Build a hashable key for a metric with labels
+
+    Values are kept as strings, as Prometheus sees them, so keys with e.g. a numeric and a
+    textual status still sort and render together.
+    """
+    return (name, tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+def increment(name, value=1, **labels):
+    """Add value to a counter"""
+    with metrics_lock:
+        key = label_key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record one observation in a histogram"""
+    with metrics_lock:
+        key = label_key(name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            histograms[key] = histogram
+        for i, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def record_span(name, duration, started=None, **attributes):
+    """Record a finished span: latency histogram, trace event and the current query breakdown"""
+    started = started if started is not None else time.perf_counter() - duration
+    observe('span_duration_seconds', duration, span=name)
+    event = {
+        'name': name,
+        'ph': 'X',
+        'ts': round((started - start_time) * 1e6),
+        'dur': round(duration * 1e6),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'args': attributes
+    }
+    with metrics_lock:
+        trace_events.append(event)
+    collector = getattr(thread_state, 'collector', None)
+    if collector is not None:
+        collector.append((name, duration))
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block of code as a named span"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        record_span(name, time.perf_counter() - started, started, **attributes)
+
+def traced(name):
+    """Decorator that records every call of a function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def query_trace():
+    """Collect the spans recorded on this thread while answering one query"""
+    previous = getattr(thread_state, 'collector', None)
+    collector = []
+    thread_state.collector = collector
+    started = time.perf_counter()
+    try:
+        yield collector
+    finally:
+        collector.append(('total', time.perf_counter() - started))
+        thread_state.collector = previous
+
+def carry_trace(func):
+    """Wrap func so spans it records on another thread, e.g. a pool worker, go to this thread's query trace"""
+    collector = getattr(thread_state, 'collector', None)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(thread_state, 'collector', None)
+        thread_state.collector = collector
+        try:
+            return func(*args, **kwargs)
+        finally:
+            thread_state.collector = previous
+    return wrapper
+
+def summarize_trace(collector):
+    """Group collected spans by name into total seconds and call counts, slowest first"""
+    totals = {}
+    for name, duration in collector:
+        seconds, calls = totals.get(name, (0.0, 0))
+        totals[name] = (seconds + duration, calls + 1)
+    return sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+
+def format_breakdown(collector):
+    """Format a per-query breakdown as a single line"""
+    parts = []
+    for name, (seconds, calls) in summarize_trace(collector):
+        calls_text = f" ×{calls}" if calls > 1 else ""
+        parts.append(f"{name} {seconds * 1000:.0f} ms{calls_text}")
+    return " · ".join(parts)
+
+def format_labels(labels, extra=None):
+    """Render Prometheus labels"""
+    items = list(labels) + (extra or [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+def render_prometheus():
+    """Render all counters and histograms in the Prometheus text exposition format"""
+    lines = []
+    with metrics_lock:
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_trace_file(path=None):
+    """Write recorded spans as a Chrome trace (open in chrome://tracing or Perfetto)"""
+    path = path or TRACE_FILE
+    if not path:
+        return None
+    with metrics_lock:
+        events = list(trace_events)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return path
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics in Prometheus format and /trace as JSON"""
+
+    def do_GET(self):
+        if self.path.startswith('/metrics'):
+            body = render_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path.startswith('/trace'):
+            with metrics_lock:
+                body = json.dumps({'traceEvents': list(trace_events)}).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=None):
+    """Start the metrics endpoint in a background thread (once per process)"""
+    global metrics_server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with metrics_lock:
+        if metrics_server is None:
+            metrics_server = ThreadingHTTPServer(('127.0.0.1', int(port)), MetricsHandler)
+            threading.Thread(target=metrics_server.serve_forever, name='metrics-server', daemon=True).start()
+    return metrics_server
+
+class InstrumentedClient:
+    """Wraps a Notion client so every API method call is timed and counted"""
+
+    def __init__(self, target, path='notion'):
+        self.target = target
+        self.path = path
+
+    def __getattr__(self, name):
+        attribute = getattr(self.target, name)
+        path = f"{self.path}.{name}"
+        if attribute is None or isinstance(attribute, (str, int, float, bool, list, dict, tuple)):
+            return attribute
+        if not callable(attribute):
+            # Endpoint groups such as client.blocks.children
+            return InstrumentedClient(attribute, path)
+
+        def call(*args, **kwargs):
+            increment('notion_api_calls_total', endpoint=path)
+            try:
+                with span(path):
+                    return attribute(*args, **kwargs)
+            except Exception as e:
+                status = getattr(e, 'status', 'error')
+                increment('notion_api_errors_total', endpoint=path, status=status)
+                raise
+        return call
+
+if TRACE_FILE:
+    atexit.register(write_trace_file)
@@ -0,0 +1,457 @@
+import os
+import time
+import zlib
+import random
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from notion_tokens import estimate_tokens
+
+# Synthetic workspace presets; block trees and database rows are generated lazily,
+# so even the huge preset only keeps page and database metadata in memory
+WORKSPACE_SIZES = {
+    'small': {'pages': 20, 'databases': 3, 'blocks_per_page': 30, 'depth': 2, 'rows_per_database': 50},
+    'medium': {'pages': 500, 'databases': 20, 'blocks_per_page': 100, 'depth': 3, 'rows_per_database': 1000},
+    'huge': {'pages': 10000, 'databases': 100, 'blocks_per_page': 200, 'depth': 4, 'rows_per_database': 10000},
+}
+
+MAX_PAGE_SIZE = 100
+BASE_TIME = datetime(2025, 1, 1)
+
+WORDS = (
+    "notion gemini redis vector search index cache latency throughput query page database task "
+    "review meeting project deadline design draft release budget roadmap customer feedback team "
+    "sprint backlog bug feature api token model prompt summary note idea plan goal metric report"
+).split()
+
+TEXT_BLOCK_TYPES = [
+    'paragraph', 'paragraph', 'paragraph', 'heading_1', 'heading_2', 'heading_3',
+    'bulleted_list_item', 'bulleted_list_item', 'numbered_list_item', 'to_do', 'quote', 'code', 'callout'
+]
+
+class MockAPIResponseError(Exception):
+    """Mirrors notion_client.APIResponseError closely enough for error handling code"""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+class ResourceExhausted(Exception):
+    """Mirrors google.api_core.exceptions.ResourceExhausted (HTTP 429)"""
+    code = 429
+
+def make_id(rng, tag='4'):
+    """Generate a Notion-style UUID from a random generator; tag starts the third group (the version digit)"""
+    raw = '%032x' % rng.getrandbits(128)
+    raw = raw[:12] + tag + raw[12 + len(tag):]
+    return f"{raw[:8]}-{raw[8:12]}-{raw[12:16]}-{raw[16:20]}-{raw[20:]}"
+
+def make_time(rng):
+    """Generate an ISO timestamp within the year after BASE_TIME"""
+    moment = BASE_TIME + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def make_sentence(rng, min_words=4, max_words=16):
+    """Generate a sentence of random workspace words"""
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize()
+
+def rich_text(text):
+    """Wrap plain text the way the Notion API returns it"""
+    return [{'type': 'text', 'plain_text': text, 'text': {'content': text}}]
+
+def seeded_rng(seed, key):
+    """Return a random generator that is deterministic for a seed and key"""
+    return random.Random(f"{seed}:{key}")
+
+class SyntheticWorkspace:
+    """A deterministic fake Notion workspace of arbitrary size"""
+
+    def __init__(self, pages=20, databases=3, blocks_per_page=30, depth=2, rows_per_database=50,
+                 nested_page_ratio=0.2, template_ratio=0.0, seed=0):
+        self.blocks_per_page = blocks_per_page
+        # Block ids carry their depth as one digit
+        self.depth = min(depth, 9)
+        self.rows_per_database = rows_per_database
+        self.seed = seed
+        rng = seeded_rng(seed, 'workspace')
+
+        self.pages = {}
+        self.child_pages = {}
+        page_ids = []
+        for i in range(pages):
+            page_id = make_id(rng)
+            # Some pages are nested under an earlier page and show up as child_page blocks
+            parent_id = rng.choice(page_ids) if page_ids and rng.random() < nested_page_ratio else None
+            title = f"{make_sentence(rng, 2, 5)} {i}"
+            self.pages[page_id] = {
+                'object': 'page',
+                'id': page_id,
+                'created_time': make_time(rng),
+                'last_edited_time': make_time(rng),
+                'url': f"https://www.notion.so/{page_id.replace('-', '')}",
+                'parent': {'type': 'page_id', 'page_id': parent_id} if parent_id else {'type': 'workspace', 'workspace': True},
+                'properties': {'title': {'id': 'title', 'type': 'title', 'title': rich_text(title)}}
+            }
+            if parent_id:
+                self.child_pages.setdefault(parent_id, []).append(page_id)
+            page_ids.append(page_id)
+
+        # A share of the pages starts with the same template blocks, like pages created from a Notion template
+        template_rng = seeded_rng(seed, 'template')
+        self.template = [
+            (block_type, make_sentence(template_rng, 20, 50))
+            for block_type in ('heading_2', 'paragraph', 'paragraph', 'bulleted_list_item', 'bulleted_list_item', 'callout')
+        ]
+        self.templated = {page_id for page_id in page_ids if template_rng.random() < template_ratio}
+
+        self.databases = {}
+        for i in range(databases):
+            database_id = make_id(rng)
+            title = f"{make_sentence(rng, 1, 3)} database {i}"
+            self.databases[database_id] = {
+                'object': 'database',
+                'id': database_id,
+                'created_time': make_time(rng),
+                'last_edited_time': make_time(rng),
+                'url': f"https://www.notion.so/{database_id.replace('-', '')}",
+                'title': rich_text(title),
+                'properties': {
+                    'Name': {'id': 'title', 'name': 'Name', 'type': 'title'},
+                    'Status': {'id': 'status', 'name': 'Status', 'type': 'select'},
+                    'Tags': {'id': 'tags', 'name': 'Tags', 'type': 'multi_select'},
+                    'Due': {'id': 'due', 'name': 'Due', 'type': 'date'},
+                    'Done': {'id': 'done', 'name': 'Done', 'type': 'checkbox'},
+                    'Points': {'id': 'points', 'name': 'Points', 'type': 'number'},
+                    'Notes': {'id': 'notes', 'name': 'Notes', 'type': 'rich_text'},
+                }
+            }
+
+    @classmethod
+    def from_size(cls, size='small', seed=0, template_ratio=0.0):
+        """Build a workspace from one of the WORKSPACE_SIZES presets"""
+        return cls(seed=seed, template_ratio=template_ratio, **WORKSPACE_SIZES[size])
+
+    def template_blocks(self, rng):
+        """Generate the template blocks a templated page starts with; only the ids differ between pages"""
+        blocks = []
+        for block_type, text in self.template:
+            blocks.append({
+                'object': 'block',
+                'id': make_id(rng),
+                'type': block_type,
+                'has_children': False,
+                'created_time': make_time(rng),
+                'last_edited_time': make_time(rng),
+                block_type: {'rich_text': rich_text(text)}
+            })
+        return blocks
+
+    def make_block(self, rng, depth):
+        """Generate one content block at the given depth of the tree"""
+        block_type = rng.choice(TEXT_BLOCK_TYPES)
+        # The id carries the depth (see block_depth), so nothing is remembered per generated block
+        block_id = make_id(rng, f"b{depth}")
+        data = {'rich_text': rich_text(make_sentence(rng))}
+        if block_type == 'to_do':
+            data['checked'] = rng.random() < 0.5
+        elif block_type == 'code':
+            data['language'] = rng.choice(['python', 'javascript', 'sql'])
+        if rng.random() < 0.05:
+            block_type = 'divider'
+            data = {}
+
+        has_children = depth < self.depth and block_type != 'divider' and rng.random() < 0.15
+        return {
+            'object': 'block',
+            'id': block_id,
+            'type': block_type,
+            'has_children': has_children,
+            'created_time': make_time(rng),
+            'last_edited_time': make_time(rng),
+            block_type: data
+        }
+
+    def block_depth(self, block_id):
+        """Return the tree depth of a page (0) or generated content block, None for any other id"""
+        if block_id in self.pages:
+            return 0
+        # Content block ids start their third group with "b" and the depth, other ids with "4"
+        if len(block_id) == 36 and block_id[14] == 'b' and block_id[15].isdigit():
+            return int(block_id[15])
+        return None
+
+    def children(self, block_id):
+        """Return the full list of child blocks of a page or block"""
+        depth = self.block_depth(block_id)
+        if depth is None:
+            return []
+        rng = seeded_rng(self.seed, block_id)
+        count = self.blocks_per_page if depth == 0 else rng.randint(1, 5)
+        blocks = [self.make_block(rng, depth + 1) for _ in range(count)]
+
+        if depth == 0 and block_id in self.templated:
+            blocks = self.template_blocks(seeded_rng(self.seed, f"template:{block_id}")) + blocks
+        if depth == 0:
+            for child_id in self.child_pages.get(block_id, []):
+                title = self.pages[child_id]['properties']['title']['title'][0]['plain_text']
+                blocks.append({
+                    'object': 'block',
+                    'id': child_id,
+                    'type': 'child_page',
+                    'has_children': True,
+                    'child_page': {'title': title}
+                })
+        return blocks
+
+    def row(self, database_id, index):
+        """Generate one database row"""
+        rng = seeded_rng(self.seed, f"{database_id}:{index}")
+        row_id = make_id(rng)
+        number = rng.randint(1, 13) if rng.random() < 0.6 else None
+        return {
+            'object': 'page',
+            'id': row_id,
+            'created_time': make_time(rng),
+            'last_edited_time': make_time(rng),
+            'parent': {'type': 'database_id', 'database_id': database_id},
+            'properties': {
+                'Name': {'type': 'title', 'title': rich_text(make_sentence(rng, 2, 6))},
+                'Status': {'type': 'select', 'select': {'name': rng.choice(['Todo', 'In progress', 'Done'])} if rng.random() < 0.8 else None},
+                'Tags': {'type': 'multi_select', 'multi_select': [{'name': t} for t in rng.sample(['backend', 'ui', 'infra', 'docs'], rng.randint(0, 2))]},
+                'Due': {'type': 'date', 'date': {'start': make_time(rng)[:10]} if rng.random() < 0.6 else None},
+                'Done': {'type': 'checkbox', 'checkbox': rng.random() < 0.5},
+                'Points': {'type': 'number', 'number': number},
+                'Notes': {'type': 'rich_text', 'rich_text': rich_text(make_sentence(rng)) if rng.random() < 0.3 else []},
+            }
+        }
+
+def paginate(items, page_size=None, start_cursor=None):
+    """Slice a result list the way the Notion API paginates it"""
+    page_size = min(page_size or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    start = int(start_cursor or 0)
+    end = start + page_size
+    return {
+        'object': 'list',
+        'results': items[start:end],
+        'has_more': end < len(items),
+        'next_cursor': str(end) if end < len(items) else None
+    }
+
+class MockTransport:
+    """Simulates network latency and rate limiting for the fake clients"""
+
+    def __init__(self, latency=0.0, jitter=0.0, requests_per_second=None, error_factory=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_per_second = requests_per_second
+        self.error_factory = error_factory
+        self.recent = deque()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.rate_limited_count = 0
+
+    def request(self):
+        """Account for one request, raising the backend's rate limit error when over the limit"""
+        with self.lock:
+            self.request_count += 1
+            if self.requests_per_second:
+                now = time.monotonic()
+                while self.recent and now - self.recent[0] > 1.0:
+                    self.recent.popleft()
+                if len(self.recent) >= self.requests_per_second:
+                    self.rate_limited_count += 1
+                    raise self.error_factory()
+                self.recent.append(now)
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+class FakeEndpoint:
+    """Groups fake API methods the way notion_client does (client.pages, client.blocks.children, ...)"""
+
+    def __init__(self, **methods):
+        for name, method in methods.items():
+            setattr(self, name, method)
+
+class FakeNotionClient:
+    """Implements the part of notion_client.Client used by this project on top of a SyntheticWorkspace"""
+
+    def __init__(self, workspace=None, latency=0.0, jitter=0.0, requests_per_second=None):
+        self.workspace = workspace or SyntheticWorkspace()
+        self.transport = MockTransport(
+            latency, jitter, requests_per_second,
+            error_factory=lambda: MockAPIResponseError(429, 'rate_limited', "Rate limited")
+        )
+        self.pages = FakeEndpoint(retrieve=self.retrieve_page)
+        self.blocks = FakeEndpoint(children=FakeEndpoint(list=self.list_children))
+        self.databases = FakeEndpoint(retrieve=self.retrieve_database, query=self.query_database)
+
+    def search(self, query="", filter=None, page_size=None, start_cursor=None, **kwargs):
+        """Search pages or databases by title"""
+        self.transport.request()
+        kind = (filter or {}).get('value')
+        items = []
+        if kind in (None, 'page'):
+            items += list(self.workspace.pages.values())
+        if kind in (None, 'database'):
+            items += list(self.workspace.databases.values())
+        if query:
+            items = [item for item in items if query.lower() in title_of(item).lower()]
+        return paginate(items, page_size, start_cursor)
+
+    def retrieve_page(self, page_id, **kwargs):
+        """Return page metadata"""
+        self.transport.request()
+        if page_id not in self.workspace.pages:
+            raise MockAPIResponseError(404, 'object_not_found', f"Could not find page with ID: {page_id}")
+        return self.workspace.pages[page_id]
+
+    def list_children(self, block_id, page_size=None, start_cursor=None, **kwargs):
+        """Return one page of child blocks"""
+        self.transport.request()
+        return paginate(self.workspace.children(block_id), page_size, start_cursor)
+
+    def retrieve_database(self, database_id, **kwargs):
+        """Return database schema and title"""
+        self.transport.request()
+        if database_id not in self.workspace.databases:
+            raise MockAPIResponseError(404, 'object_not_found', f"Could not find database with ID: {database_id}")
+        return self.workspace.databases[database_id]
+
+    def query_database(self, database_id, page_size=None, start_cursor=None, **kwargs):
+        """Return one page of database rows, generating only the requested window"""
+        self.transport.request()
+        if kwargs.get('sorts'):
+            # Only sorting by last edit is supported, and it generates every row of the database
+            rows = [self.workspace.row(database_id, i) for i in range(self.workspace.rows_per_database)]
+            rows.sort(key=lambda row: row['last_edited_time'], reverse=kwargs['sorts'][0].get('direction') == 'descending')
+            return paginate(rows, page_size, start_cursor)
+        page_size = min(page_size or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        start = int(start_cursor or 0)
+        end = min(start + page_size, self.workspace.rows_per_database)
+        return {
+            'object': 'list',
+            'results': [self.workspace.row(database_id, i) for i in range(start, end)],
+            'has_more': end < self.workspace.rows_per_database,
+            'next_cursor': str(end) if end < self.workspace.rows_per_database else None
+        }
+
+def title_of(item):
+    """Return the plain title of a fake page or database"""
+    if item['object'] == 'database':
+        return item['title'][0]['plain_text']
+    return item['properties']['title']['title'][0]['plain_text']
+
+class FakeUsage:
+    """Mirrors the usage_metadata attached to Gemini responses"""
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    """Mirrors the parts of a Gemini GenerateContentResponse we read"""
+
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class FakeTokenCount:
+    """Mirrors the result of GenerativeModel.count_tokens"""
+
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+class FakeGenerativeModel:
+    """Implements generate_content and count_tokens with simulated latency and quota errors"""
+
+    def __init__(self, model_name='mock-gemini', latency=0.0, tokens_per_second=None, output_tokens=80,
+                 requests_per_second=None):
+        self.model_name = model_name
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.transport = MockTransport(
+            latency, 0.0, requests_per_second,
+            error_factory=lambda: ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        )
+
+    def generate_content(self, prompt, **kwargs):
+        """Return a deterministic answer that reflects the prompt size"""
+        self.transport.request()
+        prompt_tokens = estimate_tokens(prompt)
+        last_line = prompt.strip().split('\n')[-1][:80]
+        words = ' '.join(WORDS[(prompt_tokens + i) % len(WORDS)] for i in range(self.output_tokens))
+        text = f"Mock answer from {prompt_tokens} prompt tokens ({last_line}): {words}"
+        if self.tokens_per_second:
+            time.sleep(self.output_tokens / self.tokens_per_second)
+        return FakeResponse(text, FakeUsage(prompt_tokens, estimate_tokens(text)))
+
+    def count_tokens(self, contents, **kwargs):
+        """Count tokens with the local estimator"""
+        self.transport.request()
+        return FakeTokenCount(estimate_tokens(contents))
+
+mock_workspace = None
+mock_workspaces = {}
+mock_lock = threading.Lock()
+
+def get_mock_workspace(token=None):
+    """Return the process-wide synthetic workspace configured by MOCK_WORKSPACE_SIZE
+
+    Each token gets a workspace of its own, seeded from the token, for simulating several integrations.
+    """
+    global mock_workspace
+    size = os.getenv('MOCK_WORKSPACE_SIZE', 'small')
+    seed = int(os.getenv('MOCK_SEED', '0'))
+    template_ratio = float(os.getenv('MOCK_TEMPLATE_RATIO', '0'))
+    with mock_lock:
+        if token:
+            if token not in mock_workspaces:
+                mock_workspaces[token] = SyntheticWorkspace.from_size(
+                    size, seed=seed + zlib.crc32(token.encode('utf-8')), template_ratio=template_ratio
+                )
+            return mock_workspaces[token]
+        if mock_workspace is None:
+            mock_workspace = SyntheticWorkspace.from_size(size, seed=seed, template_ratio=template_ratio)
+        return mock_workspace
+
+def create_mock_notion_client(token=None):
+    """Create a fake Notion client from MOCK_* environment settings"""
+    return FakeNotionClient(
+        get_mock_workspace(token),
+        latency=float(os.getenv('MOCK_NOTION_LATENCY_MS', '0')) / 1000,
+        jitter=float(os.getenv('MOCK_NOTION_JITTER_MS', '0')) / 1000,
+        requests_per_second=float(os.getenv('MOCK_NOTION_RATE_LIMIT', '0')) or None
+    )
+
+def create_mock_gemini_model(model_name='mock-gemini'):
+    """Create a fake Gemini model from MOCK_* environment settings"""
+    return FakeGenerativeModel(
+        model_name=model_name,
+        latency=float(os.getenv('MOCK_GEMINI_LATENCY_MS', '0')) / 1000,
+        tokens_per_second=float(os.getenv('MOCK_GEMINI_TOKENS_PER_SECOND', '0')) or None,
+        requests_per_second=float(os.getenv('MOCK_GEMINI_RATE_LIMIT', '0')) or None
+    )
+
+def install_mock_backends(size='small', seed=0, notion_latency=0.0, gemini_latency=0.0, notion_rate_limit=None,
+                          template_ratio=0.0):
+    """Switch the process to mock backends with a fresh synthetic workspace (used by benchmarks)"""
+    global mock_workspace
+    import notion_config
+
+    os.environ['NOTION_BACKEND'] = 'mock'
+    os.environ['GEMINI_BACKEND'] = 'mock'
+    with mock_lock:
+        mock_workspace = SyntheticWorkspace.from_size(size, seed=seed, template_ratio=template_ratio)
+    with notion_config.clients_lock:
+        notion_config.notion_clients['mock'] = notion_config.wrap_notion_client(FakeNotionClient(
+            mock_workspace, latency=notion_latency, requests_per_second=notion_rate_limit
+        ))
+        for key in [key for key in notion_config.gemini_models if key[0] == 'mock']:
+            del notion_config.gemini_models[key]
+        notion_config.gemini_models[('mock', notion_config.GEMINI_MODEL)] = FakeGenerativeModel(
+            notion_config.GEMINI_MODEL, latency=gemini_latency
+        )
+    return mock_workspace
@@ -1,45 +1,61 @@
-from notion_client import Client
 import json
 import re
 import os 
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from notion_config import collect_paginated, get_notion_client, load_config
+from notion_metrics import record_span, traced
+from notion_profiling import run_entry_point
 
-load_dotenv(override=True)
-notion_token = os.getenv('NOTION_TOKEN')
+load_config()
 
+# Bulk fetches run on threads; rendering moves to this many worker processes when set (0 keeps it in-process)
+FETCH_WORKERS = int(os.getenv('NOTION_FETCH_WORKERS', '8'))
+RENDER_PROCESSES = int(os.getenv('NOTION_RENDER_PROCESSES', '0'))
+
+@traced('fetch.list_pages')
 def get_accessible_pages():
     """Get all pages that the integration has access to"""
-    client = Client(auth=notion_token)
-    
     try:
-        response = client.search(
+        client = get_notion_client()
+        results = collect_paginated(
+            client.search,
             query="",
-            page_size=100,
             filter={
                 "property": "object",
                 "value": "page"
             }
         )
         
-        pages = []
-        for result in response.get('results', []):
-            if result.get('object') == 'page':
-                title = extract_title(result)
-                
-                pages.append({
-                    'id': result['id'],
-                    'title': title,
-                    'url': result.get('url', ''),
-                    'created_time': result.get('created_time', ''),
-                    'last_edited_time': result.get('last_edited_time', ''),
-                })
-        
-        return pages
+        return list_pages_from_results(results)
         
     except Exception as e:
         print(f"Error fetching pages: {str(e)}")
         return []
 
+def list_pages_from_results(results):
+    """Turn raw search results into the page list used by the rest of the app"""
+    pages = []
+    for result in results:
+        if result.get('object') == 'page':
+            title = extract_title(result)
+            
+            pages.append({
+                'id': result['id'],
+                'title': title,
+                'url': result.get('url', ''),
+                'created_time': result.get('created_time', ''),
+                'last_edited_time': result.get('last_edited_time', ''),
+                'parent_id': extract_parent_id(result),
+            })
+    
+    return pages
+
+def extract_parent_id(item):
+    """Return the id of the page or database an item lives under, or None for workspace-level items"""
+    parent = item.get('parent') or {}
+    return parent.get(parent.get('type')) if parent.get('type') in ('page_id', 'database_id', 'block_id') else None
+
 def extract_title(page_data):
     """Extract title from page data"""
     title = "Untitled"
@@ -51,18 +67,16 @@ def extract_title(page_data):
             title = title_prop['rich_text'][0]['plain_text']
     return title
 
-def extract_text_from_block(block):
-    """Extract text content from a Notion block"""
-    text_content = ""
-    
-    # Handle different block types
+def compact_block(block):
+    """Reduce a raw Notion block to the (type, text, checked, language) fields rendering needs"""
     block_type = block.get('type', '')
     block_data = block.get(block_type, {})
-    
-    # Text-containing blocks
-    if 'rich_text' in block_data:
-        for text_obj in block_data['rich_text']:
-            text_content += text_obj.get('plain_text', '')
+    text = ''.join(text_obj.get('plain_text', '') for text_obj in block_data.get('rich_text', []))
+    return (block_type, text, bool(block_data.get('checked')), block_data.get('language', ''))
+
+def render_block(compact):
+    """Render a compacted block as markdown-ish text"""
+    block_type, text_content, checked, language = compact
     
     # Special handling for different block types
     if block_type == 'heading_1':
@@ -78,67 +92,140 @@ def extract_text_from_block(block):
     elif block_type == 'numbered_list_item':
         text_content = f"1. {text_content}\n"
     elif block_type == 'to_do':
-        checkbox = "☑" if block_data.get('checked') else "☐"
+        checkbox = "☑" if checked else "☐"
         text_content = f"{checkbox} {text_content}\n"
     elif block_type == 'quote':
         text_content = f"> {text_content}\n"
     elif block_type == 'code':
-        language = block_data.get('language', '')
         text_content = f"```{language}\n{text_content}\n```\n"
     elif block_type == 'divider':
         text_content = "\n---\n"
     
     return text_content
 
-def get_page_content(page_id):
-    """Get the full content of a Notion page"""
-    client = Client(auth=notion_token)
-    
+def extract_text_from_block(block):
+    """Extract text content from a Notion block"""
+    return render_block(compact_block(block))
+
+def fetch_page_payload(page_id):
+    """Fetch a page and its blocks as a compact, picklable payload for render_page"""
     try:
+        client = get_notion_client()
+        
         # Get page metadata
         page = client.pages.retrieve(page_id)
-        title = extract_title(page)
         
         # Get page blocks (content)
-        blocks_response = client.blocks.children.list(block_id=page_id, page_size=100)
-        
-        content = f"# {title}\n\n"
-        
-        # Process each block
-        for block in blocks_response.get('results', []):
-            block_text = extract_text_from_block(block)
-            content += block_text
-            
-            # Handle nested blocks (like indented lists)
-            if block.get('has_children'):
-                try:
-                    children_response = client.blocks.children.list(block_id=block['id'])
-                    for child_block in children_response.get('results', []):
-                        child_text = extract_text_from_block(child_block)
-                        # Indent child content
-                        indented_text = '\n'.join(['  ' + line for line in child_text.split('\n')])
-                        content += indented_text
-                except:
-                    pass  # Skip if can't get children
-        
-        # Clean up extra whitespace
-        content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-        content = content.strip()
-        
-        return {
-            'title': title,
-            'content': content,
-            'word_count': len(content.split()),
-            'char_count': len(content),
-            'page_id': page_id,
-            'url': page.get('url', ''),
-            'last_edited': page.get('last_edited_time', '')
-        }
+        blocks = collect_paginated(client.blocks.children.list, block_id=page_id)
         
+        return build_page_payload(
+            page_id, page, blocks,
+            lambda block_id: collect_paginated(client.blocks.children.list, block_id=block_id)
+        )
+    
     except Exception as e:
         print(f"Error extracting content: {str(e)}")
         return None
 
+def build_page_payload(page_id, page, blocks, get_children):
+    """Build a render_page payload from raw page and block JSON; get_children(block_id) returns raw child blocks"""
+    # Nested blocks (like indented lists) are rendered one level deep
+    compact_blocks = []
+    for block in blocks:
+        children = []
+        if block.get('has_children'):
+            try:
+                children = [compact_block(child_block) for child_block in get_children(block['id'])]
+            except:
+                pass  # Skip if can't get children
+        compact_blocks.append((compact_block(block), children))
+    
+    return {
+        'title': extract_title(page),
+        'blocks': compact_blocks,
+        'page_id': page_id,
+        'url': page.get('url', ''),
+        'last_edited': page.get('last_edited_time', '')
+    }
+
+def render_page(payload, chunk_tokens=None):
+    """Render a fetched page payload; CPU only, so it can run in a worker process"""
+    started = time.perf_counter()
+    content = f"# {payload['title']}\n\n"
+    
+    # Process each block
+    for compact, children in payload['blocks']:
+        content += render_block(compact)
+        for child in children:
+            # Indent child content
+            content += '\n'.join(['  ' + line for line in render_block(child).split('\n')])
+    render_seconds = time.perf_counter() - started
+    
+    # Clean up extra whitespace
+    started = time.perf_counter()
+    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
+    content = content.strip()
+    cleanup_seconds = time.perf_counter() - started
+    
+    result = {
+        'title': payload['title'],
+        'content': content,
+        'word_count': len(content.split()),
+        'char_count': len(content),
+        'page_id': payload['page_id'],
+        'url': payload['url'],
+        'last_edited': payload['last_edited'],
+        'timings': {'render.blocks': render_seconds, 'render.cleanup': cleanup_seconds}
+    }
+    if chunk_tokens:
+        from notion_summarize import split_into_chunks
+        result['chunks'] = split_into_chunks(content, chunk_tokens)
+    return result
+
+def record_render_timings(content_data, block_count):
+    """Record the render spans measured by render_page, which may have run in another process"""
+    timings = content_data.pop('timings')
+    record_span('render.blocks', timings['render.blocks'], blocks=block_count)
+    record_span('render.cleanup', timings['render.cleanup'])
+
+@traced('fetch.page')
+def get_page_content(page_id, chunk_tokens=None):
+    """Get the full content of a Notion page"""
+    payload = fetch_page_payload(page_id)
+    if payload is None:
+        return None
+    content_data = render_page(payload, chunk_tokens)
+    record_render_timings(content_data, len(payload['blocks']))
+    return content_data
+
+def get_pages_content(page_ids, fetch_workers=FETCH_WORKERS, render_processes=RENDER_PROCESSES, chunk_tokens=None):
+    """Fetch many pages on a thread pool and render them on a process pool, returning results in order"""
+    if not render_processes:
+        with ThreadPoolExecutor(max_workers=fetch_workers) as fetchers:
+            return list(fetchers.map(lambda page_id: get_page_content(page_id, chunk_tokens), page_ids))
+    
+    results = [None] * len(page_ids)
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetchers, \
+            ProcessPoolExecutor(max_workers=render_processes) as renderers:
+        fetches = {fetchers.submit(fetch_page_payload, page_id): i for i, page_id in enumerate(page_ids)}
+        renders = {}
+        # Hand each payload to the render pool as soon as it arrives, so fetching and rendering overlap
+        for fetch in as_completed(fetches):
+            payload = fetch.result()
+            if payload is not None:
+                render = renderers.submit(render_page, payload, chunk_tokens)
+                renders[render] = (fetches[fetch], len(payload['blocks']))
+        for render in as_completed(renders):
+            i, block_count = renders[render]
+            try:
+                content_data = render.result()
+            except Exception as e:
+                print(f"Error rendering page {page_ids[i]}: {str(e)}")
+                continue
+            record_render_timings(content_data, block_count)
+            results[i] = content_data
+    return results
+
 def display_pages(pages):
     """Display pages for selection"""
     if not pages:
@@ -184,6 +271,11 @@ def main():
     print("Integration: xyz_abc")
     print("=" * 60)
     
+    from notion_snapshot import describe_offline_mode
+    offline_status = describe_offline_mode()
+    if offline_status:
+        print(f" {offline_status}")
+    
     print("🔍 Fetching accessible pages...")
     pages = get_accessible_pages()
     
@@ -267,4 +359,4 @@ def main():
         return None
 
 if __name__ == '__main__':
-    extracted_content = main()
\ No newline at end of file
+    extracted_content = run_entry_point(main, 'notion_pages')
\ No newline at end of file
@@ -0,0 +1,125 @@
+import os
+import sys
+import io
+import pstats
+import argparse
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+DEFAULT_PROFILE_DIR = 'profiles'
+DEFAULT_TOP = 20
+
+def parse_profile_args(argv=None):
+    """Parse the --profile options shared by the CLI entry points"""
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument('--profile', action='store_true', help="Capture CPU and memory profiles for this run")
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR, help="Where to write profile files")
+    parser.add_argument('--profile-top', type=int, default=DEFAULT_TOP, help="Rows in the printed summaries")
+    return parser.parse_args(argv)
+
+class ThreadProfiles:
+    """Profile every thread started while active (scheduler workers, fetch and map-reduce pools)
+
+    cProfile only sees the thread that enables it, so each new thread enables a profiler of its own
+    on its first call; merge() adds them all to the main thread's stats.
+    """
+
+    def __init__(self):
+        self.profilers = []
+        self.lock = threading.Lock()
+
+    def start_thread(self, *_):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler, and it already sees every thread
+            sys.setprofile(None)
+            return
+        with self.lock:
+            self.profilers.append(profiler)
+
+    def __enter__(self):
+        threading.setprofile(self.start_thread)
+        return self
+
+    def __exit__(self, *_):
+        threading.setprofile(None)
+
+    def merge(self, profiler):
+        """Return the main thread's stats with every worker thread's stats added"""
+        stats = pstats.Stats(profiler)
+        with self.lock:
+            for worker_profiler in self.profilers:
+                # Threads still alive (e.g. idle scheduler workers) are read as they are
+                stats.add(worker_profiler)
+        return stats
+
+def print_cpu_summary(stats, top):
+    """Print the functions with the highest cumulative and own time"""
+    for sort_key, label in (('cumulative', 'cumulative time'), ('tottime', 'own time')):
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.strip_dirs().sort_stats(sort_key).print_stats(top)
+        print(f"\n Top {top} functions by {label}")
+        print("=" * 60)
+        # Skip pstats' header lines and print only the table
+        lines = stream.getvalue().splitlines()
+        start = next((i for i, line in enumerate(lines) if line.strip().startswith('ncalls')), 0)
+        print('\n'.join(lines[start:]).rstrip())
+
+def print_memory_summary(snapshot, top):
+    """Print the source lines that allocated the most memory still alive at the end of the run"""
+    stats = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ]).statistics('lineno')
+    print(f"\n Top {top} allocations by size")
+    print("=" * 60)
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        print(f"{stat.size / 1024:10.1f} KB  {stat.count:8d} blocks  {frame.filename}:{frame.lineno}")
+
+def run_with_profile(func, name, profile_dir=DEFAULT_PROFILE_DIR, top=DEFAULT_TOP):
+    """Run func under cProfile and tracemalloc, save both profiles and print top-N summaries
+
+    Threads started during the run are profiled too and merged into the same stats; threads that
+    were already running before it (none in the CLIs) are not.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    cpu_file = os.path.join(profile_dir, f"{name}_{stamp}.prof")
+    memory_file = os.path.join(profile_dir, f"{name}_{stamp}.tracemalloc")
+
+    tracemalloc.start(25)
+    profiler = cProfile.Profile()
+    threads = ThreadProfiles()
+    profiler.enable()
+    try:
+        with threads:
+            return func()
+    finally:
+        profiler.disable()
+        stats = threads.merge(profiler)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats.dump_stats(cpu_file)
+        snapshot.dump(memory_file)
+
+        print(f"\n CPU profile covers the main thread and {len(threads.profilers)} worker thread(s); times add up across threads")
+        print_cpu_summary(stats, top)
+        print_memory_summary(snapshot, top)
+        print(f"\n Peak traced memory: {peak / (1024 * 1024):.1f} MB (still allocated at exit: {current / (1024 * 1024):.1f} MB)")
+        print(f" CPU profile saved to: {cpu_file} (open with snakeviz or python -m pstats)")
+        print(f" Memory snapshot saved to: {memory_file} (load with tracemalloc.Snapshot.load)")
+
+def run_entry_point(main, name, argv=None):
+    """Run a CLI main(), profiling it when --profile is passed"""
+    args = parse_profile_args(sys.argv[1:] if argv is None else argv)
+    if args.profile:
+        return run_with_profile(main, name, profile_dir=args.profile_dir, top=args.profile_top)
+    return main()
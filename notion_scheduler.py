@@ -0,0 +1,182 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from notion_config import load_config
+from notion_metrics import increment, span
+
+logger = logging.getLogger(__name__)
+
+load_config()
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv('GEMINI_MAX_CONCURRENT_REQUESTS', '4'))
+REQUESTS_PER_MINUTE = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '60'))
+MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '5'))
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+def check_limits(max_concurrency, requests_per_minute):
+    """Reject scheduler settings that would never run a request"""
+    if max_concurrency < 1:
+        raise ValueError(f"GEMINI_MAX_CONCURRENT_REQUESTS must be at least 1, got {max_concurrency}")
+    if requests_per_minute <= 0:
+        raise ValueError(f"GEMINI_REQUESTS_PER_MINUTE must be greater than 0, got {requests_per_minute:g}")
+
+# Checked at startup: with no workers, every submitted prompt would wait forever
+check_limits(MAX_CONCURRENT_REQUESTS, REQUESTS_PER_MINUTE)
+
+def is_retryable_error(error):
+    """Check whether a Gemini error is a quota or transient overload error worth retrying"""
+    # google.api_core raises ResourceExhausted (429) and ServiceUnavailable (503);
+    # match on name and code so we don't need to import it here
+    if type(error).__name__ in ('ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable'):
+        return True
+    code = getattr(error, 'code', None) or getattr(error, 'status', None)
+    if code in (429, 503):
+        return True
+    message = str(error)
+    return '429' in message or 'quota' in message.lower() or 'rate limit' in message.lower()
+
+class RateLimiter:
+    """Token bucket rate limiter with an independent bucket per key"""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst or max(1, int(self.rate * 2))
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key='default'):
+        """Block until a request for key is allowed"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, updated, paused_until = self.buckets.get(key, (self.capacity, now, 0.0))
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+                if now >= paused_until and tokens >= 1:
+                    self.buckets[key] = (tokens - 1, now, paused_until)
+                    return
+                self.buckets[key] = (tokens, now, paused_until)
+                wait = max(paused_until - now, (1 - tokens) / self.rate if tokens < 1 else 0)
+            time.sleep(min(wait, 1.0))
+
+    def pause(self, key, seconds):
+        """Stop issuing requests for key for a while, e.g. after a quota error"""
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated, paused_until = self.buckets.get(key, (0, now, 0.0))
+            self.buckets[key] = (0, now, max(paused_until, now + seconds))
+
+class GenerationScheduler:
+    """Runs Gemini generate_content calls on a bounded pool with priorities, rate limits and coalescing"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_REQUESTS, requests_per_minute=REQUESTS_PER_MINUTE,
+                 max_retries=MAX_RETRIES):
+        check_limits(max_concurrency, requests_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(requests_per_minute)
+        self.condition = threading.Condition()
+        self.queues = {INTERACTIVE: deque(), BACKGROUND: deque()}
+        self.in_flight = {}
+        self.workers = []
+
+    def start(self):
+        """Start the worker threads if they are not running yet"""
+        with self.condition:
+            if self.workers:
+                return
+            for i in range(self.max_concurrency):
+                # With more than one worker, the first one only serves interactive requests
+                interactive_only = i == 0 and self.max_concurrency > 1
+                worker = threading.Thread(
+                    target=self.worker_loop,
+                    args=(interactive_only,),
+                    name=f"gemini-worker-{i}",
+                    daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+
+    def submit(self, model, prompt, priority=INTERACTIVE, key=None):
+        """Queue a prompt and return a Future; identical in-flight prompts share one request"""
+        self.start()
+        key = key or getattr(model, 'model_name', 'default')
+        job_key = (key, prompt)
+
+        with self.condition:
+            future = self.in_flight.get(job_key)
+            if future is not None:
+                increment('gemini_coalesced_requests_total')
+                return future
+
+            future = Future()
+            self.in_flight[job_key] = future
+            self.queues[priority].append((job_key, model, prompt, future))
+            self.condition.notify_all()
+        return future
+
+    def next_job(self, interactive_only):
+        """Wait for the next job, taking interactive work before background work"""
+        with self.condition:
+            while True:
+                if self.queues[INTERACTIVE]:
+                    return self.queues[INTERACTIVE].popleft()
+                if not interactive_only and self.queues[BACKGROUND]:
+                    return self.queues[BACKGROUND].popleft()
+                self.condition.wait()
+
+    def worker_loop(self, interactive_only):
+        """Process jobs forever"""
+        while True:
+            job_key, model, prompt, future = self.next_job(interactive_only)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.run_with_retries(job_key[0], model, prompt))
+                except Exception as e:
+                    future.set_exception(e)
+            with self.condition:
+                self.in_flight.pop(job_key, None)
+
+    def run_with_retries(self, key, model, prompt):
+        """Call generate_content, backing off exponentially on quota errors"""
+        for attempt in range(self.max_retries + 1):
+            with span('gemini.rate_limit_wait'):
+                self.limiter.acquire(key)
+            increment('gemini_requests_total')
+            try:
+                with span('gemini.generate_content', attempt=attempt):
+                    return model.generate_content(prompt)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    increment('gemini_errors_total')
+                    raise
+                increment('gemini_retries_total')
+                delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt)
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning("Gemini quota error, retrying in %.1fs (attempt %d): %s", delay, attempt + 1, e)
+                # Hold back every request on this key, not just this one
+                self.limiter.pause(key, delay)
+
+scheduler = None
+scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide generation scheduler"""
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = GenerationScheduler()
+        return scheduler
+
+def generate_content(model, prompt, priority=INTERACTIVE, key=None):
+    """Run model.generate_content through the shared scheduler and wait for the response"""
+    # Measured on the calling thread so it shows up in the per-query breakdown, queueing included
+    with span('gemini.generate'):
+        return get_scheduler().submit(model, prompt, priority=priority, key=key).result()
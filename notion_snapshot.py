@@ -0,0 +1,704 @@
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import hashlib
+import shutil
+import argparse
+import threading
+import notion_pages
+import notion_databases
+from types import SimpleNamespace
+from contextlib import contextmanager
+from notion_config import (
+    MAX_PAGE_SIZE, collect_paginated, get_notion_client, load_config, notion_backend, use_snapshot_backend
+)
+from notion_crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_ITEMS, Crawler, RateLimitedClient, find_child_items
+from notion_metrics import increment, span
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock; msvcrt only has exclusive locks, so readers take the exclusive one too
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        # Neither: only the threads of one process are kept apart
+        msvcrt = None
+
+load_config()
+
+CACHE_DIR = os.getenv('NOTION_CACHE_DIR', '.notion_cache')
+SNAPSHOT_DIR = os.getenv('NOTION_SNAPSHOT_DIR', os.path.join(CACHE_DIR, 'snapshot'))
+# A new segment is started once the current one grows past this size
+SEGMENT_MAX_BYTES = int(os.getenv('NOTION_SNAPSHOT_SEGMENT_MB', '64')) * 1024 * 1024
+COMPRESSION_LEVEL = 6
+SYNC_WORKERS = int(os.getenv('NOTION_FETCH_WORKERS', '8'))
+# In offline mode (NOTION_BACKEND=snapshot) syncs and background refreshes fetch from this backend
+SNAPSHOT_SOURCE = os.getenv('NOTION_SNAPSHOT_SOURCE', 'live').lower()
+# Background refresh interval for offline mode; 0 turns it off
+REFRESH_MINUTES = float(os.getenv('NOTION_SNAPSHOT_REFRESH_MINUTES', '0'))
+
+INDEX_FILE = 'index.jsonl'
+SYNC_KEY = 'meta:sync'
+LOCK_SH = 'shared'
+LOCK_EX = 'exclusive'
+
+def lock_file(f, operation):
+    """Take a shared (LOCK_SH) or exclusive (LOCK_EX) lock on an open file, waiting for other processes"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_SH if operation == LOCK_SH else fcntl.LOCK_EX)
+        return
+    if msvcrt is None:
+        return
+    f.seek(0)
+    while True:
+        try:
+            # Retries for about 10 seconds itself before giving up
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+def unlock_file(f):
+    """Release a lock taken by lock_file"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    if msvcrt is None:
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class SnapshotStore:
+    """Append-only store of raw Notion JSON in compressed segments, with an offset index and mmap reads
+
+    Every record is a zlib-compressed JSON document appended to the current segment file; index.jsonl
+    gets one line per write with the record's segment, offset and length. The last index line for a key
+    wins, so rewriting a page never touches old data until compact() runs. Records are content-addressed:
+    writing bytes the store already holds (unchanged listings, empty block lists, duplicated rows) only
+    adds an index line pointing at the existing copy.
+
+    Several processes may share a store (the CLI sync, the Streamlit refresh, the webhook receiver):
+    writes and compaction hold an exclusive lock on a file next to the directory and reads a shared one,
+    and each process picks up index lines the others appended, or reopens the store after a compaction.
+    """
+
+    def __init__(self, path=SNAPSHOT_DIR, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        self.lock = threading.Lock()
+        # Held for a whole sync pass, so overlapping refreshes of the same store can't interleave
+        self.sync_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        # Outside the directory, so it survives compaction replacing it
+        self.lock_file = open(path.rstrip(os.sep) + '.lock', 'a+')
+        with self.file_lock(LOCK_SH):
+            self.open()
+
+    def open(self):
+        """Load the index and open the files to append to; callers hold the file lock"""
+        self.index = {}
+        self.by_hash = {}
+        self.maps = {}
+        self.index_position = 0
+        self.index_file = open(os.path.join(self.path, INDEX_FILE), 'a', encoding='utf-8')
+        self.index_inode = os.fstat(self.index_file.fileno()).st_ino
+        self.load_index()
+        self.segment = max([entry['segment'] for entry in self.index.values()] + [self.last_segment_on_disk(), 1])
+        self.segment_file = open(self.segment_path(self.segment), 'ab')
+
+    @contextmanager
+    def file_lock(self, operation):
+        """Hold the store's file lock, shared for reads or exclusive for writes
+
+        The file lock is per open file, not per thread, so threads of this process take turns on self.lock first.
+        """
+        lock_file(self.lock_file, operation)
+        try:
+            yield
+        finally:
+            unlock_file(self.lock_file)
+
+    @contextmanager
+    def locked(self, operation=LOCK_SH):
+        """Lock the store against this process's threads and other processes, then catch up with their writes"""
+        with self.lock, self.file_lock(operation):
+            self.catch_up()
+            yield
+
+    def catch_up(self):
+        """Apply index lines other processes appended, or reopen the store if it was compacted"""
+        index_path = os.path.join(self.path, INDEX_FILE)
+        try:
+            status = os.stat(index_path)
+        except FileNotFoundError:
+            status = None
+        if status is None or status.st_ino != self.index_inode:
+            self.close_files()
+            os.makedirs(self.path, exist_ok=True)
+            self.open()
+            return
+        if status.st_size > self.index_position:
+            self.load_index()
+            # A writer that started a new segment has indexed a record in it
+            last_segment = self.last_segment_on_disk()
+            if last_segment > self.segment:
+                self.segment_file.close()
+                self.segment = last_segment
+                self.segment_file = open(self.segment_path(self.segment), 'ab')
+
+    def segment_path(self, segment):
+        return os.path.join(self.path, f"segment-{segment:06d}.bin")
+
+    def last_segment_on_disk(self):
+        """Return the highest segment number present in the directory"""
+        numbers = [int(name[8:14]) for name in os.listdir(self.path) if name.startswith('segment-')]
+        return max(numbers, default=1)
+
+    def load_index(self):
+        """Replay index.jsonl from where the last call stopped, ignoring a torn last line and entries past the end of their segment"""
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        sizes = {}
+        with open(index_path, 'rb') as f:
+            f.seek(self.index_position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.index_position += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('deleted'):
+                    self.index.pop(entry['key'], None)
+                    continue
+                segment = entry['segment']
+                if segment not in sizes:
+                    path = self.segment_path(segment)
+                    sizes[segment] = os.path.getsize(path) if os.path.exists(path) else 0
+                if entry['offset'] + entry['length'] <= sizes[segment]:
+                    self.index[entry['key']] = entry
+                    if entry.get('hash'):
+                        self.by_hash[entry['hash']] = entry
+
+    def append_index(self, entry):
+        """Write one index line; callers hold the exclusive lock"""
+        line = json.dumps(entry) + "\n"
+        self.index_file.write(line)
+        self.index_file.flush()
+        self.index_position += len(line.encode('utf-8'))
+
+    def put(self, key, value, last_edited=None):
+        """Append value under key"""
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'), COMPRESSION_LEVEL)
+        digest = hashlib.sha1(data).hexdigest()
+        with self.locked(LOCK_EX):
+            existing = self.by_hash.get(digest)
+            if existing is not None:
+                segment, offset = existing['segment'], existing['offset']
+                increment('snapshot_dedup_hits_total')
+            else:
+                # Another process may have appended since our last write
+                self.segment_file.seek(0, os.SEEK_END)
+                if self.segment_file.tell() and self.segment_file.tell() + len(data) > self.segment_max_bytes:
+                    self.segment_file.close()
+                    self.segment += 1
+                    self.segment_file = open(self.segment_path(self.segment), 'ab')
+                segment, offset = self.segment, self.segment_file.tell()
+                self.segment_file.write(data)
+                # The record must be on disk before the index points at it
+                self.segment_file.flush()
+                increment('snapshot_bytes_written_total', len(data))
+            entry = {
+                'key': key,
+                'segment': segment,
+                'offset': offset,
+                'length': len(data),
+                'hash': digest,
+                'last_edited': last_edited,
+                'written': time.time()
+            }
+            self.append_index(entry)
+            self.index[key] = entry
+            self.by_hash[digest] = entry
+        increment('snapshot_writes_total')
+
+    def delete(self, key):
+        """Drop key from the index; its data is reclaimed by compact()"""
+        with self.locked(LOCK_EX):
+            if self.index.pop(key, None) is not None:
+                self.append_index({'key': key, 'deleted': True})
+
+    def read_bytes(self, entry):
+        """Read a record's bytes through a memory map of its segment; callers hold the lock"""
+        end = entry['offset'] + entry['length']
+        mapped = self.maps.get(entry['segment'])
+        if mapped is None or len(mapped) < end:
+            # The active segment grows, so its map is refreshed when a record lies past the end
+            if mapped is not None:
+                mapped.close()
+            with open(self.segment_path(entry['segment']), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[entry['segment']] = mapped
+        return mapped[entry['offset']:end]
+
+    def get(self, key, default=None):
+        """Return the latest value stored under key"""
+        with self.locked():
+            entry = self.index.get(key)
+            if entry is None:
+                return default
+            data = self.read_bytes(entry)
+        increment('snapshot_reads_total')
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    def last_edited(self, key):
+        """Return the last_edited_time recorded with key, or None"""
+        entry = self.index.get(key)
+        return entry['last_edited'] if entry else None
+
+    def keys(self, prefix=''):
+        """Return the stored keys starting with prefix"""
+        return [key for key in list(self.index) if key.startswith(prefix)]
+
+    def stats(self):
+        """Return record counts and sizes"""
+        with self.locked():
+            segments = sorted({entry['segment'] for entry in self.index.values()} | {self.segment})
+            disk_bytes = sum(
+                os.path.getsize(self.segment_path(segment))
+                for segment in segments if os.path.exists(self.segment_path(segment))
+            )
+            # Keys sharing a content-addressed record count once
+            live_bytes = sum(length for length in {
+                (entry['segment'], entry['offset']): entry['length'] for entry in self.index.values()
+            }.values())
+            return {
+                'records': len(self.index),
+                'pages': sum(key.startswith('page:') for key in self.index),
+                'databases': sum(key.startswith('database:') for key in self.index),
+                'segments': len(segments),
+                'live_mb': round(live_bytes / (1024 * 1024), 2),
+                'disk_mb': round(disk_bytes / (1024 * 1024), 2)
+            }
+
+    def compact(self):
+        """Rewrite only the live records into fresh segments and drop everything else
+
+        Holds the exclusive lock throughout, so no other process reads or writes the old segments
+        meanwhile; they reopen the store on their next access.
+        """
+        compact_path = self.path.rstrip(os.sep) + '.compact'
+        with self.locked(LOCK_EX):
+            shutil.rmtree(compact_path, ignore_errors=True)
+            compacted = SnapshotStore(compact_path, self.segment_max_bytes)
+            for key in sorted(self.index, key=lambda key: (self.index[key]['segment'], self.index[key]['offset'])):
+                entry = self.index[key]
+                compacted.put(key, json.loads(zlib.decompress(self.read_bytes(entry)).decode('utf-8')), entry['last_edited'])
+            compacted.close()
+            os.remove(compact_path + '.lock')
+            self.close_files()
+            shutil.rmtree(self.path)
+            os.replace(compact_path, self.path)
+            self.open()
+
+    def close_files(self):
+        """Close maps and files; callers hold the lock"""
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps.clear()
+        self.segment_file.close()
+        self.index_file.close()
+
+    def close(self):
+        with self.lock:
+            self.close_files()
+            self.lock_file.close()
+
+class SnapshotMissError(Exception):
+    """Raised by the snapshot client for objects that were never synced, shaped like a Notion 404"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.status = 404
+        self.code = 'object_not_found'
+
+def paginate(items, page_size=None, start_cursor=None):
+    """Slice a stored result list the way the Notion API paginates it"""
+    page_size = min(page_size or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    start = int(start_cursor or 0)
+    end = start + page_size
+    return {
+        'object': 'list',
+        'results': items[start:end],
+        'has_more': end < len(items),
+        'next_cursor': str(end) if end < len(items) else None
+    }
+
+class SnapshotClient:
+    """Read-only stand-in for notion_client.Client that answers from a SnapshotStore without network calls"""
+
+    def __init__(self, store):
+        self.store = store
+        self.pages = SimpleNamespace(retrieve=self.retrieve_page)
+        self.blocks = SimpleNamespace(children=SimpleNamespace(list=self.list_children))
+        self.databases = SimpleNamespace(retrieve=self.retrieve_database, query=self.query_database)
+
+    def stored(self, key, what):
+        value = self.store.get(key)
+        if value is None:
+            raise SnapshotMissError(f"{what} is not in the local snapshot; run a sync first")
+        return value
+
+    def search(self, query="", filter=None, page_size=None, start_cursor=None, **kwargs):
+        """Search the synced page and database listings by title"""
+        kind = (filter or {}).get('value')
+        items = []
+        listed = []
+        if kind in (None, 'page'):
+            pages = self.store.get('listing:pages', [])
+            items += pages
+            listed += notion_pages.list_pages_from_results(pages)
+        if kind in (None, 'database'):
+            databases = self.store.get('listing:databases', [])
+            items += databases
+            listed += notion_databases.list_databases_from_results(databases)
+        if query:
+            matching = {item['id'] for item in listed if query.lower() in item['title'].lower()}
+            items = [item for item in items if item['id'] in matching]
+        return paginate(items, page_size, start_cursor)
+
+    def retrieve_page(self, page_id, **kwargs):
+        return self.stored(f"page:{page_id}", f"Page {page_id}")
+
+    def list_children(self, block_id, page_size=None, start_cursor=None, **kwargs):
+        return paginate(self.stored(f"blocks:{block_id}", f"Block {block_id}"), page_size, start_cursor)
+
+    def retrieve_database(self, database_id, **kwargs):
+        return self.stored(f"database:{database_id}", f"Database {database_id}")
+
+    def query_database(self, database_id, page_size=None, start_cursor=None, sorts=None, **kwargs):
+        rows = self.stored(f"rows:{database_id}", f"Database {database_id}")
+        if sorts == notion_databases.NEWEST_ROW_SORT:
+            # The only sort the app asks for, to find a database's newest row edit
+            rows = sorted(rows, key=lambda row: row.get('last_edited_time') or '', reverse=True)
+        return paginate(rows, page_size, start_cursor)
+
+shared_store = None
+store_lock = threading.Lock()
+refresh_thread = None
+
+def get_snapshot_store():
+    """Return the process-wide snapshot store, opening it on first use"""
+    global shared_store
+    with store_lock:
+        if shared_store is None:
+            shared_store = SnapshotStore()
+        return shared_store
+
+def create_snapshot_client():
+    """Create a Notion client that serves everything from the shared snapshot store"""
+    return SnapshotClient(get_snapshot_store())
+
+def snapshot_age(store=None):
+    """Return seconds since the last completed sync, or None if there has been none"""
+    summary = (store or get_snapshot_store()).get(SYNC_KEY)
+    return time.time() - summary['synced_at'] if summary else None
+
+def describe_snapshot_age(store=None):
+    """Return a short human-readable snapshot age"""
+    age = snapshot_age(store)
+    if age is None:
+        return "no snapshot yet, run: python notion_snapshot.py sync"
+    if age < 60:
+        return f"synced {age:.0f} s ago"
+    if age < 3600:
+        return f"synced {age / 60:.0f} min ago"
+    if age < 86400:
+        return f"synced {age / 3600:.1f} h ago"
+    return f"synced {age / 86400:.1f} days ago"
+
+def refresh_loop(interval_seconds, source):
+    """Sync the shared snapshot from source forever"""
+    while True:
+        try:
+            sync_workspace(get_snapshot_store(), client=get_notion_client(backend=source))
+        except Exception as e:
+            print(f"Error refreshing snapshot: {str(e)}")
+        time.sleep(interval_seconds)
+
+def start_background_refresh(interval_minutes=REFRESH_MINUTES, source=SNAPSHOT_SOURCE):
+    """Keep the shared snapshot fresh from a background thread (once per process)"""
+    global refresh_thread
+    if not interval_minutes:
+        return None
+    with store_lock:
+        if refresh_thread is None:
+            refresh_thread = threading.Thread(
+                target=refresh_loop, args=(interval_minutes * 60, source), name='snapshot-refresh', daemon=True
+            )
+            refresh_thread.start()
+    return refresh_thread
+
+def describe_offline_mode():
+    """Start the background refresh when serving from the snapshot and return a status line, or None when online"""
+    if not use_snapshot_backend():
+        return None
+    start_background_refresh()
+    refresh = f", refreshing every {REFRESH_MINUTES:g} min" if REFRESH_MINUTES else ""
+    return f"Offline mode: serving from the local snapshot ({describe_snapshot_age()}{refresh})"
+
+def fetch_block_tree(client, store, block_id):
+    """Fetch and store the children of block_id, recursing into nested blocks; returns nested pages/databases"""
+    blocks = collect_paginated(client.blocks.children.list, block_id=block_id)
+    store.put(f"blocks:{block_id}", blocks)
+    children = find_child_items(blocks)
+    for block in blocks:
+        # Child pages and databases are crawled as items of their own
+        if block.get('has_children') and block.get('type') not in ('child_page', 'child_database'):
+            children += fetch_block_tree(client, store, block['id'])
+    return children
+
+def stored_child_items(store, block_id):
+    """Find the nested pages/databases of an unchanged page from its stored block tree"""
+    blocks = store.get(f"blocks:{block_id}", [])
+    children = find_child_items(blocks)
+    for block in blocks:
+        if block.get('has_children') and block.get('type') not in ('child_page', 'child_database'):
+            children += stored_child_items(store, block['id'])
+    return children
+
+def get_sync_client(client=None, rate_key='notion'):
+    """Return the client syncs fetch from, behind the shared Notion rate limit (one budget per rate_key)"""
+    if client is None:
+        # Offline mode reads from the snapshot itself, so syncs go to the configured source instead
+        client = get_notion_client(backend=SNAPSHOT_SOURCE if use_snapshot_backend() else None)
+    # The mock backend simulates its own rate limits (MOCK_NOTION_RATE_LIMIT); everything else shares ours
+    source = SNAPSHOT_SOURCE if use_snapshot_backend() else notion_backend()
+    if source != 'mock':
+        # Shared clients only retry; syncs also throttle, and a 429 pauses the whole rate_key
+        if isinstance(client, RateLimitedClient) and client.limiter is None:
+            client = client.target
+        client = RateLimitedClient(client, key=rate_key)
+    return client
+
+def sync_workspace(store, full=False, workers=SYNC_WORKERS, client=None, max_depth=CRAWL_MAX_DEPTH,
+                   max_items=CRAWL_MAX_ITEMS, rate_key='notion'):
+    """Snapshot every reachable page and database, skipping ones unchanged since the last sync"""
+    client = get_sync_client(client, rate_key)
+    with store.sync_lock:
+        return sync_from_client(store, client, full, workers, max_depth, max_items)
+
+def fetch_item(client, store, kind, item_id, last_edited=None, item=None):
+    """Fetch one page (with its block tree) or database (with its rows) into the store
+
+    item is the already retrieved page/database object, if the caller has it. Returns the stored
+    object and the nested pages/databases found in it.
+    """
+    if kind == 'database':
+        database_object = item or client.databases.retrieve(item_id)
+        rows = collect_paginated(client.databases.query, database_id=item_id)
+        store.put(f"rows:{item_id}", rows)
+        # Versioned by the newest row edit too, see notion_databases.database_version
+        version = notion_databases.newest_edit(last_edited or database_object.get('last_edited_time'), rows)
+        store.put(f"database:{item_id}", database_object, version)
+        return database_object, []
+
+    page_object = item or client.pages.retrieve(item_id)
+    children = fetch_block_tree(client, store, item_id)
+    # Written last, so a sync interrupted mid-page refetches it next time
+    store.put(f"page:{item_id}", page_object, last_edited or page_object.get('last_edited_time'))
+    return page_object, children
+
+def update_listing(store, kind, item):
+    """Add or replace one raw page/database object in the stored listing"""
+    key = f"listing:{kind}s"
+    listing = [entry for entry in store.get(key, []) if entry['id'] != item['id']]
+    store.put(key, listing + [item])
+
+def remove_item(store, kind, item_id):
+    """Drop a deleted page or database, its blocks or rows, and its listing entry from the store"""
+    if kind == 'page':
+        block_ids = [item_id]
+        while block_ids:
+            block_id = block_ids.pop()
+            block_ids += [
+                block['id'] for block in store.get(f"blocks:{block_id}", [])
+                if block.get('has_children') and block.get('type') not in ('child_page', 'child_database')
+            ]
+            store.delete(f"blocks:{block_id}")
+    else:
+        store.delete(f"rows:{item_id}")
+    store.delete(f"{kind}:{item_id}")
+    key = f"listing:{kind}s"
+    listing = store.get(key, [])
+    if any(entry['id'] == item_id for entry in listing):
+        store.put(key, [entry for entry in listing if entry['id'] != item_id])
+
+def sync_from_client(store, client, full, workers, max_depth, max_items):
+    """Do one sync pass; callers hold the store's sync_lock so overlapping refreshes can't interleave
+
+    Search results seed a crawl that also follows child_page and child_database blocks, so nested
+    items the search API doesn't return are picked up. The most recently edited items are fetched first.
+    """
+    started = time.time()
+    with span('snapshot.list'):
+        page_results = collect_paginated(client.search, query="", filter={'property': 'object', 'value': 'page'})
+        database_results = collect_paginated(client.search, query="", filter={'property': 'object', 'value': 'database'})
+    page_results = [page for page in page_results if page.get('object', 'page') == 'page']
+
+    listed = {('page', page['id']): page for page in page_results}
+    listed.update({('database', db['id']): db for db in database_results})
+    counts = {'pages_fetched': 0, 'databases_fetched': 0, 'unchanged': 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            counts[name] += 1
+
+    def visit(kind, item_id, last_edited):
+        key = f"{kind}:{item_id}"
+        item = listed.get((kind, item_id))
+        if item is None:
+            # Found through a parent's blocks: its edit time is only known after retrieving it
+            item = client.pages.retrieve(item_id) if kind == 'page' else client.databases.retrieve(item_id)
+            with lock:
+                listed[(kind, item_id)] = item
+        last_edited = item.get('last_edited_time') or last_edited
+        if kind == 'database' and not full:
+            # Row edits leave the database's own edit time alone
+            last_edited = notion_databases.database_version(item_id, last_edited, client)
+        if not full and last_edited and store.last_edited(key) == last_edited:
+            count('unchanged')
+            return stored_child_items(store, item_id) if kind == 'page' else []
+
+        _, children = fetch_item(client, store, kind, item_id, last_edited)
+        count(f"{kind}s_fetched")
+        return children
+
+    crawler = Crawler(visit, max_depth=max_depth, max_items=max_items, workers=workers)
+    for (kind, item_id), item in list(listed.items()):
+        crawler.add(kind, item_id, item.get('last_edited_time'))
+    crawl_stats = crawler.run()
+
+    # Listings include the nested items the crawl discovered, so offline mode sees them too
+    store.put('listing:pages', [item for (kind, _), item in listed.items() if kind == 'page'])
+    store.put('listing:databases', [item for (kind, _), item in listed.items() if kind == 'database'])
+
+    summary = {
+        'synced_at': started,
+        'duration_seconds': round(time.time() - started, 2),
+        'pages_total': sum(kind == 'page' for kind, _ in listed),
+        'databases_total': sum(kind == 'database' for kind, _ in listed),
+        'discovered': len(listed) - len(page_results) - len(database_results),
+        'pages_fetched': counts['pages_fetched'],
+        'databases_fetched': counts['databases_fetched'],
+        'unchanged': counts['unchanged'],
+        'failures': crawl_stats['errors'],
+        'depth_limited': crawl_stats['depth_limited'],
+        'size_limited': crawl_stats['size_limited']
+    }
+    store.put(SYNC_KEY, summary)
+    return summary
+
+def list_snapshot_pages(store):
+    """Return the page list from the last sync, in the same shape as get_accessible_pages"""
+    return notion_pages.list_pages_from_results(store.get('listing:pages', []))
+
+def list_snapshot_databases(store):
+    """Return the database list from the last sync, in the same shape as get_accessible_databases"""
+    return notion_databases.list_databases_from_results(store.get('listing:databases', []))
+
+def load_page_payload(store, page_id):
+    """Build a render_page payload from the snapshot, or None if the page was never synced"""
+    page = store.get(f"page:{page_id}")
+    if page is None:
+        return None
+    return notion_pages.build_page_payload(
+        page_id, page, store.get(f"blocks:{page_id}", []),
+        lambda block_id: store.get(f"blocks:{block_id}", [])
+    )
+
+def load_page_content(store, page_id, chunk_tokens=None):
+    """Render a page from the snapshot, like get_page_content but without any API calls"""
+    payload = load_page_payload(store, page_id)
+    if payload is None:
+        return None
+    content_data = notion_pages.render_page(payload, chunk_tokens)
+    notion_pages.record_render_timings(content_data, len(payload['blocks']))
+    return content_data
+
+def load_database_content(store, database_id):
+    """Build database content from the snapshot, like get_database_content but without any API calls"""
+    database = store.get(f"database:{database_id}")
+    if database is None:
+        return None
+    return notion_databases.build_database_content(database, store.get(f"rows:{database_id}", []))
+
+def render_workspace(store):
+    """Re-render every snapshotted page and database into one text, in the 'all' extraction layout"""
+    all_content = ""
+    for page in list_snapshot_pages(store):
+        content_data = load_page_content(store, page['id'])
+        if content_data:
+            all_content += f"\n{'='*80}\n"
+            all_content += f"PAGE: {content_data['title']}\n"
+            all_content += f"{'='*80}\n"
+            all_content += content_data['content'] + "\n\n"
+    for db in list_snapshot_databases(store):
+        content = load_database_content(store, db['id'])
+        if content:
+            all_content += f"\n{'='*80}\n"
+            all_content += notion_databases.format_database_content(content) + "\n\n"
+    return all_content
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Raw Notion JSON snapshot: sync once, re-render offline")
+    parser.add_argument('--path', default=SNAPSHOT_DIR, help="Snapshot directory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sync_parser = subparsers.add_parser('sync', help="Fetch new and changed pages and databases")
+    sync_parser.add_argument('--full', action='store_true', help="Refetch everything, changed or not")
+    sync_parser.add_argument('--workers', type=int, default=SYNC_WORKERS)
+    sync_parser.add_argument('--max-depth', type=int, default=CRAWL_MAX_DEPTH, help="Levels of nested pages to follow")
+    sync_parser.add_argument('--max-items', type=int, default=CRAWL_MAX_ITEMS, help="Stop after this many items (0: no limit)")
+    render_parser = subparsers.add_parser('render', help="Render the whole snapshot without API calls")
+    render_parser.add_argument('--output', '-o', default='all_notion_pages.txt', help="Output file, '-' for stdout")
+    subparsers.add_parser('stats', help="Show record counts and sizes")
+    subparsers.add_parser('compact', help="Drop superseded records")
+    args = parser.parse_args(argv)
+
+    store = SnapshotStore(args.path)
+    try:
+        if args.command == 'sync':
+            summary = sync_workspace(
+                store, full=args.full, workers=args.workers, max_depth=args.max_depth, max_items=args.max_items
+            )
+            print(f" Synced {summary['pages_fetched']}/{summary['pages_total']} pages and "
+                  f"{summary['databases_fetched']}/{summary['databases_total']} databases "
+                  f"({summary['discovered']} found through parent pages) "
+                  f"in {summary['duration_seconds']}s ({summary['failures']} failures)")
+        elif args.command == 'render':
+            all_content = render_workspace(store)
+            if args.output == '-':
+                sys.stdout.write(all_content)
+            else:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    f.write(all_content)
+                print(f" Rendered {len(all_content)} characters to {args.output}")
+        elif args.command == 'compact':
+            before = store.stats()
+            store.compact()
+            print(f" Compacted {before['disk_mb']} MB to {store.stats()['disk_mb']} MB")
+        print(f" Snapshot: {store.stats()}", file=sys.stderr if args.command == 'render' else sys.stdout)
+    finally:
+        store.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
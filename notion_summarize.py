@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from notion_config import load_config
+from notion_metrics import carry_trace, increment, span
+from notion_scheduler import BACKGROUND, INTERACTIVE, generate_content
+from notion_tokens import carry_usage, count_tokens, estimate_tokens, log_usage, truncate_to_tokens
+
+load_config()
+
+CACHE_DIR = os.getenv('NOTION_CACHE_DIR', '.notion_cache')
+SUMMARY_CACHE_FILE = os.path.join(CACHE_DIR, 'summaries.json')
+
+# Bounded concurrency for the map step so we stay within the Gemini quota
+MAX_CONCURRENT_SUMMARIES = int(os.getenv('GEMINI_MAX_CONCURRENT_SUMMARIES', '4'))
+# Pages longer than this are summarized chunk by chunk
+MAP_CHUNK_TOKENS = 8000
+# Summaries are combined in groups no larger than this during the reduce step
+REDUCE_BATCH_TOKENS = 12000
+
+WORKSPACE_QUERY_PATTERN = re.compile(
+    r'\b(summar(y|ise|ize)|everything|overview|all (my|of my|the) (pages|notes|work)|this (week|month|year))\b',
+    re.IGNORECASE
+)
+
+MAP_PROMPT = """Summarize the following Notion {kind} titled "{title}".
+Keep concrete facts: tasks and their status, dates, decisions, names and numbers.
+Use at most 10 short bullet points.
+
+{content}"""
+
+REDUCE_PROMPT = """You are combining summaries of Notion pages and databases to answer a question.
+
+Question: {query}
+
+Summaries:
+{summaries}
+
+Merge these into one summary that keeps every detail relevant to the question. Use short bullet points."""
+
+FINAL_PROMPT = """You are a helpful assistant with access to summaries of the user's Notion workspace:
+{summaries}
+
+Answer the following query based on the summaries:
+{query}
+
+If the information isn't in the summaries, say so. Be concise and clear."""
+
+cache_lock = threading.Lock()
+
+def is_workspace_query(query):
+    """Check whether a query asks about the workspace as a whole"""
+    return bool(WORKSPACE_QUERY_PATTERN.search(query))
+
+def load_summary_cache():
+    """Load cached per-page summaries from disk"""
+    try:
+        with open(SUMMARY_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_summary_cache(cache):
+    """Write per-page summaries back to disk"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = SUMMARY_CACHE_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_file, SUMMARY_CACHE_FILE)
+
+def generate(model, prompt, priority=BACKGROUND):
+    """Send a single prompt to Gemini and record its token usage"""
+    prompt_tokens = count_tokens(prompt)
+    response = generate_content(model, prompt, priority=priority)
+    log_usage(prompt_tokens, response)
+    return response.text.strip()
+
+def split_into_chunks(text, max_tokens):
+    """Split text on line boundaries into chunks of at most max_tokens"""
+    chunks = []
+    current = []
+    used = 0
+    for line in text.split('\n'):
+        line_tokens = estimate_tokens(line) + 1
+        if current and used + line_tokens > max_tokens:
+            chunks.append('\n'.join(current))
+            current = []
+            used = 0
+        if line_tokens > max_tokens:
+            # A single huge line (e.g. a pasted log) is cut instead of split
+            line = truncate_to_tokens(line, max_tokens)
+        current.append(line)
+        used += line_tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+def summarize_document(model, document):
+    """Summarize one page or database, chunking it when it is too long for a single prompt"""
+    kind = document.get('kind', 'page')
+    chunks = split_into_chunks(document['content'], MAP_CHUNK_TOKENS)
+    summaries = [
+        generate(model, MAP_PROMPT.format(kind=kind, title=document['title'], content=chunk))
+        for chunk in chunks
+    ]
+    if len(summaries) == 1:
+        return summaries[0]
+    combined = '\n'.join(summaries)
+    return generate(model, MAP_PROMPT.format(kind=kind, title=document['title'], content=combined))
+
+def map_summaries(model, documents, max_workers=None):
+    """Summarize every document in parallel, reusing cached summaries for unchanged pages"""
+    cache = load_summary_cache()
+    results = {}
+    pending = []
+
+    for document in documents:
+        cached = cache.get(document['id'])
+        if cached and cached.get('last_edited') == document.get('last_edited'):
+            results[document['id']] = cached['summary']
+            increment('summary_cache_hits_total')
+        else:
+            pending.append(document)
+            increment('summary_cache_misses_total')
+
+    def summarize_and_cache(document):
+        summary = summarize_document(model, document)
+        with cache_lock:
+            cache[document['id']] = {
+                'title': document['title'],
+                'last_edited': document.get('last_edited'),
+                'summary': summary
+            }
+        return summary
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers or MAX_CONCURRENT_SUMMARIES) as executor:
+            # Pool threads report spans and token usage to the query that started them
+            summarize = carry_usage(carry_trace(summarize_and_cache))
+            for document, summary in zip(pending, executor.map(summarize, pending)):
+                results[document['id']] = summary
+        save_summary_cache(cache)
+
+    return [
+        f"## {document['title']}\n{results[document['id']]}"
+        for document in documents
+        if results.get(document['id'])
+    ]
+
+def batch_by_tokens(texts, max_tokens):
+    """Group texts into batches whose combined size stays under max_tokens"""
+    batches = []
+    current = []
+    used = 0
+    for text in texts:
+        text_tokens = estimate_tokens(text)
+        if current and used + text_tokens > max_tokens:
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(text)
+        used += text_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def reduce_summaries(model, summaries, query, max_workers=None):
+    """Combine summaries level by level until they fit into a single prompt"""
+    while sum(estimate_tokens(s) for s in summaries) > REDUCE_BATCH_TOKENS and len(summaries) > 1:
+        batches = batch_by_tokens(summaries, REDUCE_BATCH_TOKENS)
+        if len(batches) == len(summaries):
+            # Every summary is already a batch on its own; merging pairs guarantees progress
+            batches = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        prompts = [
+            REDUCE_PROMPT.format(query=query, summaries='\n\n'.join(batch))
+            for batch in batches
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers or MAX_CONCURRENT_SUMMARIES) as executor:
+            summaries = list(executor.map(carry_usage(carry_trace(lambda prompt: generate(model, prompt))), prompts))
+    return '\n\n'.join(summaries)
+
+def answer_with_map_reduce(model, documents, query, max_workers=None):
+    """Answer a workspace-wide question by summarizing each document and reducing the summaries"""
+    try:
+        with span('summarize.map', documents=len(documents)):
+            summaries = map_summaries(model, documents, max_workers=max_workers)
+        if not summaries:
+            return "No content available to summarize."
+        with span('summarize.reduce', summaries=len(summaries)):
+            combined = reduce_summaries(model, summaries, query, max_workers=max_workers)
+        return generate(model, FINAL_PROMPT.format(summaries=combined, query=query), priority=INTERACTIVE)
+
+    except Exception as e:
+        return f"Error querying Gemini API: {str(e)}"
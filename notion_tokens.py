@@ -0,0 +1,232 @@
+import os
+import re
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from notion_config import load_config
+from notion_metrics import TOKEN_BUCKETS, increment, observe
+
+# Load environment variables
+load_config()
+
+logger = logging.getLogger(__name__)
+
+# Words, single digits, newlines and runs of the same symbol are counted separately,
+# which tracks the SentencePiece tokenizer used by Gemini closely for English notes
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d|\n|([^\sA-Za-z\d])\1*")
+
+# Prompt budget per query; gemini-2.0-flash accepts ~1M tokens but cost and latency grow with size
+MAX_PROMPT_TOKENS = int(os.getenv('GEMINI_MAX_PROMPT_TOKENS', '100000'))
+# Ask the API for exact counts instead of estimating locally (one extra request per count)
+EXACT_TOKEN_COUNT = os.getenv('GEMINI_EXACT_TOKEN_COUNT', '').lower() in ('1', 'true', 'yes')
+
+# Room reserved for the instructions wrapped around the content in query prompts
+PROMPT_OVERHEAD_TOKENS = 100
+
+TRUNCATION_MARKER = "[... truncated to fit the prompt budget]"
+OMITTED_NOTE = "\n\n[{} less relevant section(s) omitted to fit the prompt budget]"
+
+SECTION_SEPARATOR = "\n" + "=" * 80 + "\n"
+# Title lines the combined layout puts between two separators, ahead of the content they introduce
+SECTION_HEADER_PATTERN = re.compile(r'^(PAGE|Database): ')
+
+# Words too common in questions to say anything about which section is relevant
+QUERY_STOPWORDS = {
+    'the', 'and', 'for', 'are', 'was', 'were', 'what', 'which', 'who', 'why', 'how', 'when', 'where',
+    'about', 'with', 'that', 'this', 'these', 'those', 'from', 'have', 'has', 'does', 'did', 'can',
+    'you', 'your', 'one', 'ones', 'show', 'tell', 'list', 'give', 'please', 'more', 'any', 'all'
+}
+
+# Running totals for the current process
+usage_totals = {'requests': 0, 'input_tokens': 0, 'output_tokens': 0}
+usage_lock = threading.Lock()
+usage_state = threading.local()
+
+def estimate_tokens(text):
+    """Estimate the number of Gemini tokens in text without calling the API"""
+    if not text:
+        return 0
+
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        if piece[0].isascii() and piece[0].isalpha():
+            # Common words are a single token, long words split roughly every 6 characters
+            tokens += 1 + (len(piece) - 3) // 6 if len(piece) > 8 else 1
+        else:
+            # Repeated symbols such as "=====" dividers merge into a few tokens
+            tokens += 1 + (len(piece) - 1) // 8
+    return tokens
+
+def count_tokens(text, model=None):
+    """Count tokens in text, exactly through the model when one is given, otherwise estimated"""
+    if model is not None:
+        try:
+            return model.count_tokens(text).total_tokens
+        except Exception as e:
+            logger.warning("Exact token count failed, using estimate: %s", e)
+    return estimate_tokens(text)
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text at a line boundary so it fits into max_tokens"""
+    if max_tokens <= 0:
+        return ""
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # The marker counts against the budget too
+    max_tokens -= estimate_tokens(TRUNCATION_MARKER) + 1
+    kept = []
+    used = 0
+    for line in text.split('\n'):
+        line_tokens = estimate_tokens(line) + 1
+        if used + line_tokens > max_tokens:
+            kept.append(TRUNCATION_MARKER)
+            break
+        kept.append(line)
+        used += line_tokens
+    return '\n'.join(kept)
+
+def section_priority(section, query):
+    """Score a content section by how many query words it mentions"""
+    query_words = set(re.findall(r'\w{3,}', query.lower())) - QUERY_STOPWORDS
+    if not query_words:
+        return 0
+    section_words = set(re.findall(r'\w{3,}', section.lower()))
+    return len(query_words & section_words)
+
+def split_sections(content):
+    """Split combined content into (header, body) pairs
+
+    The "all" layout puts each "PAGE: title" or "Database: title" header between two separators, so
+    splitting on the separator alone would part titles from their content; here each header travels
+    with the body after it. Content without headers comes back as (None, body) sections.
+    """
+    sections = []
+    header = None
+    for part in content.split(SECTION_SEPARATOR):
+        if not part.strip():
+            continue
+        if SECTION_HEADER_PATTERN.match(part) and '\n' not in part.strip():
+            if header is not None:
+                sections.append((header, ""))
+            header = part.strip()
+            continue
+        sections.append((header, part))
+        header = None
+    if header is not None:
+        sections.append((header, ""))
+    return sections
+
+def join_sections(sections):
+    """Rebuild content from (header, body) pairs in the layout split_sections reads"""
+    if len(sections) == 1 and sections[0][0] is None:
+        return sections[0][1]
+    return ''.join(
+        SECTION_SEPARATOR + (f"{header}{SECTION_SEPARATOR}" if header else "") + body.strip('\n') + "\n"
+        for header, body in sections
+    )
+
+def fit_content_to_budget(content, query, max_tokens=None):
+    """Trim multi-page content to max_tokens, keeping the sections most relevant to the query
+
+    A page or database is ranked, kept and truncated together with its title header.
+    """
+    if max_tokens is None:
+        max_tokens = MAX_PROMPT_TOKENS
+    if estimate_tokens(content) <= max_tokens:
+        return content
+
+    sections = split_sections(content)
+    ranked = sorted(
+        range(len(sections)),
+        key=lambda i: section_priority(f"{sections[i][0] or ''}\n{sections[i][1]}", query),
+        reverse=True
+    )
+
+    separator_tokens = estimate_tokens(SECTION_SEPARATOR)
+    kept = {}
+    # Leave room for the note saying how much was left out
+    used = estimate_tokens(OMITTED_NOTE.format(len(sections)))
+    for i in ranked:
+        header, body = sections[i]
+        overhead = separator_tokens * (2 if header else 1) + estimate_tokens(header) + 1
+        remaining = max_tokens - used - overhead
+        body_tokens = estimate_tokens(body)
+        if body_tokens <= remaining:
+            kept[i] = (header, body)
+            used += body_tokens + overhead
+        elif remaining > 50:
+            kept[i] = (header, truncate_to_tokens(body.strip('\n'), remaining))
+            used = max_tokens
+        else:
+            break
+
+    dropped = len(sections) - len(kept)
+    # Keep the original order of the sections that made it in
+    fitted = join_sections([kept[i] for i in sorted(kept)])
+    if dropped:
+        fitted += OMITTED_NOTE.format(dropped)
+    logger.info("Context trimmed to fit budget: %d sections kept, %d dropped", len(kept), dropped)
+    return fitted
+
+def log_usage(prompt_tokens, response=None):
+    """Record input/output tokens for a Gemini request, preferring the API's own usage numbers"""
+    output_tokens = 0
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) or prompt_tokens
+        output_tokens = getattr(usage, 'candidates_token_count', None) or 0
+    elif response is not None:
+        output_tokens = estimate_tokens(getattr(response, 'text', ''))
+
+    tracker = getattr(usage_state, 'tracker', None)
+    with usage_lock:
+        # A tracker can be shared by the pool threads of one query (see carry_usage)
+        for totals in (usage_totals, tracker) if tracker is not None else (usage_totals,):
+            totals['requests'] += 1
+            totals['input_tokens'] += prompt_tokens
+            totals['output_tokens'] += output_tokens
+    increment('gemini_input_tokens_total', prompt_tokens)
+    increment('gemini_output_tokens_total', output_tokens)
+    observe('gemini_input_tokens', prompt_tokens, buckets=TOKEN_BUCKETS)
+    observe('gemini_output_tokens', output_tokens, buckets=TOKEN_BUCKETS)
+    logger.info("Gemini request: %d input tokens, %d output tokens", prompt_tokens, output_tokens)
+    return {'input_tokens': prompt_tokens, 'output_tokens': output_tokens}
+
+@contextmanager
+def track_usage():
+    """Collect the token usage of Gemini requests made on this thread, e.g. for one query"""
+    previous = getattr(usage_state, 'tracker', None)
+    tracker = {'requests': 0, 'input_tokens': 0, 'output_tokens': 0}
+    usage_state.tracker = tracker
+    try:
+        yield tracker
+    finally:
+        usage_state.tracker = previous
+
+def carry_usage(func):
+    """Wrap func so Gemini requests it makes on another thread, e.g. a pool worker, count toward this thread's tracker"""
+    tracker = getattr(usage_state, 'tracker', None)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(usage_state, 'tracker', None)
+        usage_state.tracker = tracker
+        try:
+            return func(*args, **kwargs)
+        finally:
+            usage_state.tracker = previous
+    return wrapper
+
+def content_budget(query):
+    """Return how many tokens of Notion content fit into a prompt for this query"""
+    return MAX_PROMPT_TOKENS - estimate_tokens(query) - PROMPT_OVERHEAD_TOKENS
+
+def describe_context_size(content):
+    """Return a short human-readable summary of context size against the budget"""
+    tokens = estimate_tokens(content)
+    status = "over budget, will be trimmed" if tokens > MAX_PROMPT_TOKENS else "within budget"
+    return f"{tokens:,} tokens (budget {MAX_PROMPT_TOKENS:,}, {status})"
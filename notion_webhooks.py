@@ -0,0 +1,407 @@
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import notion_pages
+import notion_databases
+from notion_config import load_config
+from notion_metrics import increment, observe, span, start_metrics_server
+from notion_snapshot import (
+    SNAPSHOT_DIR, SnapshotStore, fetch_item, get_sync_client, remove_item, update_listing
+)
+
+logger = logging.getLogger(__name__)
+
+load_config()
+
+WEBHOOK_PORT = os.getenv('NOTION_WEBHOOK_PORT')
+# The verification_token Notion sends when the subscription is created; signs every later event
+WEBHOOK_SECRET = os.getenv('NOTION_WEBHOOK_SECRET')
+# An item is refetched once no event for it arrived for this long...
+DEBOUNCE_SECONDS = float(os.getenv('NOTION_WEBHOOK_DEBOUNCE_SECONDS', '2'))
+# ...or this long after its first pending event, so an item edited non-stop still gets refreshed
+MAX_DELAY_SECONDS = float(os.getenv('NOTION_WEBHOOK_MAX_DELAY_SECONDS', '30'))
+SIGNATURE_HEADER = 'X-Notion-Signature'
+# Where the verification token is saved for the operator, readable by the owner only
+TOKEN_FILE = os.getenv(
+    'NOTION_WEBHOOK_TOKEN_FILE', os.path.join(os.getenv('NOTION_CACHE_DIR', '.notion_cache'), 'webhook_verification_token')
+)
+
+# Events that change nothing we store or render
+IGNORED_EVENTS = ('locked', 'unlocked')
+
+change_listeners = []
+receiver_lock = threading.Lock()
+shared_receiver = None
+
+def add_change_listener(listener):
+    """Call listener(kind, item_id, listing) after every applied change; listing is None for deletions"""
+    change_listeners.append(listener)
+
+def sign(body, secret):
+    """Return the X-Notion-Signature value for a request body"""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+def verify_signature(body, signature, secret):
+    """Check a request body against its X-Notion-Signature header"""
+    return bool(signature) and hmac.compare_digest(sign(body, secret), signature)
+
+def save_verification_token(token, path=None):
+    """Write the verification token to a file only the owner can read and return the path"""
+    path = path or TOKEN_FILE
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # The mode only applies when the file is created
+    os.fchmod(descriptor, 0o600)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+        f.write(token + "\n")
+    return path
+
+def parse_event(event):
+    """Turn a Notion webhook event into the changes it implies: dicts with kind, id and action
+
+    Page and database events become a refresh of that item, or a delete for *.deleted events. A page
+    that lives in a database also refreshes the database, since its rows are stored with it.
+    """
+    event_type = event.get('type', '')
+    entity = event.get('entity') or {}
+    kind = {'page': 'page', 'database': 'database', 'data_source': 'database'}.get(entity.get('type'))
+    if kind is None or not entity.get('id') or event_type.rsplit('.', 1)[-1] in IGNORED_EVENTS:
+        return []
+    action = 'delete' if event_type.endswith('.deleted') else 'refresh'
+    changes = [{'kind': kind, 'id': entity['id'], 'action': action}]
+    parent = (event.get('data') or {}).get('parent') or {}
+    if kind == 'page' and parent.get('type') in ('database', 'data_source') and parent.get('id'):
+        changes.append({'kind': 'database', 'id': parent['id'], 'action': 'refresh'})
+    return changes
+
+def is_not_found(error):
+    """Check whether an API error means the item is gone or no longer shared with the integration"""
+    return getattr(error, 'status', None) == 404 or getattr(error, 'code', None) == 'object_not_found'
+
+class EventCoalescer:
+    """Collects changes per item until the item has been quiet for a while, so a burst costs one refetch"""
+
+    def __init__(self, debounce_seconds=DEBOUNCE_SECONDS, max_delay_seconds=MAX_DELAY_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {'received': 0, 'coalesced': 0, 'flushed': 0}
+
+    def add(self, change, now=None):
+        """Queue a change; a later change to the same item replaces its action"""
+        now = now or time.monotonic()
+        key = (change['kind'], change['id'])
+        with self.lock:
+            self.stats['received'] += 1
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = dict(change, first_seen=now, last_seen=now, events=1)
+                return
+            self.stats['coalesced'] += 1
+            increment('webhook_events_coalesced_total')
+            entry.update(action=change['action'], last_seen=now, events=entry['events'] + 1)
+
+    def due(self, now=None):
+        """Remove and return the changes that are ready to apply"""
+        now = now or time.monotonic()
+        with self.lock:
+            ready = [
+                key for key, entry in self.pending.items()
+                if now - entry['last_seen'] >= self.debounce_seconds or now - entry['first_seen'] >= self.max_delay_seconds
+            ]
+            changes = [self.pending.pop(key) for key in ready]
+            self.stats['flushed'] += len(changes)
+        return changes
+
+    def drain(self):
+        """Remove and return every pending change"""
+        with self.lock:
+            changes = list(self.pending.values())
+            self.pending.clear()
+            self.stats['flushed'] += len(changes)
+        return changes
+
+    def __len__(self):
+        return len(self.pending)
+
+def apply_change(change, client, store=None):
+    """Refetch or drop one changed item, then notify the listeners; returns nested items new to the store"""
+    kind, item_id = change['kind'], change['id']
+    item = None
+    if change['action'] != 'delete':
+        try:
+            item = client.pages.retrieve(item_id) if kind == 'page' else client.databases.retrieve(item_id)
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+        if item is not None and (item.get('archived') or item.get('in_trash')):
+            item = None
+
+    new_children = []
+    if store is not None:
+        with store.sync_lock:
+            if item is None:
+                remove_item(store, kind, item_id)
+            else:
+                # Always refetch: last_edited_time is rounded to the minute, so it can't tell two edits apart
+                _, children = fetch_item(client, store, kind, item_id, item=item)
+                update_listing(store, kind, item)
+                new_children = [child for child in children if store.get(f"{child[0]}:{child[1]}") is None]
+
+    if item is None:
+        listing = None
+    elif kind == 'page':
+        listing = (notion_pages.list_pages_from_results([dict(item, object='page')]) or [None])[0]
+    else:
+        listing = notion_databases.list_databases_from_results([item])[0]
+    for listener in change_listeners:
+        try:
+            listener(kind, item_id, listing)
+        except Exception as e:
+            logger.warning("Change listener failed for %s %s: %s", kind, item_id, e)
+    increment('webhook_changes_applied_total', kind=kind, action='delete' if item is None else 'refresh')
+    return new_children
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accepts POSTed Notion events and answers right away; the work happens on the receiver's worker"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, response = self.server.receiver.handle(body, self.headers.get(SIGNATURE_HEADER))
+        self.send_json(status, response)
+
+    def do_GET(self):
+        if not self.path.startswith('/stats'):
+            self.send_error(404)
+            return
+        self.send_json(200, self.server.receiver.describe())
+
+    def send_json(self, status, response):
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class WebhookReceiver:
+    """Receives Notion change events, coalesces them per item and applies them from one background worker"""
+
+    def __init__(self, client=None, store=None, secret=WEBHOOK_SECRET, debounce_seconds=DEBOUNCE_SECONDS,
+                 max_delay_seconds=MAX_DELAY_SECONDS):
+        self.client = client or get_sync_client()
+        self.store = store
+        self.secret = secret
+        self.coalescer = EventCoalescer(debounce_seconds, max_delay_seconds)
+        self.stats = {'events': 0, 'ignored': 0, 'rejected': 0, 'applied': 0, 'failed': 0}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+        self.worker = None
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def handle(self, body, signature=None):
+        """Validate and queue one request body; returns an HTTP status and a JSON response"""
+        try:
+            event = json.loads(body or b'{}')
+        except ValueError:
+            return 400, {'error': 'invalid JSON'}
+        if 'verification_token' in event:
+            # Sent once, unsigned, when the subscription is created. Once a secret is configured the
+            # handshake is over, and an unsigned body must not replace the saved token
+            if self.secret:
+                self.count('rejected')
+                increment('webhook_events_rejected_total')
+                return 401, {'error': 'verification already completed'}
+            # It becomes the signing secret, so it stays out of logs
+            path = save_verification_token(event['verification_token'])
+            print(f" Notion webhook verification token saved to {path} "
+                  f"(set NOTION_WEBHOOK_SECRET to it and paste it into the integration settings)")
+            return 200, {}
+        if self.secret and not verify_signature(body, signature, self.secret):
+            self.count('rejected')
+            increment('webhook_events_rejected_total')
+            return 401, {'error': 'invalid signature'}
+
+        self.count('events')
+        increment('webhook_events_total', type=event.get('type', 'unknown'))
+        changes = parse_event(event)
+        if not changes:
+            self.count('ignored')
+        for change in changes:
+            self.coalescer.add(change)
+        return 200, {'queued': len(changes)}
+
+    def process(self, changes):
+        """Apply changes; nested items they reveal are queued like changes of their own"""
+        for change in changes:
+            try:
+                with span('webhook.apply', kind=change['kind']):
+                    new_children = apply_change(change, self.client, self.store)
+                observe('webhook_apply_delay_seconds', time.monotonic() - change['first_seen'])
+                self.count('applied')
+                for kind, item_id, _ in new_children:
+                    self.coalescer.add({'kind': kind, 'id': item_id, 'action': 'refresh'})
+            except Exception as e:
+                self.count('failed')
+                logger.warning("Error applying %s of %s %s: %s", change['action'], change['kind'], change['id'], e)
+
+    def run_worker(self):
+        interval = min(0.5, max(self.coalescer.debounce_seconds / 2, 0.05))
+        while not self.stop_event.wait(interval):
+            self.process(self.coalescer.due())
+
+    def flush(self):
+        """Apply everything still pending, regardless of the debounce window"""
+        self.process(self.coalescer.drain())
+
+    def start(self, port=WEBHOOK_PORT, host='127.0.0.1'):
+        """Start the HTTP endpoint and the worker in background threads"""
+        self.server = ThreadingHTTPServer((host, int(port)), WebhookHandler)
+        self.server.receiver = self
+        threading.Thread(target=self.server.serve_forever, name='webhook-server', daemon=True).start()
+        self.worker = threading.Thread(target=self.run_worker, name='webhook-worker', daemon=True)
+        self.worker.start()
+        return self
+
+    def stop(self):
+        """Stop accepting events and apply what is still pending"""
+        if self.server is not None:
+            self.server.shutdown()
+        self.stop_event.set()
+        if self.worker is not None:
+            self.worker.join()
+        self.flush()
+
+    def describe(self):
+        """Return receiver and coalescing counters"""
+        return dict(self.stats, pending=len(self.coalescer), **self.coalescer.stats)
+
+def start_webhook_receiver(port=None, store=None):
+    """Start the webhook endpoint in the background (once per process) when NOTION_WEBHOOK_PORT is set"""
+    global shared_receiver
+    port = port or WEBHOOK_PORT
+    if not port:
+        return None
+    with receiver_lock:
+        if shared_receiver is None:
+            shared_receiver = WebhookReceiver(store=store).start(port)
+    return shared_receiver
+
+def sample_events(store, count, items, burst_seconds=1.0, seed=0):
+    """Build synthetic events for replaying: count edits spread over a few snapshotted items, in bursts"""
+    rng = random.Random(seed)
+    candidates = [('page', page['id']) for page in store.get('listing:pages', [])]
+    candidates += [('database', db['id']) for db in store.get('listing:databases', [])]
+    chosen = rng.sample(candidates, min(items, len(candidates)))
+    started = datetime.now(timezone.utc)
+    events = []
+    for i in range(count):
+        kind, item_id = rng.choice(chosen)
+        timestamp = started + timedelta(seconds=i * burst_seconds / max(count, 1))
+        events.append({
+            'id': f"sample-{i}",
+            'timestamp': timestamp.isoformat().replace('+00:00', 'Z'),
+            'type': f"{kind}.content_updated",
+            'entity': {'id': item_id, 'type': kind},
+            'data': {}
+        })
+    return events
+
+def replay_events(events, url, secret=None, speed=1.0):
+    """POST events to a receiver, keeping their original spacing divided by speed (0: as fast as possible)"""
+    previous = None
+    statuses = {}
+    for event in events:
+        timestamp = datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00')) if event.get('timestamp') else None
+        if speed and previous and timestamp:
+            time.sleep(max(0.0, (timestamp - previous).total_seconds() / speed))
+        previous = timestamp or previous
+        body = json.dumps(event).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if secret:
+            headers[SIGNATURE_HEADER] = sign(body, secret)
+        request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        statuses[status] = statuses.get(status, 0) + 1
+    return statuses
+
+def read_events(path):
+    """Read events from a JSON Lines file, or stdin for '-'"""
+    lines = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        return [json.loads(line) for line in lines if line.strip()]
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive Notion change events and refetch only what changed")
+    parser.add_argument('--path', default=SNAPSHOT_DIR, help="Snapshot directory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Run the webhook endpoint, applying changes to the snapshot")
+    serve_parser.add_argument('--port', type=int, default=int(WEBHOOK_PORT or 8790))
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, help="Quiet seconds before a refetch")
+    sample_parser = subparsers.add_parser('sample', help="Write synthetic events for snapshotted items as JSON Lines")
+    sample_parser.add_argument('--count', type=int, default=100, help="Number of events")
+    sample_parser.add_argument('--items', type=int, default=5, help="Number of distinct items they touch")
+    sample_parser.add_argument('--burst-seconds', type=float, default=1.0, help="Time span of the events")
+    replay_parser = subparsers.add_parser('replay', help="POST recorded events to a receiver")
+    replay_parser.add_argument('events', help="JSON Lines file of events, '-' for stdin")
+    replay_parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT or 8790}/")
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="Replay speed-up; 0 sends without waiting")
+    args = parser.parse_args(argv)
+
+    if args.command == 'replay':
+        statuses = replay_events(read_events(args.events), args.url, WEBHOOK_SECRET, args.speed)
+        print(f" Replayed: {', '.join(f'{count} × HTTP {status}' for status, count in sorted(statuses.items()))}")
+        return 0
+
+    store = SnapshotStore(args.path)
+    try:
+        if args.command == 'sample':
+            for event in sample_events(store, args.count, args.items, args.burst_seconds):
+                print(json.dumps(event))
+            return 0
+
+        add_change_listener(lambda kind, item_id, listing: print(
+            f" {'Refreshed' if listing else 'Removed'} {kind} {listing['title'] if listing else item_id}"
+        ))
+        start_metrics_server()
+        receiver = WebhookReceiver(store=store, debounce_seconds=args.debounce).start(args.port, args.host)
+        print(f" Listening for Notion webhooks on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            receiver.stop()
+            print(f" Webhooks: {receiver.describe()}")
+    finally:
+        store.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
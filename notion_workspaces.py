@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import notion_databases
+from notion_config import get_notion_client, get_workspace_tokens, load_config, use_snapshot_backend
+from notion_index import WorkspaceIndex
+from notion_metrics import start_metrics_server
+from notion_snapshot import (
+    SNAPSHOT_DIR, SNAPSHOT_SOURCE, SYNC_WORKERS, SnapshotStore, describe_snapshot_age, list_snapshot_databases,
+    list_snapshot_pages, load_database_content, load_page_content, sync_workspace
+)
+
+load_config()
+
+# Each workspace's snapshot is a store of its own under this directory
+SHARDS_DIR = os.getenv('NOTION_SHARDS_DIR', os.path.join(SNAPSHOT_DIR, 'workspaces'))
+
+shard_stores = {}
+shards_lock = threading.Lock()
+
+def workspace_names(selectors=None):
+    """Return the configured workspaces picked by name; none or 'all' picks every one"""
+    names = list(get_workspace_tokens())
+    if not selectors or 'all' in selectors:
+        return names
+    unknown = [selector for selector in selectors if selector not in names]
+    if unknown:
+        raise ValueError(f"Unknown workspace(s): {', '.join(unknown)} (configured: {', '.join(names) or 'none'})")
+    return [name for name in names if name in selectors]
+
+def get_shard_store(name):
+    """Return the snapshot store of one workspace, opening it on first use"""
+    with shards_lock:
+        if name not in shard_stores:
+            shard_stores[name] = SnapshotStore(os.path.join(SHARDS_DIR, name))
+        return shard_stores[name]
+
+def get_workspace_client(name):
+    """Return the Notion client for one workspace's token"""
+    # Offline mode reads from the snapshot itself, so syncs go to the configured source instead
+    return get_notion_client(token=get_workspace_tokens()[name], backend=SNAPSHOT_SOURCE if use_snapshot_backend() else None)
+
+def sync_shard(name, full=False, workers=SYNC_WORKERS):
+    """Sync one workspace into its own store, under its own rate budget"""
+    return sync_workspace(
+        get_shard_store(name), full=full, workers=workers, client=get_workspace_client(name), rate_key=f"notion:{name}"
+    )
+
+def sync_workspaces(names, full=False, workers=SYNC_WORKERS):
+    """Sync workspaces in parallel and return {name: sync summary}; a failed workspace reports its error
+
+    Workspaces share nothing but the process: every token has its own client, rate limit bucket,
+    crawler threads and store, so adding a token adds its full request budget.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+        futures = {name: executor.submit(sync_shard, name, full, workers) for name in names}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            results[name] = {'error': str(e)}
+    return results
+
+def list_shard_items(names, kinds=('page', 'database')):
+    """Return the snapshotted items of these workspaces, tagged with kind and workspace
+
+    Pages come before databases, each merged across workspaces newest first.
+    """
+    items = []
+    for kind in ('page', 'database'):
+        if kind not in kinds:
+            continue
+        merged = []
+        for name in names:
+            store = get_shard_store(name)
+            listing = list_snapshot_pages(store) if kind == 'page' else list_snapshot_databases(store)
+            merged.extend(dict(item, kind=kind, workspace=name) for item in listing)
+        items.extend(sorted(merged, key=lambda item: item.get('last_edited_time', ''), reverse=True))
+    return items
+
+def shard_document(item, label=False):
+    """Render one snapshotted item as a document; label adds the workspace name to the title"""
+    store = get_shard_store(item['workspace'])
+    if item['kind'] == 'page':
+        content_data = load_page_content(store, item['id'])
+        if not content_data:
+            return None
+        title, content = content_data['title'], content_data['content']
+    else:
+        database_content = load_database_content(store, item['id'])
+        if not database_content:
+            return None
+        title, content = item['title'], notion_databases.format_database_content(database_content)
+    # Databases are stored under their newest row edit, which keys the summary cache
+    last_edited = store.last_edited(f"{item['kind']}:{item['id']}") or item.get('last_edited_time', '')
+    return {
+        'id': item['id'],
+        'title': f"{title} [{item['workspace']}]" if label else title,
+        'content': content,
+        'last_edited': last_edited,
+        'kind': item['kind'],
+        'workspace': item['workspace']
+    }
+
+def load_shard_documents(items, workers=SYNC_WORKERS):
+    """Render items from one or many workspaces, in order; titles name the workspace when there are several"""
+    label = len({item['workspace'] for item in items}) > 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        documents = executor.map(lambda item: shard_document(item, label), items)
+        return [document for document in documents if document]
+
+def build_shard_index(names):
+    """Index the listings of several workspaces together, for search across shards"""
+    items = list_shard_items(names)
+    return WorkspaceIndex(
+        [item for item in items if item['kind'] == 'page'],
+        [item for item in items if item['kind'] == 'database']
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync and search several Notion workspaces (NOTION_TOKENS)")
+    parser.add_argument('--workspace', '-w', action='append', default=[],
+                        help="Workspace name from NOTION_TOKENS; repeatable; 'all' for every one (default)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Show the configured workspaces and their snapshots")
+    sync_parser = subparsers.add_parser('sync', help="Sync workspaces in parallel, one store each")
+    sync_parser.add_argument('--full', action='store_true', help="Refetch everything, changed or not")
+    sync_parser.add_argument('--workers', type=int, default=SYNC_WORKERS, help="Crawler threads per workspace")
+    search_parser = subparsers.add_parser('search', help="Search page and database titles across workspaces")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    try:
+        names = workspace_names(args.workspace)
+    except ValueError as e:
+        print(f" {str(e)}")
+        return 1
+    if not names:
+        print(" No workspaces configured: set NOTION_TOKENS=name=token,other=token")
+        return 1
+
+    if args.command == 'list':
+        for name in names:
+            store = get_shard_store(name)
+            stats = store.stats()
+            print(f"{name}\t{stats['pages']} pages\t{stats['databases']} databases\t{describe_snapshot_age(store)}")
+    elif args.command == 'sync':
+        start_metrics_server()
+        started = time.time()
+        results = sync_workspaces(names, args.full, args.workers)
+        elapsed = time.time() - started
+        fetched = 0
+        for name, summary in results.items():
+            if 'error' in summary:
+                print(f" {name}: failed: {summary['error']}")
+                continue
+            fetched += summary['pages_fetched'] + summary['databases_fetched']
+            print(f" {name}: {summary['pages_fetched']}/{summary['pages_total']} pages and "
+                  f"{summary['databases_fetched']}/{summary['databases_total']} databases "
+                  f"in {summary['duration_seconds']}s ({summary['failures']} failures)")
+        print(f" Synced {len(results)} workspaces in {elapsed:.2f}s "
+              f"({fetched / elapsed if elapsed else 0:.1f} items/s overall)")
+        if any('error' in summary for summary in results.values()):
+            return 1
+    elif args.command == 'search':
+        for item in build_shard_index(names).search(args.query, limit=args.limit):
+            print(f"{item['id']}\t{item['workspace']}\t{item['kind']}\t{item['title']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
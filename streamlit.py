@@ -1,25 +1,36 @@
 import streamlit as st
 import os
-import importlib.util
-import sys
 import re
+import html
+import itertools
+import threading
 from datetime import datetime
-import google.generativeai as genai
-from dotenv import load_dotenv
+import notion_pages
+import notion_databases
+from notion_cache import ContentCache
+from notion_config import get_gemini_model, load_config, use_mock_backend, use_snapshot_backend
+from notion_conversation import ConversationMemory
+from notion_compress import describe_compression, pop_last_compression, prepare_context
+from notion_dedup import combine_documents, describe_dedup
+from notion_history import HISTORY_PAGE_SIZE, ChatHistory
+from notion_index import WorkspaceIndex
+from notion_metrics import format_breakdown, query_trace, span, start_metrics_server
+from notion_scheduler import generate_content
+from notion_snapshot import describe_offline_mode, get_snapshot_store, sync_workspace
+from notion_summarize import answer_with_map_reduce, is_workspace_query
+from notion_tokens import (
+    EXACT_TOKEN_COUNT, content_budget, count_tokens, describe_context_size,
+    log_usage, usage_totals
+)
+from notion_webhooks import add_change_listener, start_webhook_receiver
 
-# Load environment variables
-load_dotenv(override=True)
+# Load environment variables (only the first run in this process reads .env)
+load_config()
 
-# Dynamically import notion_pages.py and notion_databases.py
-spec = importlib.util.spec_from_file_location("notion_pages", "notion_pages.py")
-notion_pages = importlib.util.module_from_spec(spec)
-sys.modules["notion_pages"] = notion_pages
-spec.loader.exec_module(notion_pages)
-
-spec = importlib.util.spec_from_file_location("notion_databases", "notion_databases.py")
-notion_databases = importlib.util.module_from_spec(spec)
-sys.modules["notion_databases"] = notion_databases
-spec.loader.exec_module(notion_databases)
+# How long workspace listings are shared before they are fetched again
+LISTING_TTL_SECONDS = int(os.getenv('NOTION_LISTING_TTL_SECONDS', '300'))
+# Items offered in a select box when there is no search text (most recently edited first)
+MAX_SELECT_OPTIONS = 200
 
 # Custom CSS for modern styling
 st.markdown("""
@@ -74,19 +85,128 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
+def get_cached_model(api_key):
+    """Create the Gemini model once per server process and share it across sessions"""
+    return get_gemini_model(api_key)
+
+@st.cache_resource(show_spinner=False)
+def start_metrics():
+    """Start the Prometheus-style metrics endpoint once per server process (NOTION_METRICS_PORT)"""
+    return start_metrics_server()
+
+@st.cache_resource(show_spinner=False)
+def get_content_cache():
+    """Return the content cache shared by every session"""
+    return ContentCache()
+
+@st.cache_resource(show_spinner=False)
+def get_chat_history():
+    """Return the chat history store shared by every session"""
+    return ChatHistory()
+
+def start_chat_session(history, memory):
+    """Pick up the session named in the URL, restoring recent turns into memory, or start a new one"""
+    session_id = st.query_params.get("session")
+    if session_id and history.has_session(session_id):
+        messages = history.latest(session_id, memory.recent_turns)
+        memory.load_turns({'query': message['query'], 'response': message['response']} for message in reversed(messages))
+    else:
+        session_id = history.create_session()
+        # Kept in the URL so a reload (or a bookmark) finds the same conversation
+        st.query_params["session"] = session_id
+    st.session_state["session_id"] = session_id
+    st.session_state["history_limit"] = HISTORY_PAGE_SIZE
+
+@st.cache_resource(show_spinner=False)
+def start_offline_mode():
+    """Start the snapshot background refresh once per server process when NOTION_BACKEND=snapshot"""
+    return describe_offline_mode() is not None
+
+@st.cache_resource(show_spinner=False)
+def start_webhooks():
+    """Start the Notion webhook endpoint once per server process when NOTION_WEBHOOK_PORT is set"""
+    receiver = start_webhook_receiver(store=get_snapshot_store() if use_snapshot_backend() else None)
+    if receiver is not None:
+        add_change_listener(apply_workspace_change)
+    return receiver
+
+@st.cache_resource(show_spinner=False)
+def get_listing_versions():
+    """Return the version counter of the shared listing; every listing gets a new number, also across refreshes"""
+    return itertools.count(1)
+
+def apply_workspace_change(kind, item_id, listing):
+    """Keep the shared listings, index and content cache in step with a page or database change
+
+    Runs on the webhook thread: the listing is replaced with a changed copy under a new version rather
+    than modified, so a script run keeps the one it started with; the index locks on its own.
+    """
+    get_content_cache().invalidate(item_id)
+    shared = get_workspace_listing()
+    key = 'pages' if kind == 'page' else 'databases'
+    with shared['lock']:
+        workspace = shared['listing']
+        items = [item for item in workspace[key] if item['id'] != item_id] + ([listing] if listing else [])
+        if listing:
+            workspace['index'].add(**{key: [listing]})
+        else:
+            workspace['index'].remove(item_id)
+        shared['listing'] = dict(workspace, **{key: items, 'version': next(get_listing_versions())})
+
+@st.cache_resource(ttl=LISTING_TTL_SECONDS, show_spinner=False)
+def get_workspace_listing():
+    """Fetch page and database listings and index them by id, shared across sessions"""
+    pages = notion_pages.get_accessible_pages()
+    databases = notion_databases.get_accessible_databases()
+    return {
+        'listing': {
+            'pages': pages,
+            'databases': databases,
+            'index': WorkspaceIndex(pages, databases),
+            'version': next(get_listing_versions())
+        },
+        'lock': threading.Lock()
+    }
+
+def list_workspace():
+    """Return the current shared listing: pages, databases, their index and a version"""
+    return get_workspace_listing()['listing']
+
 def configure_gemini():
     """Configure the Gemini API client"""
     api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
+    if not api_key and not use_mock_backend('GEMINI'):
         st.error("GOOGLE_API_KEY environment variable is not set")
         return None
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-2.0-flash')
+    return get_cached_model(api_key)
+
+def load_page(page):
+    """Get page content through the shared cache, keyed by id and last edit time"""
+    return get_content_cache().get_or_load(
+        ('page', page['id'], page['last_edited_time']),
+        lambda: notion_pages.get_page_content(page['id'])
+    )
 
-def query_gemini(model, content, query):
+def load_database(db, version):
+    """Get formatted database content through the shared cache, keyed by id and version (newest row edit)"""
+    def fetch():
+        content = notion_databases.get_database_content(db['id'])
+        return notion_databases.format_database_content(content) if content else None
+
+    return get_content_cache().get_or_load(('database', db['id'], version), fetch)
+
+def query_gemini(model, content, query, memory=None):
     """Query the Gemini API with Notion content as context"""
     try:
-        prompt = f"""You are a helpful assistant with access to the following Notion content:
+        # Keep the prompt inside the token budget, dropping the least relevant sections first
+        with span('prompt.build'):
+            if memory is not None:
+                # Include earlier turns, under a fixed history budget
+                prompt = memory.build_prompt(content, query)
+            else:
+                content = prepare_context(content, query, content_budget(query))
+                prompt = f"""You are a helpful assistant with access to the following Notion content:
 {content}
 
 Answer the following query based on the content:
@@ -94,63 +214,88 @@ Answer the following query based on the content:
 
 If the query asks for specific information (e.g., to-do lists, definitions, or database entries), extract and format it clearly. If the information isn't in the content, say so. Be concise and clear."""
         
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        prompt_tokens = count_tokens(prompt, model if EXACT_TOKEN_COUNT else None)
+        response = generate_content(model, prompt)
+        log_usage(prompt_tokens, response)
+        answer = response.text.strip()
+        if memory is not None:
+            memory.add_turn(query, answer)
+        return answer
     
     except Exception as e:
         return f"Error querying Gemini API: {str(e)}"
 
-def load_content(pages, databases, content_type, selected_page, selected_db):
-    """Load content based on selections"""
-    all_content = ""
+def load_content(workspace, content_type, page_ids, db_ids):
+    """Load content for the selected ids (none selected means all): combined text, documents and a dedup summary"""
+    documents = []
+    index = workspace['index']
     
-    if content_type in ["Pages", "Both"] and pages:
-        if selected_page == "All Pages":
-            for i, page in enumerate(pages, 1):
-                st.sidebar.text(f"Processing page {i}/{len(pages)}: {page['title']}")
-                content_data = notion_pages.get_page_content(page['id'])
-                if content_data:
-                    all_content += f"\n{'='*80}\nPAGE: {content_data['title']}\n{'='*80}\n{content_data['content']}\n\n"
-        else:
-            page_index = [f"{page['title']} (Last edited: {page['last_edited_time'][:10]})" for page in pages].index(selected_page)
-            selected_page_data = pages[page_index]
-            content_data = notion_pages.get_page_content(selected_page_data['id'])
+    if content_type in ["Pages", "Both"]:
+        pages = index.select(page_ids) if page_ids else index.recent('page')
+        for i, page in enumerate(pages, 1):
+            st.sidebar.text(f"Processing page {i}/{len(pages)}: {page['title']}")
+            content_data = load_page(page)
             if content_data:
-                all_content += f"\n{'='*80}\nPAGE: {content_data['title']}\n{'='*80}\n{content_data['content']}\n\n"
-
-    if content_type in ["Databases", "Both"] and databases:
-        if selected_db == "All Databases":
-            for i, db in enumerate(databases, 1):
-                st.sidebar.text(f"Processing database {i}/{len(databases)}: {db['title']}")
-                content = notion_databases.get_database_content(db['id'])
-                if content:
-                    formatted_content = notion_databases.format_database_content(content)
-                    all_content += f"\n{'='*80}\n{formatted_content}\n\n"
-        else:
-            db_index = [f"{db['title']} (Last edited: {db['last_edited_time'][:10]})" for db in databases].index(selected_db)
-            selected_db_data = databases[db_index]
-            content = notion_databases.get_database_content(selected_db_data['id'])
-            if content:
-                formatted_content = notion_databases.format_database_content(content)
-                all_content += f"\n{'='*80}\n{formatted_content}\n\n"
+                documents.append({
+                    'id': page['id'],
+                    'title': content_data['title'],
+                    'content': content_data['content'],
+                    'last_edited': page['last_edited_time'],
+                    'kind': 'page'
+                })
+
+    if content_type in ["Databases", "Both"]:
+        databases = index.select(db_ids) if db_ids else index.recent('database')
+        for i, db in enumerate(databases, 1):
+            st.sidebar.text(f"Processing database {i}/{len(databases)}: {db['title']}")
+            # The database's own edit time doesn't change with its rows; one small query finds the newest row
+            version = notion_databases.database_version(db['id'], db['last_edited_time'])
+            formatted_content = load_database(db, version)
+            if formatted_content:
+                documents.append({
+                    'id': db['id'],
+                    'title': db['title'],
+                    'content': formatted_content,
+                    'last_edited': version,
+                    'kind': 'database'
+                })
     
-    return all_content
+    # Repeated passages (templates, synced blocks, pages that are also rows) are sent once per prompt
+    all_content, chunk_index = combine_documents(documents)
+    return all_content, documents, describe_dedup(chunk_index, all_content)
+
+def select_ids(index, kind, label):
+    """Search box plus id-based multi-select in the sidebar; an empty selection means all items of this kind"""
+    search = st.sidebar.text_input(f"Search {label}", key=f"{kind}_search", placeholder="Type part of a title...")
+    selected = st.session_state.get(f"{kind}_ids", [])
+    options = [item['id'] for item in index.search(search, kind, MAX_SELECT_OPTIONS)]
+    # Keep the current selection selectable even when the search no longer matches it
+    options += [item_id for item_id in selected if item_id not in options]
+    return st.sidebar.multiselect(
+        f"Select {label} (leave empty for all)", options, format_func=index.label, key=f"{kind}_ids"
+    )
 
 def main():
+    start_metrics()
+    start_offline_mode()
+    receiver = start_webhooks()
     st.title("🚀 Notion + Gemini AI Chat")
     st.markdown("Interact with your Notion content using Google's Gemini 2.0 Flash API. Select content type, ask questions, and get insights!")
 
+    # Workspace listings are shared by all sessions and refreshed every few minutes
+    with st.spinner("🔍 Fetching Notion pages and databases..."):
+        workspace = list_workspace()
+
     # Initialize session state
-    if "pages" not in st.session_state:
-        with st.spinner("🔍 Fetching Notion pages..."):
-            st.session_state["pages"] = notion_pages.get_accessible_pages()
-    if "databases" not in st.session_state:
-        with st.spinner("🔍 Fetching Notion databases..."):
-            st.session_state["databases"] = notion_databases.get_accessible_databases()
     if "selected_content" not in st.session_state:
         st.session_state["selected_content"] = ""
-    if "chat_history" not in st.session_state:
-        st.session_state["chat_history"] = []
+    if "documents" not in st.session_state:
+        st.session_state["documents"] = []
+    if "conversation" not in st.session_state:
+        st.session_state["conversation"] = ConversationMemory()
+    history = get_chat_history()
+    if "session_id" not in st.session_state:
+        start_chat_session(history, st.session_state["conversation"])
     if "last_selections" not in st.session_state:
         st.session_state["last_selections"] = {}
 
@@ -168,68 +313,131 @@ def main():
     if not model:
         st.sidebar.warning("Please enter a valid Google API key to proceed.")
         return
+    memory = st.session_state["conversation"]
+    memory.model = model
+
+    if st.sidebar.button("Clear conversation"):
+        # The old conversation stays saved under its session id; this one starts empty
+        memory.reset()
+        st.query_params.clear()
+        start_chat_session(history, memory)
 
-    # Content selection based on type
-    selected_page = None
-    selected_db = None
+    # Content selection based on type; selections are ids, so duplicate titles are fine
+    page_ids = []
+    db_ids = []
     
     if content_type in ["Pages", "Both"]:
         st.sidebar.header("📄 Notion Pages")
-        pages = st.session_state["pages"]
-        if not pages:
+        if not workspace['pages']:
             st.sidebar.warning("No accessible pages found.")
         else:
-            page_options = ["All Pages"] + [f"{page['title']} (Last edited: {page['last_edited_time'][:10]})" for page in pages]
-            selected_page = st.sidebar.selectbox("Select a Notion page", page_options, index=0)
+            page_ids = select_ids(workspace['index'], 'page', "Notion pages")
 
     if content_type in ["Databases", "Both"]:
         st.sidebar.header("🗃️ Notion Databases")
-        databases = st.session_state["databases"]
-        if not databases:
+        if not workspace['databases']:
             st.sidebar.warning("No accessible databases found.")
         else:
-            db_options = ["All Databases"] + [f"{db['title']} (Last edited: {db['last_edited_time'][:10]})" for db in databases]
-            selected_db = st.sidebar.selectbox("Select a Notion database", db_options, index=0)
+            db_ids = select_ids(workspace['index'], 'database', "Notion databases")
+
+    if st.sidebar.button("Refresh workspace"):
+        get_workspace_listing.clear()
+        st.rerun()
+
+    if use_snapshot_backend():
+        # Served from the local snapshot, so session startup never waits on the Notion API
+        st.sidebar.header("🛰️ Offline Mode")
+        st.sidebar.caption(describe_offline_mode())
+        if st.sidebar.button("Sync snapshot now"):
+            with st.spinner("Syncing snapshot from Notion..."):
+                sync_workspace(get_snapshot_store())
+            get_workspace_listing.clear()
+            st.rerun()
 
-    # Check if selections have changed
+    # Check if selections or the listed content versions have changed; unchanged pages come from the cache
     current_selections = {
         "content_type": content_type,
-        "selected_page": selected_page,
-        "selected_db": selected_db
+        "page_ids": tuple(page_ids),
+        "db_ids": tuple(db_ids),
+        "workspace": workspace['version']
     }
     
     if current_selections != st.session_state["last_selections"]:
         with st.spinner("📥 Loading content..."):
-            st.session_state["selected_content"] = load_content(
-                st.session_state["pages"],
-                st.session_state["databases"],
+            (st.session_state["selected_content"], st.session_state["documents"],
+             st.session_state["dedup_summary"]) = load_content(
+                workspace,
                 content_type,
-                selected_page,
-                selected_db
+                page_ids,
+                db_ids
             )
         st.session_state["last_selections"] = current_selections
 
+    # Show how much of the prompt budget the loaded content uses
+    st.sidebar.header("📏 Context Size")
+    st.sidebar.caption(describe_context_size(st.session_state["selected_content"]))
+    if st.session_state.get("dedup_summary"):
+        st.sidebar.caption(f"Deduplication: {st.session_state['dedup_summary']}")
+    cache_stats = get_content_cache().stats()
+    st.sidebar.caption(
+        f"Content cache: {cache_stats['entries']} items, {cache_stats['size_mb']}/{cache_stats['max_mb']} MB, "
+        f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+    )
+    if receiver is not None:
+        webhook_stats = receiver.describe()
+        st.sidebar.caption(
+            f"Webhooks: {webhook_stats['events']} events, {webhook_stats['coalesced']} coalesced, "
+            f"{webhook_stats['applied']} items refreshed, {webhook_stats['pending']} pending"
+        )
+
     # Chat interface
     st.subheader("🤖 Chat with Your Notion Content")
     st.markdown("Ask about to-do lists, definitions, database entries, or anything in your Notion content.")
 
     # Query input
     query = st.text_input("Your query", placeholder="Enter your question here...")
+    use_map_reduce = st.checkbox(
+        "Summarize across all selected content (map-reduce)",
+        help="Summarizes each page separately and combines the summaries. Page summaries are cached until the page is edited."
+    )
     if st.button("Send Query", key="send_query"):
         if query:
-            with st.spinner("Processing your query..."):
-                response = query_gemini(model, st.session_state["selected_content"], query)
-                st.session_state["chat_history"].append({"query": query, "response": response})
+            with st.spinner("Processing your query..."), query_trace() as trace:
+                documents = st.session_state["documents"]
+                if len(documents) > 1 and (use_map_reduce or is_workspace_query(query)):
+                    response = answer_with_map_reduce(model, documents, query)
+                    memory.add_turn(query, response)
+                else:
+                    response = query_gemini(model, st.session_state["selected_content"], query, memory=memory)
+            compression = pop_last_compression()
+            history.add_message(
+                st.session_state["session_id"], query, response, format_breakdown(trace),
+                describe_compression(compression) if compression else None
+            )
         else:
             st.warning("Please enter a query.")
+    st.sidebar.caption(f"Tokens used: {usage_totals['input_tokens']:,} in / {usage_totals['output_tokens']:,} out")
 
-    # Display chat history
-    if st.session_state["chat_history"]:
+    # Display the latest page of chat history; only the shown messages are read, however long the session
+    limit = st.session_state["history_limit"]
+    messages = history.latest(st.session_state["session_id"], limit + 1)
+    if messages:
         st.subheader("📜 Conversation History")
-        for i, chat in enumerate(reversed(st.session_state["chat_history"])):
+        for chat in messages[:limit]:
             with st.container():
-                st.markdown(f"<div class='chat-message'><b>You:</b> {chat['query']}</div>", unsafe_allow_html=True)
-                st.markdown(f"<div class='response-container'><b>Gemini:</b><br>{chat['response']}</div>", unsafe_allow_html=True)
+                # Stored text is never rendered as HTML: the query is escaped, the response is plain Markdown
+                st.markdown(f"<div class='chat-message'><b>You:</b> {html.escape(chat['query'])}</div>", unsafe_allow_html=True)
+                st.markdown("<div class='response-container'><b>Gemini:</b></div>", unsafe_allow_html=True)
+                st.markdown(chat['response'])
+                if chat.get('timing'):
+                    st.caption(f"⏱️ {chat['timing']}")
+                if chat.get('compression'):
+                    st.caption(f"Context: {chat['compression']}")
+        if len(messages) > limit:
+            total = history.count(st.session_state["session_id"])
+            if st.button(f"Load more ({total - limit} older)", key="load_more_history"):
+                st.session_state["history_limit"] = limit + HISTORY_PAGE_SIZE
+                st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
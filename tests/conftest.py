@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Run everything against the offline backends
+os.environ.setdefault('NOTION_BACKEND', 'mock')
+os.environ.setdefault('GEMINI_BACKEND', 'mock')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
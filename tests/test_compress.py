@@ -0,0 +1,63 @@
+import notion_compress
+from notion_compress import GAP_MARKER, compress_context, pop_last_compression, prepare_context, strip_boilerplate
+from notion_databases import format_database_content
+from notion_tokens import SECTION_SEPARATOR, estimate_tokens, split_sections
+
+def page(title, body):
+    return f"{SECTION_SEPARATOR}PAGE: {title}{SECTION_SEPARATOR}{body}\n\n"
+
+DATABASE = format_database_content({
+    'title': 'Tasks',
+    'properties': {'Name': 'title', 'Due': 'date', 'Tags': 'multi_select'},
+    'entries': [
+        {'Name': 'Write launch post', 'Due': 'N/A', 'Tags': []},
+        {'Name': 'Book venue', 'Due': '2024-03-01', 'Tags': ['events']}
+    ]
+})
+
+def test_label_lines_in_pages_are_kept():
+    body = "Action items for Friday:\n- send the deck\nRisks:\n- vendor delay\n" + "-" * 20
+    stripped, removed = strip_boilerplate(body)
+    assert stripped.split("\n") == ["Action items for Friday:", "- send the deck", "Risks:", "- vendor delay"]
+    assert removed == 1
+
+def test_page_under_budget_keeps_label_lines():
+    content = page("Weekly sync", "Action items for Friday:\n- send the deck\nRisks:\n- vendor delay")
+    compressed, stats = compress_context(content, "what are the risks?", 16000)
+    assert "Action items for Friday:" in compressed
+    assert "Risks:" in compressed
+    assert stats['boilerplate_lines'] == 0
+
+def test_empty_database_cells_are_stripped():
+    compressed, stats = compress_context(DATABASE, "venue", 16000)
+    assert "Due: N/A" not in compressed
+    assert "Tags: \n" not in compressed
+    assert "Properties:" in compressed and "Entries:" in compressed
+    assert "Due: 2024-03-01" in compressed
+    assert stats['boilerplate_lines'] > 0
+
+def test_compression_keeps_relevant_lines_with_their_titles():
+    filler = "\n".join(f"Notes on topic {i} that nobody asked about." for i in range(200))
+    content = (
+        page("Archive", filler)
+        + page("Launch plan", filler + "\nThe launch date moved to March 14.")
+    )
+    compressed, stats = compress_context(content, "When is the launch date?", 200)
+    assert estimate_tokens(compressed) <= 200
+    assert stats['units_kept'] < stats['units_total']
+    sections = dict(split_sections(compressed.split("\n\n[")[0]))
+    assert "The launch date moved to March 14." in sections["PAGE: Launch plan"]
+    assert GAP_MARKER in sections["PAGE: Launch plan"]
+
+def test_zero_target_only_strips_boilerplate(monkeypatch):
+    monkeypatch.setattr(notion_compress, 'TARGET_CONTEXT_TOKENS', 0)
+    monkeypatch.setenv('NOTION_DEDUPE', '0')
+    body = "\n".join(f"Budget line {i} for the spring offsite" for i in range(200))
+    content = page("Offsite", body + "\n" + "-" * 20) + page("Hiring", "Open roles for the data team")
+    assert estimate_tokens(content) > 800
+    prepared = prepare_context(content, "offsite budget", 800)
+    stats = pop_last_compression()
+    # Nothing is scored or cut span by span; only fitting to the budget trims whole sections
+    assert stats['units_total'] == 0 and stats['boilerplate_lines'] == 1
+    assert GAP_MARKER not in prepared
+    assert estimate_tokens(prepared) <= 800
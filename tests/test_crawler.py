@@ -0,0 +1,72 @@
+import threading
+from notion_crawler import Crawler, find_child_items
+
+def edited(day):
+    return f"2024-01-{day:02d}T00:00:00.000Z"
+
+def graph_fetch(graph, visited):
+    """fetch() over a {id: [child ids]} graph, recording the visit order"""
+    lock = threading.Lock()
+
+    def fetch(kind, item_id, last_edited):
+        with lock:
+            visited.append(item_id)
+        return [('page', child, edited(1)) for child in graph.get(item_id, [])]
+    return fetch
+
+def test_cycles_are_visited_once():
+    visited = []
+    crawler = Crawler(graph_fetch({'a': ['b'], 'b': ['a', 'c'], 'c': ['a']}, visited), workers=3)
+    crawler.add('page', 'a', edited(1))
+    stats = crawler.run()
+    assert sorted(visited) == ['a', 'b', 'c']
+    assert stats['visited'] == 3 and stats['duplicates'] == 2
+
+def test_ids_with_and_without_dashes_are_the_same_item():
+    crawler = Crawler(lambda *args: [])
+    assert crawler.add('page', 'abcd-ef')
+    assert not crawler.add('page', 'abcdef')
+
+def test_depth_and_size_limits():
+    chain = {'a': ['b'], 'b': ['c'], 'c': ['d']}
+    visited = []
+    crawler = Crawler(graph_fetch(chain, visited), max_depth=2, workers=2)
+    crawler.add('page', 'a')
+    result = crawler.run()
+    assert sorted(visited) == ['a', 'b', 'c'] and result['depth_limited'] == 1
+
+    visited = []
+    crawler = Crawler(graph_fetch({}, visited), max_items=2, workers=2)
+    for item_id in 'abcd':
+        crawler.add('page', item_id, edited(1))
+    result = crawler.run()
+    assert len(visited) == 2 and result['size_limited'] == 2
+
+def test_most_recently_edited_first():
+    visited = []
+    crawler = Crawler(graph_fetch({}, visited), workers=1)
+    crawler.add('page', 'old', edited(1))
+    crawler.add('page', 'unknown', None)
+    crawler.add('page', 'new', edited(20))
+    crawler.add('database', 'middle', edited(10))
+    crawler.run()
+    assert visited == ['new', 'middle', 'old', 'unknown']
+
+def test_failing_fetches_are_counted_and_the_crawl_ends():
+    def fetch(kind, item_id, last_edited):
+        if item_id == 'b':
+            raise RuntimeError("boom")
+        return [('page', 'b', None), ('page', 'c', None)] if item_id == 'a' else []
+
+    crawler = Crawler(fetch, workers=4)
+    crawler.add('page', 'a')
+    stats = crawler.run()
+    assert stats['visited'] == 3 and stats['errors'] == 1
+
+def test_find_child_items():
+    blocks = [
+        {'type': 'paragraph', 'id': 'x'},
+        {'type': 'child_page', 'id': 'p', 'last_edited_time': edited(2)},
+        {'type': 'child_database', 'id': 'd'},
+    ]
+    assert find_child_items(blocks) == [('page', 'p', edited(2)), ('database', 'd', None)]
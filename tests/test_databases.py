@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+from notion_databases import NEWEST_ROW_SORT, database_version
+
+def client_with_rows(*edited):
+    def query(database_id, sorts=None, page_size=None):
+        assert sorts == NEWEST_ROW_SORT and page_size == 1
+        rows = sorted(({'last_edited_time': time} for time in edited), key=lambda row: row['last_edited_time'], reverse=True)
+        return {'results': rows[:page_size]}
+    return SimpleNamespace(databases=SimpleNamespace(query=query))
+
+def test_version_follows_the_newest_row_edit():
+    client = client_with_rows('2024-01-02T00:00:00.000Z', '2024-03-01T00:00:00.000Z')
+    assert database_version('db-1', '2024-01-01T00:00:00.000Z', client) == '2024-03-01T00:00:00.000Z'
+
+def test_version_keeps_a_newer_database_edit():
+    client = client_with_rows('2024-01-02T00:00:00.000Z')
+    assert database_version('db-1', '2024-05-01T00:00:00.000Z', client) == '2024-05-01T00:00:00.000Z'
+    assert database_version('db-1', '2024-05-01T00:00:00.000Z', client_with_rows()) == '2024-05-01T00:00:00.000Z'
+
+def test_version_falls_back_when_the_query_fails():
+    def query(**kwargs):
+        raise RuntimeError("boom")
+    client = SimpleNamespace(databases=SimpleNamespace(query=query))
+    assert database_version('db-1', '2024-05-01T00:00:00.000Z', client) == '2024-05-01T00:00:00.000Z'
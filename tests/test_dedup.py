@@ -0,0 +1,64 @@
+from notion_compress import prepare_context
+from notion_dedup import combine_documents, dedupe_context
+from notion_tokens import SECTION_SEPARATOR
+
+TEMPLATE = ("Every project follows the same review process: the owner writes a short proposal, "
+            "two reviewers sign off within a week, and the decision is recorded in the project log.")
+
+def document(title, content):
+    return {'id': title, 'title': title, 'content': content, 'kind': 'page'}
+
+def test_repeated_lines_across_pages_point_at_first_copy():
+    content, index = combine_documents([
+        document("Alpha", f"Alpha goals\n{TEMPLATE}\nAlpha ships in May"),
+        document("Beta", f"Beta goals\n{TEMPLATE}\nBeta ships in June"),
+    ])
+    assert index.stats()['duplicate_chunks'] == 1
+
+    deduped, index = dedupe_context(content)
+    assert deduped.count(TEMPLATE) == 1
+    assert f'{TEMPLATE}\n[Also in: "Beta"]' in deduped
+    assert '[Repeated passage, see "Alpha"]' in deduped
+    assert "Beta ships in June" in deduped
+    assert index.saved_tokens > 0
+
+def test_copies_within_a_page_refer_above():
+    content, _ = combine_documents([
+        document("Alpha", f"{TEMPLATE}\nmiddle\n{TEMPLATE.upper()}"),
+        document("Beta", "unrelated"),
+    ])
+    deduped, _ = dedupe_context(content)
+    assert deduped.count(TEMPLATE) == 1
+    assert "[Repeated passage, above]" in deduped
+    assert "Also in" not in deduped
+
+def test_first_copy_lists_every_other_page():
+    content, _ = combine_documents([document(f"Page {i}", TEMPLATE) for i in range(6)])
+    deduped, _ = dedupe_context(content)
+    assert '[Also in: "Page 1", "Page 2", "Page 3" and 2 more]' in deduped
+    assert deduped.count('[Repeated passage, see "Page 0"]') == 5
+
+def test_short_repeats_are_kept():
+    content, _ = combine_documents([document("Alpha", "Notes\nTODO"), document("Beta", "Notes\nTODO")])
+    deduped, index = dedupe_context(content)
+    assert deduped == content
+    assert index.saved_tokens == 0
+
+def test_references_survive_trimming(monkeypatch):
+    monkeypatch.delenv('NOTION_DEDUPE', raising=False)
+    filler = "\n".join(f"Alpha detail {i} about budgets and staffing plans" for i in range(300))
+    content, _ = combine_documents([
+        document("Alpha", f"{filler}\n{TEMPLATE}"),
+        document("Beta", f"Beta launch checklist\n{TEMPLATE}"),
+    ])
+    prepared = prepare_context(content, "beta launch checklist", 400)
+    # Alpha's copy is trimmed away, so Beta's copy is the one that stays
+    assert prepared.count(TEMPLATE) == 1
+    assert "Repeated passage" not in prepared
+
+def test_dedupe_can_be_disabled(monkeypatch):
+    monkeypatch.setenv('NOTION_DEDUPE', '0')
+    content, _ = combine_documents([document("Alpha", TEMPLATE), document("Beta", TEMPLATE)])
+    prepared = prepare_context(content, "review process", 16000)
+    assert prepared.count(TEMPLATE) == 2
+    assert SECTION_SEPARATOR in prepared
@@ -0,0 +1,54 @@
+import pytest
+from notion_history import ChatHistory, response_id
+
+@pytest.fixture
+def history(tmp_path):
+    history = ChatHistory(str(tmp_path / 'history.sqlite3'))
+    yield history
+    history.close()
+
+def test_latest_pages_backwards_with_before_id(history):
+    session_id = history.create_session()
+    ids = [history.add_message(session_id, f"question {i}", f"answer {i}") for i in range(25)]
+
+    first = history.latest(session_id, limit=10)
+    assert [message['id'] for message in first] == ids[::-1][:10]
+    second = history.latest(session_id, limit=10, before_id=first[-1]['id'])
+    assert [message['id'] for message in second] == ids[::-1][10:20]
+    last = history.latest(session_id, limit=10, before_id=second[-1]['id'])
+    assert [message['query'] for message in last] == [f"question {i}" for i in range(4, -1, -1)]
+    assert history.latest(session_id, limit=10, before_id=ids[0]) == []
+
+def test_sessions_are_kept_apart(history):
+    first = history.create_session()
+    second = history.create_session()
+    history.add_message(first, "only in first", "answer")
+    assert history.has_session(first) and not history.has_session('missing')
+    assert history.latest(second) == []
+    assert history.count(first) == 1 and history.count(second) == 0
+
+def test_identical_responses_are_stored_once(history):
+    first = history.create_session()
+    second = history.create_session()
+    history.add_message(first, "what is due?", "Nothing is due.")
+    history.add_message(first, "anything due today?", "Nothing is due.")
+    history.add_message(second, "what is due?", "Nothing is due.")
+    history.add_message(second, "and tomorrow?", "The launch post.")
+    assert history.stats() == {'sessions': 2, 'messages': 4, 'responses': 2}
+    assert history.latest(second)[1]['response'] == "Nothing is due."
+    assert response_id("Nothing is due.") == response_id("Nothing is due.") != response_id("The launch post.")
+
+def test_message_counter_and_reopening(tmp_path):
+    path = str(tmp_path / 'history.sqlite3')
+    history = ChatHistory(path)
+    session_id = history.create_session()
+    for i in range(3):
+        history.add_message(session_id, f"q{i}", f"a{i}", timing="1 ms", compression="none")
+    assert history.count(session_id) == 3
+    assert history.count('missing') == 0
+    history.close()
+
+    reopened = ChatHistory(path)
+    assert reopened.count(session_id) == 3
+    assert reopened.latest(session_id, limit=1)[0]['timing'] == "1 ms"
+    reopened.close()
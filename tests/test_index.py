@@ -0,0 +1,72 @@
+import threading
+from notion_index import WorkspaceIndex
+
+def listing(item_id, title, edited, parent_id=None):
+    return {'id': item_id, 'title': title, 'last_edited_time': edited, 'parent_id': parent_id}
+
+PAGES = [
+    listing('p1', 'Launch plan', '2024-03-01', 'root'),
+    listing('p2', 'Launch retro', '2024-03-05', 'root'),
+    listing('p3', 'Groceries', '2024-01-10'),
+]
+DATABASES = [listing('d1', 'Tasks', '2024-02-01', 'p1')]
+
+def test_lookup_search_and_recency():
+    index = WorkspaceIndex(PAGES, DATABASES)
+    assert len(index) == 4 and 'd1' in index
+    assert index.get('p3')['kind'] == 'page'
+    assert [item['id'] for item in index.recent()] == ['p2', 'p1', 'd1', 'p3']
+    assert [item['id'] for item in index.recent('database')] == ['d1']
+    assert [item['id'] for item in index.prefix_search('launch')] == ['p1', 'p2']
+    assert [item['id'] for item in index.search('retro')] == ['p2']
+    assert [item['id'] for item in index.search('grocerys')] == ['p3']
+    assert [item['id'] for item in index.children('root')] == ['p2', 'p1']
+
+def test_add_replaces_and_remove_drops():
+    index = WorkspaceIndex(PAGES, DATABASES)
+    index.add([listing('p3', 'Shopping list', '2024-04-01')])
+    index.add([listing('p4', 'Launch budget', '2024-02-15', 'root')])
+    assert index.get('p3')['title'] == 'Shopping list'
+    assert index.search('groceries') == []
+    assert [item['id'] for item in index.recent()][:2] == ['p3', 'p2']
+    assert [item['id'] for item in index.prefix_search('launch')] == ['p4', 'p1', 'p2']
+
+    index.remove('p1')
+    index.remove('missing')
+    assert 'p1' not in index
+    assert [item['id'] for item in index.prefix_search('launch')] == ['p4', 'p2']
+    assert [item['id'] for item in index.children('root')] == ['p2', 'p4']
+
+def test_incremental_changes_match_a_full_build():
+    index = WorkspaceIndex(PAGES, DATABASES)
+    index.add([listing('p2', 'Retro notes', '2024-03-06', 'p1')])
+    index.remove('d1')
+    views = (index.by_recency, index.titles, index.trigram_index, index.children_index)
+    index.rebuild()
+    assert views == (index.by_recency, index.titles, index.trigram_index, index.children_index)
+
+def test_readers_run_safely_while_writers_update():
+    index = WorkspaceIndex([listing(f"p{i}", f"Page {i}", f"2024-01-{i % 28 + 1:02d}") for i in range(500)])
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                for item in index.search('page 1', limit=20) + index.recent(limit=20):
+                    assert item['id']
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(300):
+        index.add([listing(f"n{i}", f"New page {i}", '2024-05-01')])
+        index.remove(f"p{i}")
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
+    assert len(index) == 500
@@ -0,0 +1,31 @@
+import notion_metrics
+from notion_metrics import format_breakdown, increment, observe, query_trace, record_span, render_prometheus
+
+def test_render_prometheus_counters_and_histograms():
+    increment('test_requests_total', endpoint='pages')
+    increment('test_requests_total', 2, endpoint='pages')
+    observe('test_latency_seconds', 0.02, buckets=[0.01, 0.1], endpoint='pages')
+    rendered = render_prometheus()
+    assert "# TYPE test_requests_total counter" in rendered
+    assert 'test_requests_total{endpoint="pages"} 3' in rendered
+    assert "# TYPE test_latency_seconds histogram" in rendered
+    assert 'test_latency_seconds_bucket{endpoint="pages",le="0.01"} 0' in rendered
+    assert 'test_latency_seconds_bucket{endpoint="pages",le="0.1"} 1' in rendered
+    assert 'test_latency_seconds_bucket{endpoint="pages",le="+Inf"} 1' in rendered
+    assert 'test_latency_seconds_count{endpoint="pages"} 1' in rendered
+
+def test_render_prometheus_with_mixed_label_value_types():
+    increment('test_errors_total', status=429)
+    increment('test_errors_total', status='error')
+    increment('test_errors_total', status='429')
+    rendered = render_prometheus()
+    assert 'test_errors_total{status="429"} 2' in rendered
+    assert 'test_errors_total{status="error"} 1' in rendered
+
+def test_query_trace_collects_spans_of_this_thread():
+    with query_trace() as collector:
+        record_span('fetch', 0.1)
+        record_span('fetch', 0.2)
+    assert [name for name, _ in collector] == ['fetch', 'fetch', 'total']
+    assert "fetch 300 ms ×2" in format_breakdown(collector)
+    assert getattr(notion_metrics.thread_state, 'collector', None) is None
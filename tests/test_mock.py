@@ -0,0 +1,27 @@
+import notion_config
+from notion_mock import FakeNotionClient, SyntheticWorkspace
+
+def walk(workspace, block_id):
+    blocks = workspace.children(block_id)
+    result = list(blocks)
+    for block in blocks:
+        if block['has_children'] and block['type'] != 'child_page':
+            result += walk(workspace, block['id'])
+    return result
+
+def test_block_trees_are_regenerated_from_ids():
+    workspace = SyntheticWorkspace(pages=3, blocks_per_page=40, depth=3, seed=7)
+    page_id = next(iter(workspace.pages))
+    first = walk(workspace, page_id)
+    assert len({block['id'] for block in first}) == len(first)
+    assert any(workspace.block_depth(block['id']) > 1 for block in first)
+    # Nothing is stored per generated block, so a second walk gives the same tree
+    assert walk(SyntheticWorkspace(pages=3, blocks_per_page=40, depth=3, seed=7), page_id) == first
+    assert workspace.children(next(iter(workspace.databases))) == []
+
+def test_shared_client_retries_rate_limited_calls():
+    fake = FakeNotionClient(SyntheticWorkspace(pages=15), requests_per_second=10)
+    client = notion_config.wrap_notion_client(fake)
+    pages = [client.pages.retrieve(page_id) for page_id in fake.workspace.pages]
+    assert len(pages) == 15
+    assert fake.transport.rate_limited_count >= 1
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from notion_scheduler import GenerationScheduler
+
+def test_scheduler_needs_a_worker():
+    with pytest.raises(ValueError, match="at least 1"):
+        GenerationScheduler(max_concurrency=0)
+    with pytest.raises(ValueError, match="greater than 0"):
+        GenerationScheduler(requests_per_minute=0)
+
+def test_zero_concurrency_fails_at_import(monkeypatch):
+    monkeypatch.setenv('GEMINI_MAX_CONCURRENT_REQUESTS', '0')
+    result = subprocess.run([sys.executable, '-c', 'import notion_scheduler'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode != 0
+    assert "GEMINI_MAX_CONCURRENT_REQUESTS must be at least 1" in result.stderr
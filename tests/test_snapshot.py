@@ -0,0 +1,119 @@
+import multiprocessing
+from types import SimpleNamespace
+import notion_snapshot
+from notion_snapshot import SnapshotStore, sync_from_client
+
+def page(i):
+    return {'object': 'page', 'id': f"page-{i}", 'properties': {'title': f"Page {i}"}, 'body': 'x' * (i % 7)}
+
+def test_round_trip_and_reopen(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot'))
+    for i in range(50):
+        store.put(f"page:{i}", page(i), last_edited=f"2024-01-{i % 28 + 1:02d}")
+    store.put('page:3', {'replaced': True})
+    store.delete('page:4')
+    assert store.get('page:7') == page(7)
+    assert store.get('page:3') == {'replaced': True}
+    assert store.get('page:4') is None
+    assert store.last_edited('page:7') == '2024-01-08'
+    store.close()
+
+    reopened = SnapshotStore(str(tmp_path / 'snapshot'))
+    assert len(reopened.keys('page:')) == 49
+    assert reopened.get('page:7') == page(7)
+    assert reopened.get('page:3') == {'replaced': True}
+    reopened.close()
+
+def test_store_works_without_file_locks(tmp_path, monkeypatch):
+    # Platforms with neither fcntl nor msvcrt only lock between threads
+    monkeypatch.setattr(notion_snapshot, 'fcntl', None)
+    monkeypatch.setattr(notion_snapshot, 'msvcrt', None, raising=False)
+    store = SnapshotStore(str(tmp_path / 'snapshot'))
+    store.put('page:1', page(1))
+    assert store.get('page:1') == page(1)
+    store.close()
+
+def test_identical_values_are_stored_once(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot'))
+    store.put('blocks:a', [])
+    store.put('blocks:b', [])
+    assert store.index['blocks:a']['offset'] == store.index['blocks:b']['offset']
+    assert store.stats()['records'] == 2
+    store.close()
+
+def test_segments_roll_over(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot'), segment_max_bytes=200)
+    for i in range(30):
+        store.put(f"page:{i}", {'text': f"unique text number {i} " * 5})
+    assert store.stats()['segments'] > 1
+    assert all(store.get(f"page:{i}") == {'text': f"unique text number {i} " * 5} for i in range(30))
+    store.close()
+
+def test_compaction_keeps_live_records_for_every_open_store(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    store = SnapshotStore(path)
+    other = SnapshotStore(path)
+    for i in range(20):
+        store.put(f"page:{i}", page(i))
+        store.put(f"page:{i}", page(i + 100))
+    assert other.get('page:5') == page(105)
+    store.compact()
+    assert store.stats()['live_mb'] == store.stats()['disk_mb']
+    # The second store notices the compaction and reopens instead of reading the old segments
+    assert other.get('page:5') == page(105)
+    other.put('page:new', page(1000))
+    assert store.get('page:new') == page(1000)
+    store.close()
+    other.close()
+
+def write_pages(path, worker, count):
+    store = SnapshotStore(path, segment_max_bytes=4096)
+    for i in range(count):
+        store.put(f"page:{worker}:{i}", {'worker': worker, 'i': i, 'text': f"{worker}-{i} " * 20})
+    store.close()
+
+def test_concurrent_writers_from_several_processes(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    context = multiprocessing.get_context('fork')
+    writers = [context.Process(target=write_pages, args=(path, worker, 100)) for worker in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert all(writer.exitcode == 0 for writer in writers)
+
+    store = SnapshotStore(path)
+    assert len(store.keys('page:')) == 400
+    for worker in range(4):
+        for i in range(100):
+            assert store.get(f"page:{worker}:{i}") == {'worker': worker, 'i': i, 'text': f"{worker}-{i} " * 20}
+    store.close()
+
+class RowsClient:
+    """Notion client stand-in with one database whose rows can be edited"""
+
+    def __init__(self):
+        self.database = {'object': 'database', 'id': 'db-1', 'last_edited_time': '2024-01-01T00:00:00.000Z',
+                         'title': [{'plain_text': 'Tasks'}], 'properties': {}}
+        self.rows = [{'object': 'page', 'id': 'row-1', 'last_edited_time': '2024-01-02T00:00:00.000Z', 'properties': {}}]
+        self.databases = SimpleNamespace(retrieve=lambda database_id: self.database, query=self.query)
+
+    def search(self, filter=None, **kwargs):
+        results = [self.database] if filter['value'] == 'database' else []
+        return {'results': results, 'has_more': False, 'next_cursor': None}
+
+    def query(self, database_id, sorts=None, **kwargs):
+        rows = sorted(self.rows, key=lambda row: row['last_edited_time'], reverse=True) if sorts else self.rows
+        return {'results': rows, 'has_more': False, 'next_cursor': None}
+
+def test_sync_refetches_databases_whose_rows_changed(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot'))
+    client = RowsClient()
+    assert sync_from_client(store, client, False, 2, 2, 0)['databases_fetched'] == 1
+    assert sync_from_client(store, client, False, 2, 2, 0)['databases_fetched'] == 0
+
+    # Notion leaves the database's own last_edited_time alone when a row changes
+    client.rows.append({'object': 'page', 'id': 'row-2', 'last_edited_time': '2024-02-01T00:00:00.000Z', 'properties': {}})
+    assert sync_from_client(store, client, False, 2, 2, 0)['databases_fetched'] == 1
+    assert [row['id'] for row in store.get('rows:db-1')] == ['row-1', 'row-2']
+    store.close()
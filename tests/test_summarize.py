@@ -0,0 +1,29 @@
+import notion_scheduler
+import notion_summarize
+import notion_tokens
+from notion_metrics import query_trace
+from notion_mock import FakeGenerativeModel
+from notion_summarize import answer_with_map_reduce
+from notion_tokens import track_usage
+
+def test_map_reduce_usage_and_spans_count_toward_the_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(notion_summarize, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(notion_summarize, 'SUMMARY_CACHE_FILE', str(tmp_path / 'summaries.json'))
+    # Small batches so the reduce step runs on the pool too
+    monkeypatch.setattr(notion_summarize, 'REDUCE_BATCH_TOKENS', 300)
+    monkeypatch.setattr(notion_scheduler, 'scheduler', notion_scheduler.GenerationScheduler(requests_per_minute=60000))
+    documents = [
+        {'id': f"page-{i}", 'title': f"Page {i}", 'content': f"Notes for page {i}.", 'last_edited': '2024-01-01'}
+        for i in range(12)
+    ]
+    before = dict(notion_tokens.usage_totals)
+
+    with query_trace() as trace, track_usage() as usage:
+        answer = answer_with_map_reduce(FakeGenerativeModel(), documents, "Summarize everything", max_workers=4)
+
+    assert answer.startswith("Mock answer")
+    requests = notion_tokens.usage_totals['requests'] - before['requests']
+    assert requests > len(documents) + 1
+    assert usage['requests'] == requests
+    assert usage['input_tokens'] == notion_tokens.usage_totals['input_tokens'] - before['input_tokens']
+    assert sum(name == 'gemini.generate' for name, _ in trace) == requests
@@ -0,0 +1,45 @@
+from notion_tokens import (
+    SECTION_SEPARATOR, estimate_tokens, fit_content_to_budget, join_sections, split_sections, truncate_to_tokens
+)
+
+def page(title, body):
+    return f"{SECTION_SEPARATOR}PAGE: {title}{SECTION_SEPARATOR}{body}\n\n"
+
+def test_estimate_tokens_counts_words_and_merges_dividers():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("three short words") == 3
+    assert estimate_tokens("=" * 80) < 15
+
+def test_truncate_to_tokens_cuts_at_line_boundary():
+    text = "\n".join(f"line number {i}" for i in range(100))
+    truncated = truncate_to_tokens(text, 40)
+    assert truncated.endswith("[... truncated to fit the prompt budget]")
+    assert all(line.startswith("line number") for line in truncated.split("\n")[:-1])
+
+def test_split_sections_pairs_headers_with_bodies():
+    content = page("Roadmap", "Ship the beta") + page("Empty", "")
+    assert split_sections(content) == [("PAGE: Roadmap", "Ship the beta\n\n"), ("PAGE: Empty", "")]
+
+def test_split_and_join_round_trip():
+    sections = [("PAGE: One", "first body"), ("Database: Tasks", "Name: a\nDue: b")]
+    assert split_sections(join_sections(sections)) == [(header, body + "\n") for header, body in sections]
+
+def test_content_within_budget_is_unchanged():
+    content = page("Roadmap", "Ship the beta")
+    assert fit_content_to_budget(content, "beta", 1000) is content
+
+def test_fit_keeps_each_header_with_its_body():
+    filler = "\n".join("unrelated filler sentence about nothing much" for _ in range(40))
+    content = (
+        page("Groceries", filler)
+        + page("Launch plan", "The launch moves to March.\n" + filler)
+        + page("Recipes", filler)
+    )
+    fitted = fit_content_to_budget(content, "When is the launch?", 300)
+    assert estimate_tokens(fitted) <= 300
+    sections = split_sections(fitted.split("\n\n[")[0])
+    assert sections[0][0] == "PAGE: Launch plan"
+    assert "The launch moves to March." in sections[0][1]
+    # No header survives without the body it introduces
+    assert all(body.strip() for _, body in sections)
+    assert "less relevant section(s) omitted" in fitted
@@ -0,0 +1,66 @@
+import json
+import os
+import stat
+import notion_webhooks
+from notion_webhooks import EventCoalescer, WebhookReceiver, parse_event, sign, verify_signature
+
+SECRET = 'secret_test'
+
+def page_event(page_id='page-1', event_type='page.content_updated', parent=None):
+    event = {'type': event_type, 'entity': {'id': page_id, 'type': 'page'}}
+    if parent:
+        event['data'] = {'parent': {'id': parent, 'type': 'database'}}
+    return json.dumps(event).encode('utf-8')
+
+def test_verify_signature():
+    body = page_event()
+    assert verify_signature(body, sign(body, SECRET), SECRET)
+    assert not verify_signature(body, sign(body, 'other secret'), SECRET)
+    assert not verify_signature(body + b' ', sign(body, SECRET), SECRET)
+    assert not verify_signature(body, None, SECRET)
+
+def test_receiver_rejects_bad_signatures():
+    receiver = WebhookReceiver(client=object(), secret=SECRET)
+    body = page_event()
+    assert receiver.handle(body, sign(body, SECRET)) == (200, {'queued': 1})
+    assert receiver.handle(body, 'sha256=' + '0' * 64)[0] == 401
+    assert receiver.handle(body)[0] == 401
+    assert receiver.stats['rejected'] == 2
+    assert receiver.handle(b'not json', None)[0] == 400
+
+def test_verification_token_is_saved_privately_not_printed(tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'token'
+    monkeypatch.setattr(notion_webhooks, 'TOKEN_FILE', str(path))
+    receiver = WebhookReceiver(client=object(), secret=None)
+    assert receiver.handle(json.dumps({'verification_token': 'secret_abc'}).encode('utf-8'))[0] == 200
+    assert path.read_text().strip() == 'secret_abc'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert 'secret_abc' not in capsys.readouterr().out
+
+def test_verification_token_is_refused_once_a_secret_is_set(tmp_path, monkeypatch):
+    path = tmp_path / 'token'
+    path.write_text('secret_real\n')
+    monkeypatch.setattr(notion_webhooks, 'TOKEN_FILE', str(path))
+    receiver = WebhookReceiver(client=object(), secret='secret_real')
+    body = json.dumps({'verification_token': 'attacker'}).encode('utf-8')
+    assert receiver.handle(body)[0] == 401
+    assert receiver.handle(body, sign(body, 'secret_real'))[0] == 401
+    assert path.read_text().strip() == 'secret_real'
+    assert receiver.stats['rejected'] == 2
+
+def test_parse_event():
+    assert parse_event(json.loads(page_event(parent='db-1'))) == [
+        {'kind': 'page', 'id': 'page-1', 'action': 'refresh'},
+        {'kind': 'database', 'id': 'db-1', 'action': 'refresh'}
+    ]
+    assert parse_event(json.loads(page_event(event_type='page.deleted')))[0]['action'] == 'delete'
+    assert parse_event(json.loads(page_event(event_type='page.locked'))) == []
+
+def test_coalescer_waits_for_quiet_items():
+    coalescer = EventCoalescer(debounce_seconds=2, max_delay_seconds=30)
+    for now in (100, 101, 102):
+        coalescer.add({'kind': 'page', 'id': 'page-1', 'action': 'refresh'}, now=now)
+    assert coalescer.due(now=103) == []
+    changes = coalescer.due(now=104)
+    assert len(changes) == 1 and changes[0]['events'] == 3
+    assert coalescer.stats['coalesced'] == 2
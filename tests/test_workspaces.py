@@ -0,0 +1,46 @@
+import pytest
+import notion_workspaces
+from notion_config import get_workspace_tokens
+from notion_workspaces import list_shard_items, load_shard_documents, sync_workspaces, workspace_names
+
+def test_named_bare_and_spaced_tokens(monkeypatch):
+    monkeypatch.setenv('NOTION_TOKENS', ' work = secret_a ,secret_b,, home=secret_c ')
+    assert get_workspace_tokens() == {'work': 'secret_a', 'workspace-2': 'secret_b', 'home': 'secret_c'}
+
+def test_single_token_fallback(monkeypatch):
+    monkeypatch.delenv('NOTION_TOKENS', raising=False)
+    monkeypatch.setenv('NOTION_TOKEN', 'secret_only')
+    assert get_workspace_tokens() == {'default': 'secret_only'}
+    monkeypatch.delenv('NOTION_TOKEN')
+    assert get_workspace_tokens() == {}
+
+def test_workspace_names(monkeypatch):
+    monkeypatch.setenv('NOTION_TOKENS', 'work=secret_a,home=secret_b')
+    assert workspace_names() == ['work', 'home']
+    assert workspace_names(['all']) == ['work', 'home']
+    assert workspace_names(['home']) == ['home']
+    with pytest.raises(ValueError, match="Unknown workspace"):
+        workspace_names(['play'])
+
+def test_shards_merge_newest_first_with_labels(tmp_path, monkeypatch):
+    monkeypatch.setenv('NOTION_TOKENS', 'work=secret_a,home=secret_b')
+    monkeypatch.setattr(notion_workspaces, 'SHARDS_DIR', str(tmp_path))
+    monkeypatch.setattr(notion_workspaces, 'shard_stores', {})
+    results = sync_workspaces(['work', 'home'], workers=2)
+    assert all('error' not in summary for summary in results.values())
+
+    items = list_shard_items(['work', 'home'])
+    pages = [item for item in items if item['kind'] == 'page']
+    databases = [item for item in items if item['kind'] == 'database']
+    assert items == pages + databases
+    assert {item['workspace'] for item in pages} == {'work', 'home'}
+    edited = [item['last_edited_time'] for item in pages]
+    assert edited == sorted(edited, reverse=True)
+
+    documents = load_shard_documents(pages[:4] + databases[:1], workers=2)
+    assert len(documents) == 5
+    assert all(document['title'].endswith(f"[{document['workspace']}]") for document in documents)
+    single = load_shard_documents([item for item in pages if item['workspace'] == 'home'][:1])
+    assert not single[0]['title'].endswith("[home]")
+    for store in notion_workspaces.shard_stores.values():
+        store.close()